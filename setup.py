@@ -186,6 +186,11 @@ if __name__ == "__main__":
         python_requires=">=3.7",
         install_requires=REQUIRES,
         extras_require=EXTRA_REQUIRE,
+        entry_points={
+            "console_scripts": [
+                "windtalker = windtalker.cli:main",
+            ],
+        },
     )
 
 """
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from windtalker import aio
+from windtalker.symmetric import SymmetricCipher
+from windtalker.exc import FileFormatError
+from windtalker.tests.helper import p_original, get_output_paths
+
+cipher = SymmetricCipher(password="MyPassword")
+
+
+class BytesWriter:
+    """
+    Minimal ``asyncio.StreamWriter`` like object.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data: bytes):
+        self.buffer += data
+
+    async def drain(self):
+        pass
+
+
+def make_reader(data: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+def test_async_text_and_file(tmp_path):
+    p_encrypted, p_decrypted = get_output_paths(tmp_path)
+
+    async def main():
+        runner = aio.AsyncRunner(
+            executor=ThreadPoolExecutor(2),
+            max_concurrency=2,
+        )
+        texts = [f"message {i}" for i in range(20)]
+        tokens = await asyncio.gather(
+            *[cipher.aencrypt_text(text, runner=runner) for text in texts]
+        )
+        results = await asyncio.gather(
+            *[cipher.adecrypt_text(token) for token in tokens]
+        )
+        assert results == texts
+
+        token = await cipher.aencrypt_binary(b"hello", runner=runner)
+        assert await cipher.adecrypt_binary(token) == b"hello"
+
+        await cipher.aencrypt_file(p_original, p_encrypted, overwrite=True)
+        await cipher.adecrypt_file(p_encrypted, p_decrypted, overwrite=True)
+        assert p_decrypted.read_bytes() == p_original.read_bytes()
+
+    asyncio.run(main())
+
+
+def test_configure():
+    runner = aio.default_runner
+    try:
+        new_runner = aio.configure(max_concurrency=1)
+        assert aio.get_runner() is new_runner
+    finally:
+        aio.default_runner = runner
+
+
+def test_encrypt_and_decrypt_stream(tmp_path):
+    p_encrypted, _ = get_output_paths(tmp_path)
+    data = os.urandom(2500)
+
+    async def main():
+        encrypted = BytesWriter()
+        await aio.encrypt_stream(cipher, make_reader(data), encrypted, chunk_size=1000)
+        decrypted = BytesWriter()
+        header = await aio.decrypt_stream(
+            cipher, make_reader(bytes(encrypted.buffer)), decrypted
+        )
+        assert bytes(decrypted.buffer) == data
+        assert header.chunk_size == 1000
+
+        # file written by encrypt_file with index
+        cipher.encrypt_file(
+            p_original, p_encrypted, overwrite=True, enable_verbose=False, index=True
+        )
+        decrypted = BytesWriter()
+        await aio.decrypt_stream(
+            cipher, make_reader(p_encrypted.read_bytes()), decrypted
+        )
+        assert bytes(decrypted.buffer) == p_original.read_bytes()
+
+        # the index footer is not read at once
+        reader = make_reader(p_encrypted.read_bytes())
+        sizes = list()
+        read = reader.read
+
+        async def read_(n=-1):
+            sizes.append(n)
+            return await read(n)
+
+        reader.read = read_
+        await aio.decrypt_stream(cipher, reader, BytesWriter())
+        assert sizes and -1 not in sizes
+        assert reader.at_eof()
+
+        with pytest.raises(FileFormatError):
+            await aio.decrypt_stream(
+                cipher, make_reader(bytes(encrypted.buffer)[:-1]), BytesWriter()
+            )
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.aio", preview=False)
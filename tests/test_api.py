@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import pytest
+
 from windtalker import api
 
 
@@ -8,6 +10,10 @@ def test():
     _ = api.BaseCipher
     _ = api.AsymmetricCipher
     _ = api.SymmetricCipher
+    _ = api.inspect_file
+    assert set(api.__all__) <= set(dir(api))
+    with pytest.raises(AttributeError):
+        _ = api.NotExists
 
 
 if __name__ == "__main__":
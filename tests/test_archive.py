@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker import archive
+from windtalker.dirs import plan_dir
+from windtalker.exc import FileFormatError
+from windtalker.symmetric import SymmetricCipher
+from windtalker.tests.helper import dir_original
+
+
+def test_check_member_path():
+    archive._check_member_path("a/b.txt")
+    for path in ["", "/etc/passwd", "../a.txt", "a/../../b.txt", "a\\b.txt"]:
+        with pytest.raises(FileFormatError):
+            archive._check_member_path(path)
+
+
+def test_encrypt_and_decrypt_archive(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    p_archive = Path(tmp_path, "archive")
+    dir_out = Path(tmp_path, "out")
+    cipher.encrypt_dir_to_archive(dir_original, p_archive, enable_verbose=False)
+    cipher.decrypt_archive(p_archive, dir_out, enable_verbose=False)
+    _, tasks = plan_dir(dir_original, dir_out)
+    assert len(tasks)
+    for task in tasks:
+        assert Path(task.src).read_bytes() == Path(task.dst).read_bytes()
+
+    members = cipher.list_archive(p_archive)
+    assert {m.path for m in members if not m.is_dir} == {
+        Path(task.src).relative_to(dir_original).as_posix() for task in tasks
+    }
+    for member in members:
+        if member.is_dir:
+            with pytest.raises(IsADirectoryError):
+                cipher.read_archive_member(p_archive, member)
+        else:
+            with cipher.read_archive_member(p_archive, member.path) as f:
+                assert f.read() == dir_original.joinpath(member.path).read_bytes()
+    with pytest.raises(KeyError):
+        cipher.read_archive_member(p_archive, "not-exists.txt")
+
+
+def test_read_member_stream(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    cipher.set_encrypt_chunk_size(64 * 1024)
+    dir_src = Path(tmp_path, "src")
+    dir_src.mkdir()
+    data = os.urandom(200 * 1024 + 123)
+    dir_src.joinpath("a.txt").write_text("alice")
+    dir_src.joinpath("b.bin").write_bytes(data)
+    p_archive = Path(tmp_path, "archive")
+    cipher.encrypt_dir_to_archive(dir_src, p_archive, enable_verbose=False)
+
+    with cipher.read_archive_member(p_archive, "b.bin") as f:
+        chunks = list(iter(lambda: f.read(50000), b""))
+    assert b"".join(chunks) == data
+    assert max(len(chunk) for chunk in chunks) <= 50000
+    assert f.closed
+
+    # the archive is cut in the middle of the member
+    [member] = [m for m in cipher.list_archive(p_archive) if m.path == "b.bin"]
+    p_archive.write_bytes(p_archive.read_bytes()[: p_archive.size // 2])
+    with pytest.raises(FileFormatError):
+        with cipher.read_archive_member(p_archive, member) as f:
+            f.read()
+
+
+def test_encrypt_dir_to_archive_failed(tmp_path, monkeypatch):
+    cipher = SymmetricCipher(password="MyPassword")
+    p_archive = Path(tmp_path, "archive")
+    cipher.encrypt_dir_to_archive(dir_original, p_archive, enable_verbose=False)
+    data = p_archive.read_bytes()
+
+    def pack_dir(writer, src):
+        writer.write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(archive, "pack_dir", pack_dir)
+    with pytest.raises(OSError):
+        cipher.encrypt_dir_to_archive(
+            dir_original, p_archive, overwrite=True, enable_verbose=False
+        )
+    # the old archive is kept and no part file is left
+    assert p_archive.read_bytes() == data
+    assert sorted(p.basename for p in Path(tmp_path).iterdir()) == ["archive"]
+
+
+def test_not_an_archive(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    p = Path(tmp_path, "file.txt")
+    p.write_bytes(b"hello world" * 10)
+    p_encrypted = cipher.encrypt_file(p, enable_verbose=False, index=True)
+    with pytest.raises(FileFormatError):
+        cipher.list_archive(p_encrypted)
+    with pytest.raises(FileFormatError):
+        archive.unpack_dir(io.BytesIO(b"\x00\x00"), Path(tmp_path, "out"))
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.archive", preview=False)
@@ -1,6 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import os
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker import container
 from windtalker.asymmetric import AsymmetricCipher
+from windtalker.dirs import plan_dir
+from windtalker.exc import PasswordError, SignatureError, FileFormatError
+from windtalker.tests.helper import dir_original
+
+A_pubkey, A_privkey = AsymmetricCipher.new_keys(512)
+B_pubkey, B_privkey = AsymmetricCipher.new_keys(512)
+C_pubkey, C_privkey = AsymmetricCipher.new_keys(512)
 
 
 class TestAsymmetricCipher:
@@ -19,6 +32,110 @@ class TestAsymmetricCipher:
         assert data == data_new
         assert data != token
 
+    def test_encrypt_and_sign(self):
+        cipherA = AsymmetricCipher(A_pubkey, A_privkey, B_pubkey)
+        cipherB = AsymmetricCipher(B_pubkey, B_privkey, A_pubkey)
+        data = b"Turn right at blue tree"
+        token, signature = cipherA.encrypt_and_sign(data)
+        assert cipherA.sign is None
+        assert cipherB.decrypt_and_verify(token, signature) == data
+        with pytest.raises(SignatureError):
+            cipherB.decrypt_and_verify(token, cipherA.sign_binary(b"other"))
+
+    @pytest.mark.parametrize(
+        "workers,use_process",
+        [(1, True), (2, True), (2, False)],
+    )
+    def test_batch(self, workers, use_process):
+        cipherA = AsymmetricCipher(A_pubkey, A_privkey, B_pubkey)
+        cipherB = AsymmetricCipher(B_pubkey, B_privkey, A_pubkey)
+        kwargs = dict(workers=workers, batch_size=3, use_process=use_process)
+        binaries = [str(i).encode("utf-8") for i in range(10)]
+
+        signatures = cipherA.sign_many(binaries, **kwargs)
+        assert signatures == [cipherA.sign_binary(b) for b in binaries]
+        signatures[3] = signatures[4]
+        valid = cipherB.verify_many(binaries, signatures, **kwargs)
+        assert valid == [True] * 3 + [False] + [True] * 6
+
+        results = cipherA.encrypt_many(binaries, **kwargs)
+        assert [
+            cipherB.decrypt_and_verify(token, signature) for token, signature in results
+        ] == binaries
+
+        # the generic batch methods don't touch cipherA.sign
+        tokens = cipherA.encrypt_binary_many(binaries, workers=workers, batch_size=3)
+        assert cipherA.sign is None
+        assert cipherB.decrypt_binary_many(tokens, workers=workers) == binaries
+
+    def test_encrypt_decrypt_file(self, tmp_path):
+        cipherA = AsymmetricCipher(A_pubkey, A_privkey, B_pubkey)
+        cipherB = AsymmetricCipher(B_pubkey, B_privkey, A_pubkey)
+        p = Path(tmp_path, "data.bin")
+        content = os.urandom(3 * 1024**2 + 123)
+        p.write_bytes(content)
+
+        p_encrypted = cipherA.encrypt_file(p, enable_verbose=False, index=True)
+        header = container.inspect_file(p_encrypted.abspath)
+        assert header.cipher_id == container.CIPHER_ID_HYBRID_RSA
+        assert header.key_block
+        assert p_encrypted.size == container.encrypted_size(
+            len(content),
+            chunk_size=header.chunk_size,
+            frame_size=cipherA._frame_size,
+            index=True,
+            key_block_size=len(header.key_block),
+        )
+
+        p_decrypted = cipherB.decrypt_file(
+            p_encrypted, Path(tmp_path, "decrypted.bin"), enable_verbose=False
+        )
+        assert p_decrypted.read_bytes() == content
+        assert cipherB.decrypt_range(p_encrypted, 1000, 10) == content[1000:1010]
+
+        # signed by someone else
+        cipherC = AsymmetricCipher(B_pubkey, B_privkey, C_pubkey)
+        with pytest.raises(SignatureError):
+            cipherC.decrypt_file(p_encrypted, overwrite=True, enable_verbose=False)
+        # not encrypted for C
+        cipherC = AsymmetricCipher(C_pubkey, C_privkey, A_pubkey)
+        with pytest.raises(PasswordError):
+            cipherC.decrypt_file(p_encrypted, overwrite=True, enable_verbose=False)
+
+        with pytest.raises(FileFormatError):
+            cipherB._begin_decrypt(container.Header(key_block=b"\x00\x10abc"))
+
+        # the header is signed with the key block
+        header.flags &= ~container.FLAG_INDEX
+        with pytest.raises(SignatureError):
+            cipherB._begin_decrypt(header)
+        header.flags |= container.FLAG_INDEX
+        header.chunk_size += 1
+        with pytest.raises(SignatureError):
+            cipherB._begin_decrypt(header)
+        # the counts are authenticated by the end frame, not signed
+        header.chunk_size -= 1
+        header.chunk_count = None
+        cipherB._begin_decrypt(header)
+
+    def test_encrypt_decrypt_dir(self, tmp_path):
+        cipherA = AsymmetricCipher(A_pubkey, A_privkey, B_pubkey)
+        cipherB = AsymmetricCipher(B_pubkey, B_privkey, A_pubkey)
+        dir_encrypted = Path(tmp_path, "encrypted")
+        dir_decrypted = Path(tmp_path, "decrypted")
+        summary = cipherA.encrypt_dir_parallel(
+            dir_original,
+            dir_encrypted,
+            enable_verbose=False,
+            workers=2,
+            dedup=True,
+        )
+        assert summary.ok
+        cipherB.decrypt_dir(dir_encrypted, dir_decrypted, enable_verbose=False)
+        _, tasks = plan_dir(dir_original, dir_decrypted)
+        for task in tasks:
+            assert Path(task.src).read_bytes() == Path(task.dst).read_bytes()
+
 
 if __name__ == "__main__":
     from windtalker.tests import run_cov_test
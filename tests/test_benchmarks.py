@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker.benchmarks import (
+    Config,
+    measure,
+    make_report,
+    dump_report,
+    load_report,
+    compare,
+    find_regressions,
+    run,
+)
+from windtalker.benchmarks.__main__ import main
+
+
+def test_measure():
+    calls = list()
+    result = measure(
+        "append", lambda: calls.append(1), params=dict(n=1), ops=2, repeat=3
+    )
+    assert len(calls) == 4  # 1 warmup + 3 runs
+    assert result.id == "append[n=1]"
+    assert len(result.times) == 3
+    assert result.latency == result.median / 2
+    assert result.throughput is None
+
+
+def test_compare(tmp_path):
+    config = Config.quick()
+    config.repeat = 1
+    config.engines = ["x25519"]
+    results = run(["text", "asymmetric"], config=config, workdir=tmp_path)
+    assert [result.name for result in results] == [
+        "encrypt_text",
+        "decrypt_text",
+        "sign",
+        "verify",
+    ]
+
+    report = make_report(results)
+    p = Path(tmp_path, "report.json")
+    dump_report(report, p.abspath)
+    baseline = load_report(p.abspath)
+    assert len(compare(report, baseline)) == 4
+    assert find_regressions(report, baseline) == []
+
+    for res in baseline["results"]:
+        res["median"] /= 2
+    assert len(find_regressions(report, baseline)) == 4
+
+    with pytest.raises(ValueError):
+        run(["network"])
+
+
+def test_bench_import(tmp_path):
+    config = Config.quick()
+    config.repeat = 1
+    config.imports = ["from windtalker.api import SymmetricCipher"]
+    results = run(["import"], config=config, workdir=tmp_path)
+    assert [result.id for result in results] == [
+        "python_startup",
+        "import[stmt=from windtalker.api import SymmetricCipher]",
+    ]
+
+
+def test_main(tmp_path):
+    p = Path(tmp_path, "report.json")
+    args = ["--quick", "--suite", "file", "--repeat", "1"]
+    assert main(args + ["--output", p.abspath, "--workdir", str(tmp_path)]) == 0
+    assert main(args + ["--baseline", p.abspath, "--tolerance", "100"]) == 0
+    report = load_report(p.abspath)
+    for res in report["results"]:
+        res["median"] = 0.000001
+    dump_report(report, p.abspath)
+    assert main(args + ["--baseline", p.abspath]) == 1
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.benchmarks", preview=False, is_folder=True)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker import files
+from windtalker import metrics
+from windtalker import checkpoint
+from windtalker.symmetric import SymmetricCipher
+
+KB = 1024
+CHUNK_SIZE = 64 * KB
+N_CHUNKS = 10
+
+
+class Interrupt(metrics.Instrument):
+    """
+    Kill the encryption at the n-th chunk, count the chunks.
+    """
+
+    def __init__(self, n: int):
+        self.n = n
+        self.chunks = 0
+
+    def on_chunk(self, event):
+        self.chunks += 1
+        if self.chunks == self.n:
+            raise KeyboardInterrupt
+
+
+def new_cipher(password: str = "MyPassword") -> SymmetricCipher:
+    cipher = SymmetricCipher(password=password)
+    cipher.set_encrypt_chunk_size(CHUNK_SIZE)
+    return cipher
+
+
+@pytest.fixture
+def paths(tmp_path):
+    p = Path(tmp_path, "data.bin")
+    p.write_bytes(os.urandom(CHUNK_SIZE * N_CHUNKS + 100))
+    p_encrypted = Path(tmp_path, "data-encrypted.bin")
+    p_decrypted = Path(tmp_path, "data-decrypted.bin")
+    return p, p_encrypted, p_decrypted
+
+
+def interrupt(cipher, p, p_encrypted, n: int, **kwargs):
+    cipher.instrument = Interrupt(n)
+    with pytest.raises(KeyboardInterrupt):
+        cipher.encrypt_file(
+            p, p_encrypted, enable_verbose=False, checkpoint_interval=0, **kwargs
+        )
+    cipher.instrument = metrics.NULL_INSTRUMENT
+    assert not p_encrypted.exists()
+
+
+def encrypt_and_count(cipher, p, p_encrypted, **kwargs) -> int:
+    counter = Interrupt(-1)
+    cipher.instrument = counter
+    cipher.encrypt_file(p, p_encrypted, overwrite=True, enable_verbose=False, **kwargs)
+    cipher.instrument = metrics.NULL_INSTRUMENT
+    assert not files.get_part_path(p_encrypted).exists()
+    assert not checkpoint.get_journal_path(p_encrypted).exists()
+    return counter.chunks
+
+
+def check_decrypt(cipher, p, p_encrypted, p_decrypted):
+    cipher.decrypt_file(p_encrypted, p_decrypted, overwrite=True, enable_verbose=False)
+    assert p_decrypted.read_bytes() == p.read_bytes()
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        dict(),
+        dict(workers=3),
+        dict(index=True),
+        dict(compression="zlib"),
+        dict(mmap=True),
+    ],
+)
+def test_resume(paths, monkeypatch, kwargs):
+    if kwargs.pop("mmap", False):
+        monkeypatch.setattr(files, "MMAP_THRESHOLD", 1)
+    p, p_encrypted, p_decrypted = paths
+    cipher = new_cipher()
+    interrupt(cipher, p, p_encrypted, 5, **kwargs)
+    journal = checkpoint.Journal.load(checkpoint.get_journal_path(p_encrypted))
+    assert 1 <= journal.chunk_count < N_CHUNKS
+
+    # only the chunks after the checkpoint are encrypted
+    n = encrypt_and_count(cipher, p, p_encrypted, **kwargs)
+    assert n == N_CHUNKS + 1 - journal.chunk_count
+    check_decrypt(cipher, p, p_encrypted, p_decrypted)
+    if kwargs.get("index"):
+        assert cipher.decrypt_range(p_encrypted, CHUNK_SIZE, 10) == (
+            p.read_bytes()[CHUNK_SIZE : CHUNK_SIZE + 10]
+        )
+
+
+def test_start_over(paths):
+    p, p_encrypted, p_decrypted = paths
+    cipher = new_cipher()
+
+    # the source file is changed
+    interrupt(cipher, p, p_encrypted, 5)
+    st = os.stat(p.abspath)
+    os.utime(p.abspath, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert encrypt_and_count(cipher, p, p_encrypted) == N_CHUNKS + 1
+    check_decrypt(cipher, p, p_encrypted, p_decrypted)
+    p_encrypted.remove()
+
+    # another password
+    interrupt(cipher, p, p_encrypted, 5)
+    other = new_cipher("AnotherPassword")
+    assert encrypt_and_count(other, p, p_encrypted) == N_CHUNKS + 1
+    check_decrypt(other, p, p_encrypted, p_decrypted)
+    p_encrypted.remove()
+
+    # the part file is damaged
+    interrupt(cipher, p, p_encrypted, 5)
+    with open(files.get_part_path(p_encrypted).abspath, "r+b") as f:
+        f.truncate(100)
+    assert encrypt_and_count(cipher, p, p_encrypted) == N_CHUNKS + 1
+    check_decrypt(cipher, p, p_encrypted, p_decrypted)
+    p_encrypted.remove()
+
+    # resume is disabled, the part file is removed on error
+    interrupt(cipher, p, p_encrypted, 5, resume=False)
+    assert not files.get_part_path(p_encrypted).exists()
+    assert not checkpoint.get_journal_path(p_encrypted).exists()
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_resume_dir(tmp_path, parallel):
+    dir_src = Path(tmp_path, "src")
+    dir_dst = Path(tmp_path, "dst")
+    dir_out = Path(tmp_path, "out")
+    dir_src.mkdir()
+    for name in ["a.bin", "b.bin"]:
+        dir_src.joinpath(name).write_bytes(os.urandom(CHUNK_SIZE * N_CHUNKS + 100))
+    cipher = new_cipher()
+
+    def encrypt_dir(**kwargs):
+        if parallel:
+            kwargs.update(workers=1, use_process=False)
+            method = cipher.encrypt_dir_parallel
+        else:
+            method = cipher.encrypt_dir
+        return method(
+            dir_src, dir_dst, enable_verbose=False, checkpoint_interval=0, **kwargs
+        )
+
+    def interrupt_dir():
+        # the first file is done, the second is killed in the middle
+        cipher.instrument = Interrupt(N_CHUNKS + 1 + 5)
+        with pytest.raises(KeyboardInterrupt):
+            encrypt_dir()
+        cipher.instrument = metrics.NULL_INSTRUMENT
+        assert checkpoint.DirJournal.exists(dir_dst)
+
+    interrupt_dir()
+    [p_done] = list(dir_dst.select_by_ext(".bin"))
+    mtime_ns = os.stat(p_done.abspath).st_mtime_ns
+
+    # the journal of another key is not trusted
+    with pytest.raises(EnvironmentError):
+        new_cipher("AnotherPassword").encrypt_dir(
+            dir_src, dir_dst, enable_verbose=False
+        )
+
+    # the re-run doesn't need overwrite, only the rest is encrypted
+    counter = Interrupt(-1)
+    cipher.instrument = counter
+    encrypt_dir()
+    cipher.instrument = metrics.NULL_INSTRUMENT
+    assert 0 < counter.chunks < N_CHUNKS + 1
+    assert os.stat(p_done.abspath).st_mtime_ns == mtime_ns
+    assert sorted(p.basename for p in dir_dst.select_file()) == ["a.bin", "b.bin"]
+    assert not checkpoint.DirJournal.exists(dir_dst)
+
+    cipher.decrypt_dir(dir_dst, dir_out, enable_verbose=False)
+    for name in ["a.bin", "b.bin"]:
+        assert (
+            dir_out.joinpath(name).read_bytes() == dir_src.joinpath(name).read_bytes()
+        )
+
+    # a finished output is not an interrupted run
+    with pytest.raises(EnvironmentError):
+        encrypt_dir()
+
+    # with overwrite, everything is encrypted again
+    counter = Interrupt(-1)
+    cipher.instrument = counter
+    encrypt_dir(overwrite=True)
+    cipher.instrument = metrics.NULL_INSTRUMENT
+    assert counter.chunks == 2 * (N_CHUNKS + 1)
+
+    # an existing output that is not in the journal still raises
+    dir_dst.remove_if_exists()
+    interrupt_dir()
+    [p_done] = list(dir_dst.select_by_ext(".bin"))
+    p_other = dir_dst.joinpath({"a.bin": "b.bin", "b.bin": "a.bin"}[p_done.basename])
+    p_other.write_bytes(b"not from this run")
+    if parallel:
+        assert not encrypt_dir().ok
+    else:
+        with pytest.raises(EnvironmentError):
+            encrypt_dir()
+    assert p_other.read_bytes() == b"not from this run"
+
+
+def test_atomic_write(tmp_path):
+    p = Path(tmp_path, "data.bin")
+    with pytest.raises(KeyboardInterrupt):
+        with files.atomic_write(p) as f:
+            f.write(b"hello")
+            raise KeyboardInterrupt
+    assert not p.exists()
+    assert not files.get_part_path(p).exists()
+
+    with files.atomic_write(p) as f:
+        f.write(b"hello")
+    assert p.read_bytes() == b"hello"
+    assert not files.get_part_path(p).exists()
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.checkpoint", preview=False)
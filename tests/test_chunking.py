@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker import files, container
+from windtalker.chunking import ChunkPolicy, DEFAULT_POLICY, KB, MB, autotune
+from windtalker.cipher import BaseCipher
+from windtalker.symmetric import SymmetricCipher
+
+
+def test_chunk_policy():
+    policy = ChunkPolicy(default=1 * MB, min_size=64 * KB, max_size=10 * MB)
+    assert policy.clamp(1) == 64 * KB
+    assert policy.clamp(2 * MB) == 2 * MB
+    assert policy.clamp(100 * MB) == 10 * MB
+    policy.check(64 * KB)
+    with pytest.raises(ValueError):
+        policy.check(100 * MB)
+    assert policy.candidates() == [64 * KB, 256 * KB, 1 * MB, 4 * MB]
+    assert policy.candidates(max_size=1 * MB) == [64 * KB, 256 * KB, 1 * MB]
+    assert DEFAULT_POLICY.candidates(max_size=64 * KB) == [1 * MB]
+
+    # custom cipher keeps the old 1MB ~ 10MB range
+    assert BaseCipher()._get_chunk_size() == 1 * MB
+
+
+def test_encrypt_file_with_chunk_size(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    p = Path(tmp_path, "data.bin")
+    data = os.urandom(300 * KB)
+    p.write_bytes(data)
+    p_encrypted = cipher.encrypt_file(p, enable_verbose=False, chunk_size=64 * KB)
+    header = container.inspect_file(p_encrypted.abspath)
+    assert header.chunk_size == 64 * KB
+    assert header.chunk_count == 5
+    p_decrypted = cipher.decrypt_file(
+        p_encrypted, Path(tmp_path, "decrypted.bin"), enable_verbose=False
+    )
+    assert p_decrypted.read_bytes() == data
+
+
+def test_decrypt_legacy_file_with_small_chunk_size(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    cipher.set_encrypt_chunk_size(64 * KB)
+    p = Path(tmp_path, "data.bin")
+    data = os.urandom(300 * KB)
+    p.write_bytes(data)
+    p_encrypted = Path(tmp_path, "encrypted.bin")
+    files.transform(
+        p, p_encrypted, converter=cipher.encrypt, chunksize=cipher._encrypt_chunk_size
+    )
+    p_decrypted = cipher.decrypt_file(
+        p_encrypted, Path(tmp_path, "decrypted.bin"), enable_verbose=False
+    )
+    assert p_decrypted.read_bytes() == data
+
+
+def test_autotune(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    result = autotune(
+        cipher,
+        dir_path=tmp_path,
+        sample_size=1 * MB,
+        candidates=[64 * KB, 256 * KB],
+    )
+    assert result.chunk_size in (64 * KB, 256 * KB)
+    assert set(result.throughputs) == {64 * KB, 256 * KB}
+    assert list(Path(tmp_path).iterdir()) == []
+
+    chunk_size = cipher.autotune_chunk_size(dir_path=tmp_path, sample_size=1 * MB)
+    assert chunk_size in (64 * KB, 256 * KB)
+    assert cipher._encrypt_chunk_size == chunk_size
+    # cached
+    result = autotune(cipher, dir_path=tmp_path, sample_size=1 * MB)
+    assert result.chunk_size == chunk_size
+    assert autotune(cipher, dir_path=tmp_path, sample_size=1 * MB) is result
+    # another sample size or repeat is measured again
+    assert autotune(cipher, dir_path=tmp_path, sample_size=2 * MB) is not result
+    assert (
+        autotune(cipher, dir_path=tmp_path, sample_size=1 * MB, repeat=2) is not result
+    )
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.chunking", preview=False)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import base64
+import sys
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker import kdf
+from windtalker import container
+from windtalker.symmetric import SymmetricCipher
+from windtalker.stream import DecryptingReader
+from windtalker.cli import main, parse_size
+
+
+def test_parse_size():
+    assert parse_size("65536") == 65536
+    assert parse_size("64K") == 64 * 1024
+    assert parse_size("4mb") == 4 * 1024**2
+    with pytest.raises(Exception):
+        parse_size("abc")
+
+
+class FakeStdio(io.TextIOWrapper):
+    def __init__(self, data: bytes = b""):
+        super().__init__(io.BytesIO(data))
+
+
+def test_cli(tmp_path, monkeypatch, capsys):
+    p_password = Path(tmp_path, "password.txt")
+    p_password.write_text("MyPassword")
+    password = ["--password-file", p_password.abspath]
+
+    # text
+    assert main(["encrypt", "-t", "hello"] + password) == 0
+    token = capsys.readouterr().out.strip()
+    assert main(["decrypt", "-t", token] + password) == 0
+    assert capsys.readouterr().out.strip() == "hello"
+
+    # file
+    data = os.urandom(100000)
+    p = Path(tmp_path, "data.bin")
+    p.write_bytes(data)
+    args = ["--chunk-size", "64K", "--workers", "2", "--index"]
+    assert main(["encrypt", p.abspath] + args + password) == 0
+    p_decrypted = Path(tmp_path, "decrypted.bin")
+    p_encrypted = Path(tmp_path, "data-encrypted.bin")
+    assert (
+        main(["decrypt", p_encrypted.abspath, "-o", p_decrypted.abspath] + password)
+        == 0
+    )
+    assert p_decrypted.read_bytes() == data
+    # output exists
+    assert main(["encrypt", p.abspath] + password) == 1
+
+    # stream
+    monkeypatch.setattr(sys, "stdin", FakeStdio(data))
+    monkeypatch.setattr(sys, "stdout", FakeStdio())
+    assert main(["encrypt", "--compression", "zlib"] + password) == 0
+    encrypted = sys.stdout.buffer.getvalue()
+    monkeypatch.setattr(sys, "stdin", FakeStdio(encrypted))
+    monkeypatch.setattr(sys, "stdout", FakeStdio())
+    assert main(["decrypt"] + password) == 0
+    assert sys.stdout.buffer.getvalue() == data
+
+    # file to stdout
+    monkeypatch.setattr(sys, "stdout", FakeStdio())
+    assert main(["decrypt", p_encrypted.abspath, "-o", "-"] + password) == 0
+    assert sys.stdout.buffer.getvalue() == data
+    assert not Path(tmp_path, "-").exists()
+
+    # directory, the encrypt options are used for each file
+    p_dir = Path(tmp_path, "dir")
+    p_dir.mkdir()
+    Path(p_dir, "data.bin").write_bytes(data)
+    args = ["--chunk-size", "64K", "--compression", "zlib", "--index"]
+    assert main(["encrypt", p_dir.abspath] + args + password) == 0
+    with open(Path(tmp_path, "dir-encrypted", "data.bin").abspath, "rb") as f:
+        header = container.Header.read(f)
+    assert header.chunk_size == 64 * 1024
+    assert header.is_compressed
+    assert header.has_index
+    assert main(["encrypt", p_dir.abspath, "-o", "-"] + password) == 1
+
+    # the salt is base64 encoded, like the salt file
+    salt = ["--kdf", "pbkdf2", "--salt", base64.b64encode(b"s" * 16).decode("ascii")]
+    monkeypatch.setattr(sys, "stdin", FakeStdio(b"hello"))
+    monkeypatch.setattr(sys, "stdout", FakeStdio())
+    assert main(["encrypt"] + salt + password) == 0
+    encrypted_with_salt = sys.stdout.buffer.getvalue()
+    cipher = SymmetricCipher(password="MyPassword", kdf=kdf.PBKDF2(), salt=b"s" * 16)
+    with DecryptingReader(cipher, io.BytesIO(encrypted_with_salt)) as reader:
+        assert reader.read() == b"hello"
+    assert main(["encrypt", "--kdf", "pbkdf2", "--salt", "short"] + password) == 1
+
+    # wrong password
+    monkeypatch.setattr(sys, "stdin", FakeStdio(encrypted))
+    monkeypatch.setenv("WINDTALKER_TEST_PASSWORD", "WrongPassword")
+    assert main(["decrypt", "--password-env", "WINDTALKER_TEST_PASSWORD"]) == 1
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.cli", preview=False)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+
+import pytest
+
+from windtalker import compress, container
+from windtalker.exc import FileFormatError
+from windtalker.stream import EncryptingWriter, DecryptingReader
+from windtalker.symmetric import SymmetricCipher
+
+
+def test_compress_chunk():
+    text = b"hello world " * 10000
+    random = os.urandom(200 * 1024)
+    assert compress.is_compressible(text) is True
+    assert compress.is_compressible(random) is False
+    for name in ["zlib", "lzma", "bz2"]:
+        codec = compress.get_codec(name)
+        data = compress.compress_chunk(text, codec)
+        assert data[0] == codec
+        assert len(data) < len(text)
+        assert compress.decompress_chunk(data) == text
+
+        # incompressible data is stored raw
+        for chunk in [random, random[:1000], b""]:
+            data = compress.compress_chunk(chunk, codec)
+            assert data[0] == compress.CODEC_NONE
+            assert compress.decompress_chunk(data) == chunk
+
+    with pytest.raises(ValueError):
+        compress.get_codec("zip")
+    with pytest.raises(FileFormatError):
+        compress.decompress_chunk(b"")
+    with pytest.raises(FileFormatError):
+        compress.decompress_chunk(b"\x09data")
+
+
+def test_encrypt_and_decrypt_file(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    p = tmp_path / "log.txt"
+    content = b"".join(
+        [b"2024-01-01 INFO request %d done\n" % i for i in range(100000)]
+    ) + os.urandom(100000)
+    p.write_bytes(content)
+    p_plain = cipher.encrypt_file(str(p), str(tmp_path / "plain"), enable_verbose=False)
+    p_encrypted = cipher.encrypt_file(
+        str(p),
+        str(tmp_path / "compressed"),
+        enable_verbose=False,
+        index=True,
+        compression="zlib",
+    )
+    assert container.inspect_file(p_encrypted.abspath).is_compressed
+    assert p_encrypted.size * 3 < p_plain.size
+
+    p_decrypted = cipher.decrypt_file(
+        p_encrypted, str(tmp_path / "decrypted"), enable_verbose=False
+    )
+    assert p_decrypted.read_bytes() == content
+    assert cipher.decrypt_range(p_encrypted, 123456, 1000) == content[123456:124456]
+
+    with open(p_encrypted.abspath, "rb") as f:
+        with DecryptingReader(cipher, f, close_raw=False) as reader:
+            assert reader.read() == content
+
+
+def test_encrypting_writer():
+    cipher = SymmetricCipher(password="MyPassword")
+    content = b"hello world " * 100000
+    buffer = io.BytesIO()
+    with EncryptingWriter(cipher, buffer, compression="lzma", close_raw=False) as w:
+        w.write(content)
+    assert len(buffer.getvalue()) < len(content) // 10
+    buffer.seek(0)
+    with DecryptingReader(cipher, buffer) as reader:
+        assert reader.read() == content
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.compress", preview=False)
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+import pytest
+
+from windtalker import container
+from windtalker.exc import FileFormatError
+
+
+def test_encrypt_and_decrypt_buffer():
+    data = b"0123456789" * 100
+    f_encrypted = io.BytesIO()
+    container.encrypt_stream(
+        data,
+        f_encrypted,
+        encrypt_frame=lambda b, aad: bytes(b)[::-1],
+        chunksize=64,
+        index=True,
+    )
+    assert len(f_encrypted.getvalue()) == container.encrypted_size(
+        len(data), chunk_size=64, frame_size=lambda n: n, index=True
+    )
+    assert container.encrypted_size(10, 64, frame_size=lambda n: None) is None
+
+    f_decrypted = io.BytesIO()
+    container.decrypt_stream(
+        f_encrypted.getvalue(),
+        f_decrypted,
+        decrypt_frame=lambda b, aad: bytes(b)[::-1],
+    )
+    assert f_decrypted.getvalue() == data
+
+    encrypted = f_encrypted.getvalue()
+    header = container.Header.read(io.BytesIO(encrypted))
+    for end in [header.size, header.size + 2, header.size + 10]:
+        with pytest.raises(FileFormatError):
+            list(container.iter_frame_views(encrypted[:end], header.size, header))
+
+
+def test_encrypt_and_decrypt_stream():
+    data = b"0123456789" * 100
+    f_input = io.BytesIO(data)
+    f_encrypted = io.BytesIO()
+    container.encrypt_stream(
+        f_input,
+        f_encrypted,
+        encrypt_frame=lambda b, aad: b[::-1],
+        chunksize=64,
+    )
+    assert container.is_container(f_encrypted.getvalue())
+
+    f_encrypted.seek(0)
+    assert container.is_container_file(f_encrypted)
+    assert f_encrypted.tell() == 0
+    f_decrypted = io.BytesIO()
+    container.decrypt_stream(
+        f_encrypted,
+        f_decrypted,
+        decrypt_frame=lambda b, aad: b[::-1],
+        workers=4,
+    )
+    assert f_decrypted.getvalue() == data
+
+
+class NonSeekableBytesIO(io.BytesIO):
+    def seekable(self):
+        return False
+
+
+def test_header():
+    f_encrypted = io.BytesIO()
+    header = container.encrypt_stream(
+        io.BytesIO(b"x" * 100),
+        f_encrypted,
+        encrypt_frame=lambda b, aad: b,
+        chunksize=64,
+        cipher_id=container.CIPHER_ID_FERNET,
+    )
+    assert header.chunk_count == 2
+    f_encrypted.seek(0)
+    assert container.Header.read(f_encrypted) == header
+    assert header.size == f_encrypted.tell()
+
+    # non-seekable output, plaintext length and chunk count are unknown
+    f_encrypted = NonSeekableBytesIO()
+    container.encrypt_stream(
+        io.BytesIO(b"x" * 100),
+        f_encrypted,
+        encrypt_frame=lambda b, aad: b,
+        chunksize=64,
+    )
+    header = container.Header.read(io.BytesIO(f_encrypted.getvalue()))
+    assert header.chunk_size == 64
+    assert header.plaintext_length is None
+    assert header.chunk_count is None
+
+
+def test_frame_aad():
+    header = container.Header(chunk_size=64)
+    aads = {
+        header.frame_aad(0),
+        header.frame_aad(1),
+        header.frame_aad(1, final=True),
+        container.Header(chunk_size=128).frame_aad(0),
+        container.Header(chunk_size=64, key_block=b"key").frame_aad(0),
+    }
+    assert len(aads) == 5
+    # the counts are filled in at the end, they are not bound
+    header.chunk_count = 2
+    assert header.frame_aad(0) == container.Header(chunk_size=64).frame_aad(0)
+    assert container.Header(version=2).frame_aad(0) == b""
+
+
+def test_header_error():
+    with pytest.raises(FileFormatError):
+        container.Header.read(io.BytesIO(b"gAAAAABl"))
+    with pytest.raises(FileFormatError):
+        container.Header.read(io.BytesIO(container.MAGIC))
+    with pytest.raises(FileFormatError):
+        container.Header.read(io.BytesIO(container.MAGIC + b"\xff"))
+    with pytest.raises(FileFormatError):
+        container.Header.read(io.BytesIO(container.Header().pack()[:-1]))
+
+
+def test_header_size():
+    for header in [
+        container.Header(chunk_size=64),
+        container.Header(flags=container.FLAG_INDEX, key_block=b"key" * 10),
+    ]:
+        data = header.pack() + b"frames"
+        head = b""
+        while len(head) < container.header_size(head):
+            head = data[: container.header_size(head)]
+        assert head == data[: header.size]
+        assert container.Header.read(io.BytesIO(head)).pack() == header.pack()
+
+    assert container.header_size(container.MAGIC + b"\x01") == container.PREAMBLE_SIZE
+    assert container.header_size(b"gAAAAABl") == container.PREAMBLE_SIZE
+
+
+def test_decrypt_stream_error():
+    f_encrypted = io.BytesIO()
+    container.encrypt_stream(
+        io.BytesIO(b"x" * 100),
+        f_encrypted,
+        encrypt_frame=lambda b, aad: b,
+        chunksize=64,
+    )
+    data = f_encrypted.getvalue()
+
+    # written by another cipher
+    with pytest.raises(FileFormatError):
+        container.decrypt_stream(
+            io.BytesIO(data),
+            io.BytesIO(),
+            decrypt_frame=lambda b, aad: b,
+            cipher_id=container.CIPHER_ID_FERNET,
+        )
+
+    # the last frame is missing
+    with pytest.raises(FileFormatError):
+        container.decrypt_stream(
+            io.BytesIO(data[: -(4 + 36)]),
+            io.BytesIO(),
+            decrypt_frame=lambda b, aad: b,
+        )
+
+    # non-seekable output, the counts are only in the end frame
+    f_encrypted = NonSeekableBytesIO()
+    container.encrypt_stream(
+        io.BytesIO(b"x" * 300),
+        f_encrypted,
+        encrypt_frame=lambda b, aad: b,
+        chunksize=64,
+    )
+    data = f_encrypted.getvalue()
+    f_decrypted = io.BytesIO()
+    container.decrypt_stream(
+        io.BytesIO(data), f_decrypted, decrypt_frame=lambda b, aad: b
+    )
+    assert f_decrypted.getvalue() == b"x" * 300
+
+    # cut at a frame boundary: the last frame, the marker and the end frame
+    tail = (4 + 44) + 4 + (4 + 16)
+    for cut in [tail, tail - (4 + 44), 4 + 16]:
+        with pytest.raises(FileFormatError):
+            container.decrypt_stream(
+                io.BytesIO(data[:-cut]), io.BytesIO(), decrypt_frame=lambda b, aad: b
+            )
+
+
+def test_decrypt_version_1():
+    data = container.MAGIC + b"\x01" + container.pack_frame(b"hello")
+    header = container.Header.read(io.BytesIO(data))
+    assert header.version == 1
+    assert header.size == container.PREAMBLE_SIZE
+    f_decrypted = io.BytesIO()
+    container.decrypt_stream(
+        io.BytesIO(data),
+        f_decrypted,
+        decrypt_frame=lambda b, aad: b,
+        cipher_id=container.CIPHER_ID_FERNET,
+    )
+    assert f_decrypted.getvalue() == b"hello"
+
+
+def _encrypt(data: bytes, index: bool, output=None) -> bytes:
+    f_encrypted = io.BytesIO() if output is None else output
+    container.encrypt_stream(
+        io.BytesIO(data),
+        f_encrypted,
+        encrypt_frame=lambda b, aad: b[::-1],
+        chunksize=10,
+        index=index,
+    )
+    return f_encrypted.getvalue()
+
+
+def test_index():
+    data = bytes(range(256))
+    encrypted = _encrypt(data, index=True)
+    header = container.Header.read(io.BytesIO(encrypted))
+    assert header.has_index
+
+    # full decrypt still works
+    f_decrypted = io.BytesIO()
+    container.decrypt_stream(
+        io.BytesIO(encrypted),
+        f_decrypted,
+        decrypt_frame=lambda b, aad: b[::-1],
+    )
+    assert f_decrypted.getvalue() == data
+
+    # index and frame walking find the same offsets
+    f = io.BytesIO(encrypted)
+    offsets = container.read_frame_offsets(f, header, 3, 7)
+    header.flags = 0
+    assert container.read_frame_offsets(f, header, 3, 7) == offsets
+
+
+def test_read_range():
+    data = bytes(range(256))
+    for index in [True, False]:
+        for output in [io.BytesIO(), NonSeekableBytesIO()]:
+            encrypted = _encrypt(data, index=index, output=output)
+            for start, length in [
+                (0, 1),
+                (0, 256),
+                (5, 10),
+                (9, 2),
+                (10, 10),
+                (123, 77),
+                (250, 100),
+                (256, 10),
+                (300, 10),
+                (20, 0),
+            ]:
+                f = io.BytesIO(b"prefix" + encrypted)
+                f.seek(6)
+                assert (
+                    container.read_range(
+                        f,
+                        decrypt_frame=lambda b, aad: b[::-1],
+                        start=start,
+                        length=length,
+                    )
+                    == data[start : start + length]
+                )
+
+    with pytest.raises(ValueError):
+        container.read_range(io.BytesIO(encrypted), lambda b, aad: b, -1, 10)
+
+
+def test_iter_frames_truncated():
+    data = container.pack_frame(b"hello") + container.pack_frame(b"world")
+    assert list(container.iter_frames(io.BytesIO(data))) == [b"hello", b"world"]
+    with pytest.raises(FileFormatError):
+        list(container.iter_frames(io.BytesIO(data[:-1])))
+    with pytest.raises(FileFormatError):
+        list(container.iter_frames(io.BytesIO(data[:11])))
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.container", preview=False)
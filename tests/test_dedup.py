@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker import dedup
+from windtalker.dirs import FileTask, plan_dir
+from windtalker.exc import FileFormatError
+from windtalker.symmetric import SymmetricCipher
+
+
+def test_find_duplicates(tmp_path):
+    contents = [b"alice", b"bob", b"alice", b"carol", b"alice"]
+    tasks = list()
+    for ith, content in enumerate(contents):
+        p = Path(tmp_path, f"{ith}.txt")
+        p.write_bytes(content)
+        tasks.append(FileTask(src=p.abspath, dst="", size=len(content)))
+    for workers in [1, 2]:
+        groups = dedup.find_duplicates(tasks, workers=workers)
+        assert [[task.src for task in group] for group in groups] == [
+            [tasks[0].src, tasks[2].src, tasks[4].src],
+            [tasks[1].src],
+            [tasks[3].src],
+        ]
+
+
+def test_encrypt_and_decrypt_dir_dedup(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    dir_src = Path(tmp_path, "src")
+    dir_dst = Path(tmp_path, "dst")
+    dir_out = Path(tmp_path, "out")
+    dir_src.joinpath("a", "b").mkdir(parents=True)
+    dir_src.joinpath("empty").mkdir()
+    for relpath, content in [
+        ("1.txt", "alice"),
+        ("a/2.txt", "alice"),
+        ("a/b/3.txt", "alice"),
+        ("a/b/4.txt", "bob"),
+    ]:
+        dir_src.joinpath(relpath).write_text(content)
+
+    summary = cipher.encrypt_dir_parallel(
+        dir_src,
+        dir_dst,
+        enable_verbose=False,
+        workers=2,
+        use_process=False,
+        dedup=True,
+    )
+    assert summary.ok
+    assert len(summary.results) == 2
+    assert len(summary.skipped) == 2
+    assert dedup.is_dedup_dir(dir_dst)
+    assert len(list(dir_dst.joinpath(dedup.OBJECTS_DIRNAME).select_file())) == 2
+
+    cipher.decrypt_dir(dir_dst, dir_out, enable_verbose=False)
+    _, tasks = plan_dir(dir_src, dir_out)
+    for task in tasks:
+        assert Path(task.src).read_bytes() == Path(task.dst).read_bytes()
+    assert dir_out.joinpath("empty").is_dir()
+    assert dir_out.joinpath(dedup.INDEX_FILENAME).exists() is False
+
+
+def test_encrypt_dir_dedup_rerun(tmp_path, monkeypatch):
+    cipher = SymmetricCipher(password="MyPassword")
+    dir_src = Path(tmp_path, "src")
+    dir_dst = Path(tmp_path, "dst")
+    dir_src.mkdir()
+    dir_src.joinpath("1.txt").write_text("alice")
+    dir_src.joinpath("2.txt").write_text("alice")
+    dir_src.joinpath("3.txt").write_text("bob")
+    cipher.encrypt_dir(dir_src, dir_dst, enable_verbose=False, dedup=True)
+    dir_objects = dir_dst.joinpath(dedup.OBJECTS_DIRNAME)
+    objects = {p.basename: p.read_bytes() for p in dir_objects.select_file()}
+    assert len(objects) == 2
+
+    def decrypt() -> dict:
+        dir_out = Path(tmp_path, "out")
+        if dir_out.exists():
+            dir_out.remove_if_exists()
+        cipher.decrypt_dir(dir_dst, dir_out, enable_verbose=False)
+        return {p.basename: p.read_text() for p in dir_out.select_file()}
+
+    # an existing dedup output is not reused without overwrite
+    with pytest.raises(EnvironmentError):
+        cipher.encrypt_dir(dir_src, dir_dst, enable_verbose=False, dedup=True)
+    assert {p.basename: p.read_bytes() for p in dir_objects.select_file()} == objects
+    assert decrypt() == {"1.txt": "alice", "2.txt": "alice", "3.txt": "bob"}
+
+    # a failed run leaves no index, nothing is pruned
+    encrypt_file = cipher.encrypt_file
+
+    def failing_encrypt_file(path, *args, **kwargs):
+        if Path(path).read_text() == "bob":
+            raise ValueError("bad file")
+        return encrypt_file(path, *args, **kwargs)
+
+    monkeypatch.setattr(cipher, "encrypt_file", failing_encrypt_file)
+    summary = cipher.encrypt_dir_parallel(
+        dir_src,
+        dir_dst,
+        overwrite=True,
+        enable_verbose=False,
+        workers=1,
+        dedup=True,
+    )
+    assert not summary.ok
+    assert dedup.is_dedup_dir(dir_dst)
+    assert not dir_dst.joinpath(dedup.INDEX_FILENAME).exists()
+    assert len(list(dir_objects.select_file())) == 2
+    with pytest.raises(FileFormatError):
+        decrypt()
+
+    # a successful run removes the objects of the previous run
+    monkeypatch.undo()
+    dir_src.joinpath("3.txt").remove()
+    cipher.encrypt_dir(
+        dir_src, dir_dst, overwrite=True, enable_verbose=False, dedup=True
+    )
+    assert [p.basename for p in dir_objects.select_file()] == ["00000000"]
+    assert decrypt() == {"1.txt": "alice", "2.txt": "alice"}
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.dedup", preview=False)
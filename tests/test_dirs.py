@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+from pathlib_mate import Path
+
+from windtalker import dirs
+from windtalker.tests.helper import dir_original, get_output_paths
+
+
+def test_plan_dir(tmp_path):
+    dir_encrypted, _ = get_output_paths(tmp_path)
+    new_dirs, tasks = dirs.plan_dir(dir_original, dir_encrypted, largest_first=True)
+    assert dir_encrypted in new_dirs
+    assert len(tasks) == len(list(dir_original.select_file(recursive=True)))
+    sizes = [task.size for task in tasks]
+    assert sizes == sorted(sizes, reverse=True)
+    for task in tasks:
+        assert Path(task.dst).relative_to(dir_encrypted) == Path(task.src).relative_to(
+            dir_original
+        )
+
+
+class FailingCipher:
+    def encrypt_file(self, src, dst, **kwargs):
+        if src.endswith(".txt"):
+            raise ValueError("bad file")
+
+
+def test_run_tasks(tmp_path):
+    dir_encrypted, _ = get_output_paths(tmp_path)
+    _, tasks = dirs.plan_dir(dir_original, dir_encrypted)
+    results = dirs.run_tasks(
+        FailingCipher(),
+        "encrypt_file",
+        tasks,
+        workers=2,
+        use_process=False,
+    )
+    summary = dirs.DirSummary(output_path=dir_encrypted, results=results)
+    assert summary.ok is False
+    assert len(summary.failed) == 1
+    assert summary.failed[0].error == "ValueError: bad file"
+    assert summary.total_size == sum(task.size for task in tasks)
+
+
+def test_submit_bounded():
+    submitted = list()
+    finished = list()
+
+    def submit(item):
+        # at most 3 futures are submitted but not yet yielded
+        assert len(submitted) - len(finished) < 3
+        submitted.append(item)
+        return executor.submit(lambda: item * 2)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for future in dirs.submit_bounded(submit, range(20), max_in_flight=3):
+            finished.append(future.result())
+    assert sorted(finished) == [i * 2 for i in range(20)]
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.dirs", preview=False)
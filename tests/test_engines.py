@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+import rsa
+from pathlib_mate import Path
+
+from windtalker import container
+from windtalker.asymmetric import AsymmetricCipher
+from windtalker.engines import (
+    RsaEngine,
+    CryptographyRsaEngine,
+    X25519Engine,
+    get_engine,
+)
+from windtalker.dirs import plan_dir
+from windtalker.exc import PasswordError, SignatureError
+from windtalker.tests.helper import dir_original
+
+
+def new_ciphers(engine, nbits=None):
+    A_pubkey, A_privkey = AsymmetricCipher.new_keys(nbits, engine=engine)
+    B_pubkey, B_privkey = AsymmetricCipher.new_keys(nbits, engine=engine)
+    cipherA = AsymmetricCipher(A_pubkey, A_privkey, B_pubkey, engine=engine)
+    cipherB = AsymmetricCipher(B_pubkey, B_privkey, A_pubkey, engine=engine)
+    return cipherA, cipherB
+
+
+@pytest.mark.parametrize(
+    "engine,nbits",
+    [("rsa", 512), ("cryptography", 1024), ("x25519", None)],
+)
+def test_engine(engine, nbits):
+    engine = get_engine(engine)
+    A_pubkey, A_privkey = engine.new_keys(nbits)
+    B_pubkey, B_privkey = engine.new_keys(nbits)
+    data = b"Turn right at blue tree"
+
+    token = engine.encrypt(data, B_pubkey)
+    assert engine.decrypt(token, B_privkey) == data
+    with pytest.raises(PasswordError):
+        engine.decrypt(token, A_privkey)
+
+    signature = engine.sign(data, A_privkey)
+    engine.verify(data, signature, A_pubkey)
+    with pytest.raises(SignatureError):
+        engine.verify(data + b"!", signature, A_pubkey)
+    with pytest.raises(SignatureError):
+        engine.verify(data, signature, B_pubkey)
+
+    # the errors of the rsa package based API are still raised
+    with pytest.raises(rsa.DecryptionError):
+        engine.decrypt(token, A_privkey)
+    with pytest.raises(rsa.VerificationError):
+        engine.verify(data, signature, B_pubkey)
+
+    pubkey = engine.load_public_key(engine.dump_public_key(B_pubkey))
+    privkey = engine.load_private_key(engine.dump_private_key(B_privkey))
+    assert engine.decrypt(engine.encrypt(data, pubkey), privkey) == data
+
+
+def test_hash_method():
+    data = b"Turn right at blue tree"
+    engine = RsaEngine()
+    pubkey, privkey = engine.new_keys(512)
+    engine.verify(data, engine.sign(data, privkey, "MD5"), pubkey, "MD5")
+
+    engine = CryptographyRsaEngine()
+    pubkey, privkey = engine.new_keys(1024)
+    signature = engine.sign(data, privkey, "SHA-512")
+    engine.verify(data, signature, pubkey, "SHA-512")
+    with pytest.raises(ValueError):
+        engine.sign(data, privkey, "MD5")
+
+
+def test_x25519_key_binding():
+    engine = X25519Engine()
+    A_pubkey, _ = engine.new_keys()
+    B_pubkey, _ = engine.new_keys()
+    shared_key, ephemeral_public = os.urandom(32), os.urandom(32)
+    assert engine._derive_key(
+        shared_key, ephemeral_public, A_pubkey.exchange_key
+    ) != engine._derive_key(shared_key, ephemeral_public, B_pubkey.exchange_key)
+    assert engine._derive_key(
+        shared_key, ephemeral_public, A_pubkey.exchange_key
+    ) != engine._derive_key(shared_key, os.urandom(32), A_pubkey.exchange_key)
+
+
+def test_cryptography_engine_with_rsa_keys():
+    A_pubkey, A_privkey = RsaEngine().new_keys(1024)
+    B_pubkey, B_privkey = RsaEngine().new_keys(1024)
+    cipherA = AsymmetricCipher(A_pubkey, A_privkey, B_pubkey, engine="cryptography")
+    cipherB = AsymmetricCipher(B_pubkey, B_privkey, A_pubkey, engine="cryptography")
+    assert isinstance(cipherA.engine, CryptographyRsaEngine)
+
+    data = b"Turn right at blue tree"
+    token = cipherA.encrypt(data)
+    assert cipherB.decrypt(token, signature=cipherA.sign) == data
+
+    # key material is dumped in the engine's format
+    cipher = AsymmetricCipher.from_key_material(cipherB.to_key_material())
+    assert cipher.decrypt(token) == data
+
+
+def test_get_engine():
+    assert isinstance(get_engine(), RsaEngine)
+    engine = X25519Engine()
+    assert get_engine(engine) is engine
+    with pytest.raises(ValueError):
+        get_engine("des")
+
+
+def test_encrypt_decrypt_file(tmp_path):
+    cipherA, cipherB = new_ciphers("x25519")
+    p = Path(tmp_path, "data.bin")
+    content = os.urandom(1024**2 + 123)
+    p.write_bytes(content)
+
+    p_encrypted = cipherA.encrypt_file(p, enable_verbose=False)
+    header = container.inspect_file(p_encrypted.abspath)
+    assert header.cipher_id == container.CIPHER_ID_HYBRID_X25519
+    p_decrypted = cipherB.decrypt_file(
+        p_encrypted, Path(tmp_path, "decrypted.bin"), enable_verbose=False
+    )
+    assert p_decrypted.read_bytes() == content
+
+    with pytest.raises(SignatureError):
+        cipherA.decrypt_file(p_encrypted, overwrite=True, enable_verbose=False)
+
+
+def test_encrypt_decrypt_dir(tmp_path):
+    cipherA, cipherB = new_ciphers("x25519")
+    dir_encrypted = Path(tmp_path, "encrypted")
+    dir_decrypted = Path(tmp_path, "decrypted")
+    summary = cipherA.encrypt_dir_parallel(
+        dir_original, dir_encrypted, enable_verbose=False, workers=2
+    )
+    assert summary.ok
+    summary = cipherB.decrypt_dir_parallel(
+        dir_encrypted, dir_decrypted, enable_verbose=False, workers=2
+    )
+    assert summary.ok
+    _, tasks = plan_dir(dir_original, dir_decrypted)
+    for task in tasks:
+        assert Path(task.src).read_bytes() == Path(task.dst).read_bytes()
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.engines", preview=False)
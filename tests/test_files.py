@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import time
+
 import pytest
 from pathlib_mate import Path
 from windtalker import files
@@ -26,6 +28,97 @@ def test_get_encrypted_path_get_decrypted_path():
     p_after.remove_if_exists()
 
 
+def test_iter_views():
+    data = bytes(range(10))
+    chunks = list(files.iter_views(data, 4))
+    assert [bytes(chunk) for chunk in chunks] == [data[:4], data[4:8], data[8:]]
+
+
+def test_open_mmap_and_preallocate(tmp_path):
+    p = Path(tmp_path, "data.bin")
+    p.write_bytes(b"")
+    with p.open("rb") as f:
+        with files.open_mmap(f, threshold=0) as mm:
+            assert mm is None
+
+    p.write_bytes(b"hello world")
+    with p.open("rb") as f:
+        with files.open_mmap(f) as mm:
+            assert mm is None
+        with files.open_mmap(f, threshold=1) as mm:
+            assert mm[:5] == b"hello"
+
+    with p.open("wb") as f:
+        files.preallocate(f, 1000)
+        f.write(b"hello")
+        f.truncate()
+    assert p.read_bytes() == b"hello"
+
+
+def test_iter_batches():
+    assert list(files.iter_batches(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(files.iter_batches([], 3)) == []
+
+
+def test_imap_ordered():
+    results = list(files.imap_ordered(lambda x: x * 2, range(100), workers=4))
+    assert results == [x * 2 for x in range(100)]
+
+    def func(x):
+        if x == 50:
+            raise ValueError
+        return x
+
+    with pytest.raises(ValueError):
+        list(files.imap_ordered(func, range(100), workers=4))
+
+
+def test_imap_ordered_in_flight():
+    counter = {"read": 0, "max": 0}
+
+    def items():
+        for x in range(200):
+            counter["read"] += 1
+            yield x
+
+    yielded = 0
+    for _ in files.imap_ordered(lambda x: x, items(), workers=4):
+        yielded += 1
+        counter["max"] = max(counter["max"], counter["read"] - yielded)
+        time.sleep(0.0001)
+    assert yielded == 200
+    assert counter["max"] <= 4
+
+    # stop early
+    results = files.imap_ordered(lambda x: x, items(), workers=2)
+    assert next(results) == 0
+    results.close()
+
+
+def test_transform_with_workers(tmp_path):
+    p_src = Path(tmp_path, "src.bin")
+    p_dst = Path(tmp_path, "dst.bin")
+    data = bytes(range(256)) * (4096 * 14 + 1)  # about 3.5 MB
+    p_src.write_bytes(data)
+
+    files.transform(
+        p_src,
+        p_dst,
+        converter=lambda x: x[::-1],
+        overwrite=True,
+        stream=True,
+        workers=4,
+    )
+    chunksize = 1024**2
+    expected = b"".join(
+        [
+            data[i : i + chunksize][::-1]
+            for i in range(0, len(data), chunksize)
+        ]
+    )
+    assert p_dst.read_bytes() == expected
+
+
 def test_process_dst_overwrite_args():
     p_src = Path("test.txt")
     p_src, p_dst = files.process_dst_overwrite_args(
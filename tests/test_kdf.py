@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import os
+import base64
+import threading
+
+import pytest
+
+from windtalker import kdf
+from windtalker.symmetric import SymmetricCipher
+
+
+def test_derive():
+    scrypt = kdf.Scrypt(n=2**10)
+    pbkdf2 = kdf.PBKDF2(iterations=1000)
+    k1 = scrypt.derive(b"password", b"salt")
+    k2 = pbkdf2.derive(b"password", b"salt")
+    assert len(k1) == len(k2) == kdf.KEY_LENGTH
+    assert k1 != k2
+    assert scrypt.derive(b"password", b"salt2") != k1
+    assert (
+        kdf.PBKDF2(iterations=1000, algorithm="sha512").derive(b"password", b"salt")
+        != k2
+    )
+
+
+def test_derived_key_cache():
+    cache = kdf.DerivedKeyCache(maxsize=2)
+    scrypt = kdf.Scrypt(n=2**10)
+    k1 = cache.get_or_derive(scrypt, "password", b"salt")
+    assert cache.get_or_derive(scrypt, "password", b"salt") == k1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.get_or_derive(scrypt, "password", b"salt2")
+    cache.get_or_derive(kdf.Scrypt(n=2**11), "password", b"salt")
+    assert len(cache) == 2  # the least recently used key is evicted
+    cache.get_or_derive(scrypt, "password", b"salt")
+    assert cache.misses == 4
+
+    # cache doesn't store the password
+    for key in cache._data:
+        assert "password" not in key
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_derived_key_cache_thread_safe():
+    cache = kdf.DerivedKeyCache(maxsize=4)
+    scrypt = kdf.Scrypt(n=2**10)
+    results = list()
+
+    def run(i: int):
+        results.append(cache.get_or_derive(scrypt, f"password{i % 8}", b"salt"))
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 32
+    assert len(cache) <= 4
+
+
+def test_derive_fernet_key():
+    scrypt = kdf.Scrypt(n=2**10)
+    salt = kdf.new_salt()
+    assert len(salt) == kdf.SALT_SIZE
+    assert kdf.derive_fernet_key("password", scrypt, salt) != kdf.derive_fernet_key(
+        "password", scrypt, kdf.new_salt()
+    )
+    for salt in [None, b""]:
+        with pytest.raises(ValueError):
+            kdf.derive_fernet_key("password", scrypt, salt)
+
+
+def test_read_or_create_salt(tmp_path, monkeypatch):
+    path = os.path.join(str(tmp_path), ".windtalker-salt")
+    monkeypatch.setattr(kdf, "path_salt", path)
+    salt = kdf.read_or_create_salt()
+    assert len(salt) == kdf.SALT_SIZE
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert kdf.read_or_create_salt() == salt
+    assert os.listdir(str(tmp_path)) == [".windtalker-salt"]
+
+    # SymmetricCipher uses it if the salt is not given
+    scrypt = kdf.Scrypt(n=2**10)
+    cipher = SymmetricCipher(password="password", kdf=scrypt)
+    assert cipher.salt == salt
+    assert cipher.fernet_key == kdf.derive_fernet_key("password", scrypt, salt)
+
+    with open(path, "w") as f:
+        f.write("c2FsdA==")
+    with pytest.raises(ValueError):
+        kdf.read_or_create_salt()
+
+
+def test_decode_salt():
+    salt = kdf.new_salt()
+    assert kdf.decode_salt(base64.b64encode(salt).decode("ascii") + "\n") == salt
+    for s in ["c2FsdA==", "not base64!"]:
+        with pytest.raises(ValueError):
+            kdf.decode_salt(s)
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.kdf", preview=False)
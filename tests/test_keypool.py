@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker.asymmetric import AsymmetricCipher
+from windtalker.symmetric import SymmetricCipher
+from windtalker.keypool import KeyPool, generate_key_pairs
+from windtalker.exc import FileFormatError
+
+
+def check_key_pair(A_pubkey, A_privkey, engine=None):
+    B_pubkey, B_privkey = AsymmetricCipher.new_keys(512, engine=engine)
+    cipherA = AsymmetricCipher(A_pubkey, A_privkey, B_pubkey, engine=engine)
+    cipherB = AsymmetricCipher(B_pubkey, B_privkey, A_pubkey, engine=engine)
+    data = b"Turn right at blue tree"
+    assert cipherA.decrypt(cipherB.encrypt(data), signature=cipherB.sign) == data
+
+
+def test_generate_key_pairs():
+    key_pairs = generate_key_pairs(3, 512, workers=2)
+    assert len(key_pairs) == 3
+    assert len({pubkey.n for pubkey, _ in key_pairs}) == 3
+    for pubkey, privkey in key_pairs:
+        check_key_pair(pubkey, privkey)
+
+    key_pairs = generate_key_pairs(2, engine="x25519", workers=1)
+    for pubkey, privkey in key_pairs:
+        check_key_pair(pubkey, privkey, engine="x25519")
+
+
+def test_key_pool():
+    with KeyPool(nbits=512, size=2, workers=2) as pool:
+        pool.wait()
+        assert len(pool) == 2
+        key_pairs = [pool.take_key_pair() for _ in range(3)]
+        assert len({pubkey.n for pubkey, _ in key_pairs}) == 3
+        pool.wait()
+        assert len(pool) == 2
+    check_key_pair(*key_pairs[0])
+
+    with pytest.raises(ValueError):
+        KeyPool(size=0)
+    with pytest.raises(ValueError):
+        KeyPool(path="keys.bin")
+
+
+def test_key_pool_persist(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    path = Path(tmp_path, "keys.bin")
+    with KeyPool(nbits=512, size=2, workers=1, path=path, cipher=cipher) as pool:
+        pool.wait()
+    assert path.exists()
+
+    with KeyPool(nbits=512, size=3, workers=1, path=path, cipher=cipher) as pool:
+        assert len(pool) >= 2
+        pubkey, privkey = pool.take_key_pair()
+        pool.wait()
+    check_key_pair(pubkey, privkey)
+
+    with KeyPool(nbits=512, size=3, workers=1, path=path, cipher=cipher) as pool:
+        assert len(pool) == 3
+        assert pubkey.n not in {pool.take_key_pair()[0].n for _ in range(3)}
+
+    with pytest.raises(FileFormatError):
+        KeyPool(engine="x25519", path=path, cipher=cipher)
+
+
+def test_key_pool_dump_outside_lock(tmp_path, monkeypatch):
+    cipher = SymmetricCipher(password="MyPassword")
+    path = Path(tmp_path, "keys.bin")
+    dumps = list()
+    dump = KeyPool._dump
+
+    def checked_dump(self, ready):
+        assert not self._lock.locked()
+        dumps.append(len(ready))
+        dump(self, ready)
+
+    monkeypatch.setattr(KeyPool, "_dump", checked_dump)
+    with KeyPool(nbits=512, size=2, workers=2, path=path, cipher=cipher) as pool:
+        pool.wait()
+        assert dumps and dumps[-1] == 2
+        n_dumps = len(dumps)
+        pool.wait()  # nothing changed, the file is not written again
+        assert len(dumps) == n_dumps
+        pool.take_key_pair()
+        assert dumps[n_dumps] == 1
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.keypool", preview=False)
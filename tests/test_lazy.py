@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import subprocess
+
+from windtalker.lazy import LazyModule, lazy_import
+from windtalker.paths import dir_project_root
+
+
+def test_lazy_import():
+    assert lazy_import("windtalker.exc") is sys.modules["windtalker.exc"]
+
+    module = LazyModule("windtalker.compress")
+    assert "not loaded" in repr(module)
+    assert module.get_codec("zlib") == module.CODEC_ZLIB
+    assert "(loaded)" in repr(module)
+    assert "get_codec" in dir(module)
+
+
+def test_startup_modules():
+    """
+    Decrypting a token doesn't import the asymmetric engines, the async,
+    directory and process pool machinery.
+    """
+    code = (
+        "import sys, json\n"
+        "from windtalker.api import SymmetricCipher\n"
+        "cipher = SymmetricCipher(password='MyPassword')\n"
+        "assert cipher.decrypt_text(cipher.encrypt_text('hello')) == 'hello'\n"
+        "print(json.dumps(sorted(sys.modules)))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=dir_project_root.abspath,
+        check=True,
+        capture_output=True,
+    ).stdout
+    modules = set(json.loads(output))
+    for name in [
+        "rsa",
+        "asyncio",
+        "pathlib_mate",
+        "concurrent.futures.process",
+        "windtalker.asymmetric",
+        "windtalker.engines",
+        "windtalker.dirs",
+        "windtalker.files",
+    ]:
+        assert name not in modules, name
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.lazy", preview=False)
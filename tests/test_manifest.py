@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker import manifest
+from windtalker.symmetric import SymmetricCipher
+
+
+def test_incremental_encrypt_dir(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    dir_src = Path(tmp_path, "src")
+    dir_dst = Path(tmp_path, "dst")
+    dir_src.joinpath("sub").mkdir(parents=True)
+    p_a = dir_src.joinpath("a.txt")
+    p_b = dir_src.joinpath("sub", "b.txt")
+    p_a.write_text("alice")
+    p_b.write_text("bob")
+
+    def encrypt(**kwargs):
+        return cipher.encrypt_dir_parallel(
+            dir_src,
+            dir_dst,
+            enable_verbose=False,
+            workers=2,
+            use_process=False,
+            incremental=True,
+            **kwargs,
+        )
+
+    # first run, everything is new
+    summary = encrypt()
+    assert len(summary.results) == 2
+    assert summary.skipped == []
+    m = manifest.Manifest.load(dir_dst)
+    assert set(m.entries) == {"a.txt", "sub/b.txt"}
+
+    # nothing changed
+    summary = encrypt()
+    assert summary.results == []
+    assert len(summary.skipped) == 2
+
+    # touch a file without changing the content
+    st = os.stat(p_a.abspath)
+    os.utime(p_a.abspath, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    summary = encrypt()
+    assert [res.src for res in summary.results] == [p_a.abspath]
+    os.utime(p_a.abspath, ns=(st.st_atime_ns, st.st_mtime_ns + 2 * 10**9))
+    summary = encrypt(use_hash=True)
+    assert [res.src for res in summary.results] == [p_a.abspath]  # no hash yet
+    os.utime(p_a.abspath, ns=(st.st_atime_ns, st.st_mtime_ns + 3 * 10**9))
+    summary = encrypt(use_hash=True)
+    assert summary.results == []
+
+    # the content hash is keyed
+    entry = manifest.Manifest.load(dir_dst).entries["a.txt"]
+    assert entry.hash != hashlib.sha256(b"alice").hexdigest()
+    assert entry.hash == manifest.hash_file(p_a.abspath, cipher._get_hash_key())
+
+    # change a file and remove a file
+    p_a.write_text("alice in wonderland")
+    p_b.remove()
+    summary = encrypt(delete_removed=True)
+    assert [res.src for res in summary.results] == [p_a.abspath]
+    assert summary.removed == ["sub/b.txt"]
+    assert dir_dst.joinpath("sub", "b.txt").exists() is False
+    assert set(manifest.Manifest.load(dir_dst).entries) == {"a.txt"}
+
+    # the manifest is not decrypted
+    dir_out = Path(tmp_path, "out")
+    cipher.decrypt_dir(dir_dst, dir_out, enable_verbose=False)
+    assert dir_out.joinpath("a.txt").read_text() == "alice in wonderland"
+    assert dir_out.joinpath(manifest.MANIFEST_FILENAME).exists() is False
+
+
+def test_delete_removed_outside(tmp_path):
+    cipher = SymmetricCipher(password="MyPassword")
+    dir_src = Path(tmp_path, "src")
+    dir_dst = Path(tmp_path, "dst")
+    dir_src.mkdir()
+    dir_src.joinpath("a.txt").write_text("alice")
+    p_victim = Path(tmp_path, "victim.txt")
+    p_victim.write_text("victim")
+
+    def encrypt():
+        return cipher.encrypt_dir(
+            dir_src,
+            dir_dst,
+            enable_verbose=False,
+            incremental=True,
+            delete_removed=True,
+        )
+
+    encrypt()
+    m = manifest.Manifest.load(dir_dst)
+    m.entries["../victim.txt"] = manifest.Entry(size=6, mtime_ns=0)
+    m.dump()
+    with pytest.raises(ValueError):
+        encrypt()
+    assert p_victim.read_text() == "victim"
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.manifest", preview=False)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import json
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker import metrics
+from windtalker.symmetric import SymmetricCipher
+from windtalker.tests.helper import dir_original
+
+
+class Recorder(metrics.Instrument):
+    def __init__(self):
+        self.events = list()
+
+    def on_file_start(self, operation, path, size):
+        self.events.append(("start", operation, path, size))
+
+    def on_chunk(self, event):
+        self.events.append(event)
+
+    def on_file_end(self, event):
+        self.events.append(event)
+
+
+def new_cipher(instrument) -> SymmetricCipher:
+    cipher = SymmetricCipher(password="MyPassword")
+    cipher.instrument = instrument
+    return cipher
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_encrypt_decrypt_file(tmp_path, workers):
+    recorder = Recorder()
+    collector = metrics.MetricsCollector()
+    cipher = new_cipher(metrics.MultiInstrument(recorder, collector))
+    p = Path(tmp_path, "data.bin")
+    p.write_bytes(os.urandom(3 * 1024**2 + 123))
+    p_encrypted = cipher.encrypt_file(p, enable_verbose=False, workers=workers)
+    cipher.decrypt_file(
+        p_encrypted,
+        Path(tmp_path, "decrypted.bin"),
+        enable_verbose=False,
+        workers=workers,
+    )
+
+    start, *chunks, end = recorder.events[:6]
+    assert start == ("start", "encrypt", p.abspath, p.size)
+    assert sorted(event.index for event in chunks) == [0, 1, 2, 3]
+    assert sum(event.bytes_in for event in chunks) == p.size
+    assert all(event.queue_depth >= 1 for event in chunks)
+    assert end.ok
+    assert end.chunks == 4
+    assert end.bytes_in == p.size
+    assert end.bytes_out > p.size
+
+    end = recorder.events[-1]
+    assert end.operation == "decrypt"
+    assert end.bytes_out == p.size
+
+    data = collector.to_dict()
+    assert data["counters"]["encrypt"]["files_total"] == 1
+    assert data["counters"]["decrypt"]["chunks_total"] == 4
+    text = collector.to_prometheus()
+    assert 'windtalker_bytes_in_total{operation="encrypt"} %s' % p.size in text
+
+
+def test_error(tmp_path):
+    f = io.StringIO()
+    cipher = new_cipher(metrics.JsonLinesExporter(f, chunks=True))
+    p = Path(tmp_path, "data.bin")
+    p.write_bytes(b"not encrypted" * 100)
+    with pytest.raises(Exception):
+        cipher.decrypt_file(p, Path(tmp_path, "out.bin"), enable_verbose=False)
+    lines = [json.loads(line) for line in f.getvalue().splitlines()]
+    assert lines[-1]["event"] == "file"
+    assert lines[-1]["error"]
+
+
+def test_progress_reporter(tmp_path):
+    f = io.StringIO()
+    cipher = new_cipher(metrics.ProgressReporter(stream=f, interval=0))
+    p = Path(tmp_path, "data.bin")
+    p.write_bytes(os.urandom(2 * 1024**2))
+    cipher.encrypt_file(p, enable_verbose=False)
+    lines = f.getvalue().splitlines()
+    assert lines[0].endswith("50.0%")
+    assert lines[1].endswith("100.0%")
+    assert "done" in lines[2]
+
+
+def test_encrypt_dir_parallel(tmp_path):
+    collector = metrics.MetricsCollector()
+    cipher = new_cipher(collector)
+    summary = cipher.encrypt_dir_parallel(
+        dir_original, Path(tmp_path, "encrypted"), enable_verbose=False, workers=2
+    )
+    counters = collector.to_dict()["counters"]["encrypt"]
+    assert counters["files_total"] == len(summary.results)
+    assert counters["bytes_in_total"] == summary.total_size
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.metrics", preview=False)
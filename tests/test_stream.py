@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import gzip
+import tarfile
+import threading
+
+import pytest
+
+from windtalker import container
+from windtalker.symmetric import SymmetricCipher
+from windtalker.stream import EncryptingWriter, DecryptingReader
+from windtalker.exc import FileFormatError
+from windtalker.tests.helper import dir_original
+
+cipher = SymmetricCipher(password="MyPassword")
+
+
+def encrypt(data: bytes, chunk_size: int = 100, **kwargs) -> bytes:
+    f = io.BytesIO()
+    with EncryptingWriter(
+        cipher, f, chunk_size=chunk_size, close_raw=False, **kwargs
+    ) as writer:
+        for i in range(0, len(data), 7):
+            writer.write(data[i : i + 7])
+    return f.getvalue()
+
+
+def test_encrypting_writer_and_decrypting_reader():
+    data = os.urandom(1000)
+    encrypted = encrypt(data, index=True)
+    header = container.Header.read(io.BytesIO(encrypted))
+    assert header.chunk_size == 100
+    assert header.chunk_count == 10
+    assert header.plaintext_length == 1000
+    assert header.has_index
+
+    # read all
+    with DecryptingReader(cipher, io.BytesIO(encrypted)) as reader:
+        assert reader.read() == data
+        assert reader.read() == b""
+
+    # read small pieces
+    reader = DecryptingReader(cipher, io.BytesIO(encrypted))
+    pieces = list()
+    while 1:
+        piece = reader.read(33)
+        if not piece:
+            break
+        assert len(piece) <= 33
+        pieces.append(piece)
+    assert b"".join(pieces) == data
+    reader.close()
+    with pytest.raises(ValueError):
+        reader.read(1)
+
+    # BufferedReader on top of it
+    with io.BufferedReader(DecryptingReader(cipher, io.BytesIO(encrypted))) as f:
+        assert f.read(150) == data[:150]
+        assert f.read() == data[150:]
+
+
+def test_truncated():
+    encrypted = encrypt(os.urandom(1000))
+    with pytest.raises(FileFormatError):
+        DecryptingReader(cipher, io.BytesIO(encrypted[:-10])).read()
+
+
+def test_pipe():
+    data = os.urandom(200000)
+    r, w = os.pipe()
+    result = dict()
+
+    def read():
+        with open(r, "rb", buffering=0) as f_read:
+            with DecryptingReader(cipher, f_read) as reader:
+                result["data"] = reader.readall()
+                result["header"] = reader.header
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    with open(w, "wb", buffering=0) as f_write:
+        with EncryptingWriter(cipher, f_write, chunk_size=1000) as writer:
+            writer.write(data)
+    thread.join()
+    assert result["data"] == data
+    # the output is not seekable, the header counts are unknown
+    assert result["header"].chunk_count is None
+
+
+def test_legacy_format():
+    data = os.urandom(100)
+    encrypted = cipher.encrypt(data)
+    with DecryptingReader(cipher, io.BytesIO(encrypted)) as reader:
+        assert reader.read() == data
+
+
+def test_tarfile_and_gzip():
+    f = io.BytesIO()
+    with EncryptingWriter(cipher, f, close_raw=False) as writer:
+        with gzip.GzipFile(fileobj=writer, mode="wb") as f_gzip:
+            with tarfile.open(fileobj=f_gzip, mode="w|") as tar:
+                tar.add(dir_original.abspath, arcname="data")
+    assert f.closed is False
+
+    f.seek(0)
+    with DecryptingReader(cipher, f) as reader:
+        with gzip.GzipFile(fileobj=reader, mode="rb") as f_gzip:
+            with tarfile.open(fileobj=f_gzip, mode="r|") as tar:
+                names = [member.name for member in tar]
+    assert "data/MyBankAccount.txt" in names
+    assert f.closed is True
+
+
+def test_exception_in_with_block():
+    data = os.urandom(2500)
+    f = io.BytesIO()
+    with pytest.raises(RuntimeError):
+        with EncryptingWriter(cipher, f, chunk_size=1000, close_raw=False) as writer:
+            writer.write(data)
+            raise RuntimeError("interrupted")
+    assert writer.closed is True
+
+    # the partial container has no end frame
+    f.seek(0)
+    with pytest.raises(FileFormatError):
+        with DecryptingReader(cipher, f) as reader:
+            reader.read()
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.stream", preview=False)
@@ -1,10 +1,21 @@
 # -*- coding: utf-8 -*-
 
+import io
+import os
+import base64
+
 import pytest
+from pathlib_mate import Path
+from cryptography.hazmat.primitives.hmac import HMAC
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
+from windtalker import files, container, kdf
+from windtalker import symmetric
 from windtalker.symmetric import SymmetricCipher
-from windtalker.exc import PasswordError
+from windtalker.exc import PasswordError, FileFormatError
 from windtalker.tests import BaseTestCipher
+from windtalker.tests.helper import p_original, get_output_paths
 
 
 class TestSymmetricCipher(BaseTestCipher):
@@ -22,6 +33,281 @@ class TestSymmetricCipher(BaseTestCipher):
         with pytest.raises(PasswordError):
             cipher.decrypt_text(encrypted_text)
 
+    def test_kdf(self):
+        scrypt = kdf.Scrypt(n=2**10)
+        cipher = SymmetricCipher(password="MyPassword", kdf=scrypt, salt=b"salt")
+        token = cipher.encrypt_text("Hello World")
+        assert cipher.fernet_key != self.cipher.fernet_key
+        cipher = SymmetricCipher(password="MyPassword", kdf=scrypt, salt=b"salt")
+        assert cipher.decrypt_text(token) == "Hello World"
+        with pytest.raises(PasswordError):
+            SymmetricCipher(
+                password="MyPassword", kdf=scrypt, salt=b"salt2"
+            ).decrypt_text(token)
+
+    def test_default(self, tmp_path, monkeypatch):
+        path = Path(tmp_path, ".windtalker")
+        path.write_text("MyPassword")
+        monkeypatch.setattr(symmetric, "path_windtalker", path)
+        cipher = SymmetricCipher.default()
+        assert cipher.fernet_key == self.cipher.fernet_key
+        assert SymmetricCipher.default() is cipher
+        assert SymmetricCipher().fernet_key == self.cipher.fernet_key
+
+        path.write_text("AnotherPassword")
+        st = os.stat(path.abspath)
+        os.utime(path.abspath, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        new_cipher = SymmetricCipher.default()
+        assert new_cipher is not cipher
+        assert new_cipher.fernet_key != cipher.fernet_key
+
+    def test_frame(self):
+        data = b"Turn right at blue tree"
+        frame = self.cipher._encrypt_frame(data)
+        assert self.cipher._decrypt_frame(frame) == data
+        # the frame is a binary fernet token
+        assert self.cipher.decrypt(base64.urlsafe_b64encode(frame)) == data
+        assert (
+            self.cipher._decrypt_frame(
+                base64.urlsafe_b64decode(self.cipher.encrypt(data))
+            )
+            == data
+        )
+
+        # the associated data is authenticated, not stored
+        frame = self.cipher._encrypt_frame(data, b"aad")
+        assert len(frame) == self.cipher._frame_size(len(data))
+        assert self.cipher._decrypt_frame(frame, b"aad") == data
+        for aad in [b"", b"aae"]:
+            with pytest.raises(PasswordError):
+                self.cipher._decrypt_frame(frame, aad)
+        frame = self.cipher._encrypt_frame(data)
+
+        cipher = SymmetricCipher(password="AnotherPassword")
+        with pytest.raises(PasswordError):
+            cipher._decrypt_frame(frame)
+        with pytest.raises(PasswordError):
+            cipher._decrypt_frame(b"")
+
+        # any bytes-like input, and the frame size is known up front
+        for size in [0, 15, 16, 17, 1000]:
+            data = os.urandom(size)
+            frame = self.cipher._encrypt_frame(memoryview(data))
+            assert len(frame) == self.cipher._frame_size(size)
+            assert self.cipher._decrypt_frame(memoryview(frame)) == data
+
+        # an authentic frame with a bad padding, only the last byte is valid
+        cipher = self.cipher
+        iv = os.urandom(16)
+        encryptor = Cipher(algorithms.AES(cipher._encryption_key), modes.CBC(iv))
+        body = (
+            b"\x80"
+            + bytes(8)
+            + iv
+            + encryptor.encryptor().update(b"A" * 14 + b"\x05\x02")
+        )
+        h = HMAC(cipher._signing_key, SHA256())
+        h.update(body)
+        with pytest.raises(PasswordError):
+            cipher._decrypt_frame(body + h.finalize())
+
+    def test_frame_binding(self, tmp_path, monkeypatch):
+        cipher = SymmetricCipher(password="MyPassword")
+        cipher.set_encrypt_chunk_size(64 * 1024)
+        p = Path(tmp_path, "data.bin")
+        p.write_bytes(os.urandom(4 * 64 * 1024))
+        p_encrypted = Path(tmp_path, "encrypted.bin")
+        cipher.encrypt_file(p, p_encrypted, enable_verbose=False)
+        data = p_encrypted.read_bytes()
+        with open(p_encrypted.abspath, "rb") as f:
+            header = container.Header.read(f)
+            offsets, end = container.scan_frames(f, header, 4)
+        frames = [data[start:stop] for start, stop in zip(offsets, offsets[1:] + [end])]
+        head, tail = data[: offsets[0]], data[end:]
+
+        for tampered in [
+            head + frames[0] + frames[2] + frames[1] + frames[3] + tail,  # reorder
+            head + frames[0] + frames[1] + frames[1] + frames[3] + tail,  # duplicate
+            head + frames[0] + frames[1] + frames[3] + tail,  # drop
+            # another chunk size in the header
+            head.replace(b"\x00\x01\x00\x00", b"\x00\x02\x00\x00", 1)
+            + b"".join(frames)
+            + tail,
+        ]:
+            p_encrypted.write_bytes(tampered)
+            with pytest.raises(PasswordError):
+                cipher.decrypt_file(
+                    p_encrypted,
+                    Path(tmp_path, "decrypted.bin"),
+                    overwrite=True,
+                    enable_verbose=False,
+                )
+
+        # a huge plaintext length in the header, the preallocation is capped
+        sizes = list()
+        monkeypatch.setattr(files, "preallocate", lambda f, size: sizes.append(size))
+        header.plaintext_length = 2**40
+        p_encrypted.write_bytes(header.pack() + data[header.size :])
+        with pytest.raises(FileFormatError):
+            cipher.decrypt_file(
+                p_encrypted,
+                Path(tmp_path, "decrypted.bin"),
+                overwrite=True,
+                enable_verbose=False,
+            )
+        assert sizes == [len(data)]
+
+    def test_encrypt_and_decrypt_file_mmap(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(files, "MMAP_THRESHOLD", 1)
+        cipher = SymmetricCipher(password="MyPassword")
+        p = Path(tmp_path, "data.bin")
+        content = os.urandom(3 * 1024**2 + 123)
+        p.write_bytes(content)
+        for workers, index in [(1, False), (4, True)]:
+            p_encrypted = cipher.encrypt_file(
+                p,
+                overwrite=True,
+                enable_verbose=False,
+                workers=workers,
+                index=index,
+            )
+            assert p_encrypted.size == container.encrypted_size(
+                len(content),
+                chunk_size=container.inspect_file(p_encrypted.abspath).chunk_size,
+                frame_size=cipher._frame_size,
+                index=index,
+            )
+            p_decrypted = cipher.decrypt_file(
+                p_encrypted,
+                Path(tmp_path, "decrypted.bin"),
+                overwrite=True,
+                enable_verbose=False,
+                workers=workers,
+            )
+            assert p_decrypted.read_bytes() == content
+
+    def test_inspect_file_and_custom_chunk_size(self, tmp_path):
+        p_encrypted, p_decrypted = get_output_paths(tmp_path)
+        cipher = SymmetricCipher(password="MyPassword")
+        cipher.set_encrypt_chunk_size(2 * 1024 * 1024)
+        cipher.encrypt_file(
+            p_original,
+            p_encrypted,
+            overwrite=True,
+            enable_verbose=False,
+        )
+        header = container.inspect_file(p_encrypted)
+        assert header.cipher_id == container.CIPHER_ID_FERNET
+        assert header.chunk_size == 2 * 1024 * 1024
+        assert header.plaintext_length == p_original.size
+        assert header.chunk_count == 1
+
+        # a default cipher can decrypt it
+        SymmetricCipher(password="MyPassword").decrypt_file(
+            p_encrypted,
+            p_decrypted,
+            overwrite=True,
+            enable_verbose=False,
+        )
+        assert p_decrypted.read_bytes() == p_original.read_bytes()
+
+    def test_encrypt_file_not_stream(self, tmp_path, monkeypatch):
+        cipher = SymmetricCipher(password="MyPassword")
+        content = os.urandom(200 * 1024)
+        p = Path(tmp_path, "data.bin")
+        p.write_bytes(content)
+        p_encrypted, p_decrypted = get_output_paths(tmp_path)
+        cipher.encrypt_file(p, p_encrypted, stream=False, enable_verbose=False)
+        assert container.inspect_file(p_encrypted).chunk_count == 1
+
+        # a file too large for one chunk is split
+        monkeypatch.setattr(container, "MAX_CHUNK_SIZE", 64 * 1024)
+        for threshold in [files.MMAP_THRESHOLD, 1]:
+            monkeypatch.setattr(files, "MMAP_THRESHOLD", threshold)
+            cipher.encrypt_file(
+                p, p_encrypted, overwrite=True, stream=False, enable_verbose=False
+            )
+            header = container.inspect_file(p_encrypted)
+            assert header.chunk_size == 64 * 1024
+            assert header.chunk_count == 4
+            cipher.decrypt_file(
+                p_encrypted, p_decrypted, overwrite=True, enable_verbose=False
+            )
+            assert p_decrypted.read_bytes() == content
+
+    def test_decrypt_range(self, tmp_path):
+        p_encrypted, _ = get_output_paths(tmp_path)
+        data = p_original.read_bytes()
+        for index in [True, False]:
+            self.cipher.encrypt_file(
+                p_original,
+                p_encrypted,
+                overwrite=True,
+                enable_verbose=False,
+                index=index,
+            )
+            assert self.cipher.decrypt_range(p_encrypted, 3, 10) == data[3:13]
+
+    def test_decrypt_range_tampered(self, tmp_path):
+        cipher = SymmetricCipher(password="MyPassword")
+        cipher.set_encrypt_chunk_size(64 * 1024)
+        content = os.urandom(3 * 64 * 1024 + 100)
+        p = Path(tmp_path, "data.bin")
+        p.write_bytes(content)
+        p_encrypted = Path(tmp_path, "encrypted.bin")
+        cipher.encrypt_file(p, p_encrypted, enable_verbose=False, index=True)
+        data = p_encrypted.read_bytes()
+        header = container.Header.read(io.BytesIO(data))
+        n_entries = 4 + 1  # and the end frame
+        index_pos = len(data) - 12 - n_entries * 8
+        entries = [data[i : i + 8] for i in range(index_pos, len(data) - 12, 8)]
+
+        def decrypt_range(tampered: bytes, start: int, length: int) -> bytes:
+            p_encrypted.write_bytes(tampered)
+            return cipher.decrypt_range(p_encrypted, start, length)
+
+        # the header counts are not used
+        tampered = header.pack()
+        header.plaintext_length, header.chunk_count = 100, 1
+        tampered = header.pack() + data[len(tampered) :]
+        assert decrypt_range(tampered, 0, len(content)) == content
+
+        # an offset points to another frame
+        entries_ = [entries[0], entries[2], entries[1]] + entries[3:]
+        tampered = data[:index_pos] + b"".join(entries_) + data[-12:]
+        assert decrypt_range(tampered, 0, 100) == content[:100]
+        with pytest.raises(PasswordError):
+            decrypt_range(tampered, 64 * 1024, 100)
+
+        # the last chunks are dropped from the index
+        entries_ = entries[:2] + entries[-1:]
+        tampered = (
+            data[:index_pos]
+            + b"".join(entries_)
+            + container._trailer.pack(index_pos, container.INDEX_MAGIC)
+        )
+        assert decrypt_range(tampered, 0, 100) == content[:100]
+        for start in [64 * 1024, 2 * 64 * 1024, len(content)]:
+            with pytest.raises(PasswordError):
+                decrypt_range(tampered, start, len(content))
+
+    def test_decrypt_legacy_file(self, tmp_path):
+        p_encrypted, p_decrypted = get_output_paths(tmp_path)
+        files.transform(
+            p_original,
+            p_encrypted,
+            converter=self.cipher.encrypt,
+            overwrite=True,
+            chunksize=self.cipher._encrypt_chunk_size,
+        )
+        self.cipher.decrypt_file(
+            p_encrypted,
+            p_decrypted,
+            overwrite=True,
+            enable_verbose=False,
+        )
+        assert p_decrypted.read_bytes() == p_original.read_bytes()
+
 
 if __name__ == "__main__":
     from windtalker.tests import run_cov_test
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+from pathlib_mate import Path
+
+from windtalker import files
+from windtalker import container
+from windtalker.symmetric import SymmetricCipher
+from windtalker.asymmetric import AsymmetricCipher
+from windtalker.tests.helper import dir_original
+
+KB = 1024
+CHUNK_SIZE = 64 * KB
+N_CHUNKS = 8
+
+
+def new_cipher(password: str = "MyPassword") -> SymmetricCipher:
+    cipher = SymmetricCipher(password=password)
+    cipher.set_encrypt_chunk_size(CHUNK_SIZE)
+    return cipher
+
+
+def encrypt(cipher, tmp_path, **kwargs) -> Path:
+    p = Path(tmp_path, "data.bin")
+    p.write_bytes(os.urandom(CHUNK_SIZE * N_CHUNKS + 100))
+    p_encrypted = Path(tmp_path, "data-encrypted.bin")
+    cipher.encrypt_file(p, p_encrypted, overwrite=True, enable_verbose=False, **kwargs)
+    return p_encrypted
+
+
+def flip_byte(path: Path, offset: int):
+    with open(path.abspath, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        dict(),
+        dict(workers=3),
+        dict(index=True),
+        dict(compression="zlib"),
+        dict(mmap=True),
+    ],
+)
+def test_verify_file(tmp_path, monkeypatch, kwargs):
+    if kwargs.pop("mmap", False):
+        monkeypatch.setattr(files, "MMAP_THRESHOLD", 1)
+    workers = kwargs.pop("workers", 1)
+    cipher = new_cipher()
+    p_encrypted = encrypt(cipher, tmp_path, **kwargs)
+
+    report = cipher.verify_file(p_encrypted, workers=workers)
+    assert report.ok
+    assert report.chunk_count == N_CHUNKS + 1
+    assert report.bad_chunk is None
+    assert report.size == p_encrypted.size
+
+    # wrong password
+    report = new_cipher("AnotherPassword").verify_file(p_encrypted, workers=workers)
+    assert not report.ok
+    assert report.bad_chunk == 0
+
+    # a byte in the 4th chunk is damaged
+    with open(p_encrypted.abspath, "rb") as f:
+        header = container.Header.read(f)
+        offsets, _ = container.scan_frames(f, header, 4)
+    flip_byte(p_encrypted, offsets[3] + 100)
+    report = cipher.verify_file(p_encrypted, workers=workers)
+    assert report.bad_chunk == 3
+    assert report.chunk_count == 3
+
+
+def test_verify_truncated_file(tmp_path):
+    cipher = new_cipher()
+    p_encrypted = encrypt(cipher, tmp_path)
+    with open(p_encrypted.abspath, "r+b") as f:
+        f.truncate(p_encrypted.size - 10)
+    report = cipher.verify_file(p_encrypted)
+    assert report.bad_chunk == N_CHUNKS + 1  # the end frame is cut
+    assert report.chunk_count == N_CHUNKS + 1
+    assert "truncated" in report.error
+
+    # cut at a frame boundary
+    p_encrypted = encrypt(cipher, tmp_path)
+    with open(p_encrypted.abspath, "r+b") as f:
+        header = container.Header.read(f)
+        offsets, _ = container.scan_frames(f, header, N_CHUNKS + 1)
+        f.truncate(offsets[-1])
+    report = cipher.verify_file(p_encrypted)
+    assert report.bad_chunk == N_CHUNKS
+    assert report.chunk_count == N_CHUNKS
+    assert "truncated" in report.error
+
+
+def test_verify_legacy_file(tmp_path):
+    cipher = new_cipher()
+    p = Path(tmp_path, "data.bin")
+    p.write_bytes(os.urandom(300 * KB))
+    p_encrypted = Path(tmp_path, "encrypted.bin")
+    files.transform(
+        p, p_encrypted, converter=cipher.encrypt, chunksize=cipher._encrypt_chunk_size
+    )
+    report = cipher.verify_file(p_encrypted)
+    assert report.ok
+    assert report.chunk_count == 5
+    assert new_cipher("AnotherPassword").verify_file(p_encrypted).bad_chunk == 0
+
+
+def test_verify_asymmetric_file(tmp_path):
+    A_pubkey, A_privkey = AsymmetricCipher.new_keys(engine="x25519")
+    B_pubkey, B_privkey = AsymmetricCipher.new_keys(engine="x25519")
+    A = AsymmetricCipher(A_pubkey, A_privkey, B_pubkey, engine="x25519")
+    B = AsymmetricCipher(B_pubkey, B_privkey, A_pubkey, engine="x25519")
+    p_encrypted = encrypt(A, tmp_path)
+    assert B.verify_file(p_encrypted).ok
+
+    # not signed by B, the key block is rejected
+    report = A.verify_file(p_encrypted)
+    assert report.bad_chunk is None
+    assert "SignatureError" in report.error
+
+    # another cipher
+    report = new_cipher().verify_file(p_encrypted)
+    assert report.bad_chunk is None
+    assert "FileFormatError" in report.error
+
+
+@pytest.mark.parametrize("use_process", [True, False])
+def test_verify_dir(tmp_path, use_process):
+    cipher = new_cipher()
+    dir_encrypted = Path(tmp_path, "encrypted")
+    cipher.encrypt_dir(
+        dir_original, dir_encrypted, incremental=True, enable_verbose=False
+    )
+    before = sorted(p.abspath for p in dir_encrypted.select_file())
+
+    report = cipher.verify_dir(dir_encrypted, workers=2, use_process=use_process)
+    assert report.ok
+    assert len(report.reports) == len(before) - 1  # the manifest is skipped
+    assert report.total_size > 0
+    sizes = [res.size for res in report.reports]
+    assert sizes == sorted(sizes, reverse=True)
+    assert sorted(p.abspath for p in dir_encrypted.select_file()) == before
+
+    # the work files of an output are skipped, a user file with the suffix
+    # is not
+    p_any = Path(report.reports[0].path)
+    files.get_part_path(p_any).write_bytes(b"partial")
+    p_user = dir_encrypted.joinpath("notes" + files.PART_SUFFIX)
+    p_user.write_bytes(b"notes")
+    failed = cipher.verify_dir(dir_encrypted, workers=1).failed
+    assert [res.path for res in failed] == [p_user.abspath]
+    files.get_part_path(p_any).remove()
+    p_user.remove()
+
+    p = Path(max([res.path for res in report.reports], key=os.path.getsize))
+    flip_byte(p, p.size // 2)
+    report = cipher.verify_dir(dir_encrypted, workers=1)
+    assert [res.path for res in report.failed] == [p.abspath]
+    assert report.failed[0].bad_chunk == 0
+
+
+if __name__ == "__main__":
+    from windtalker.tests import run_cov_test
+
+    run_cov_test(__file__, "windtalker.verify", preview=False)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""
+Asyncio support.
+
+All the crypto work is blocking, it runs on an executor so it doesn't block
+the event loop. The number of concurrent jobs is bounded by a semaphore, so
+a burst of requests doesn't queue up unlimited work on the executor.
+
+Usage::
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> from windtalker import aio
+    >>> aio.configure(executor=ThreadPoolExecutor(8), max_concurrency=8)
+    >>> await cipher.aencrypt_file("data.json")
+    >>> await aio.encrypt_stream(cipher, reader, writer)
+"""
+
+import typing as T
+import io
+import asyncio
+import weakref
+import functools
+from concurrent.futures import Executor
+
+from . import container
+from .exc import FileFormatError
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .cipher import BaseCipher
+
+
+class AsyncRunner:
+    """
+    Run blocking functions on an executor with bounded concurrency.
+
+    :param executor: the executor to use, None means the event loop's
+      default executor
+    :param max_concurrency: max number of jobs running at the same time
+      per event loop, None means no limit
+    """
+
+    def __init__(
+        self,
+        executor: T.Optional[Executor] = None,
+        max_concurrency: T.Optional[int] = None,
+    ):
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        # a semaphore can only be used in one event loop
+        self._semaphores: T.MutableMapping[
+            asyncio.AbstractEventLoop, asyncio.Semaphore
+        ] = weakref.WeakKeyDictionary()
+
+    def _get_semaphore(
+        self,
+        loop: asyncio.AbstractEventLoop,
+    ) -> T.Optional[asyncio.Semaphore]:
+        if self.max_concurrency is None:
+            return None
+        try:
+            return self._semaphores[loop]
+        except KeyError:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+            return semaphore
+
+    async def run(self, func: T.Callable, *args, **kwargs):
+        """
+        Run ``func(*args, **kwargs)`` on the executor and return the result.
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        semaphore = self._get_semaphore(loop)
+        if semaphore is None:
+            return await loop.run_in_executor(self.executor, call)
+        async with semaphore:
+            return await loop.run_in_executor(self.executor, call)
+
+
+default_runner = AsyncRunner()
+
+
+def configure(
+    executor: T.Optional[Executor] = None,
+    max_concurrency: T.Optional[int] = None,
+) -> AsyncRunner:
+    """
+    Replace the default :class:`AsyncRunner` used by all the async methods.
+    """
+    global default_runner
+    default_runner = AsyncRunner(executor=executor, max_concurrency=max_concurrency)
+    return default_runner
+
+
+def get_runner(runner: T.Optional[AsyncRunner] = None) -> AsyncRunner:
+    if runner is None:
+        return default_runner
+    return runner
+
+
+async def _read_chunk(reader: asyncio.StreamReader, n: int) -> bytes:
+    """
+    Read exactly n bytes, or less if EOF.
+    """
+    try:
+        return await reader.readexactly(n)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+
+async def encrypt_stream(
+    cipher: "BaseCipher",
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    chunk_size: T.Optional[int] = None,
+    runner: T.Optional[AsyncRunner] = None,
+):
+    """
+    Read plain data from ``reader`` until EOF, write container format
+    encrypted data to ``writer``. The writer is not closed.
+
+    :param chunk_size: plain data chunk size, default is the cipher's
+    """
+    runner = get_runner(runner)
+    if chunk_size is None:
+        chunk_size = cipher._get_chunk_size()
+    key_block, encrypt_frame = cipher._begin_encrypt(
+        container.new_header(cipher_id=cipher._cipher_id, chunk_size=chunk_size)
+    )
+    # the stream writer is not seekable, the header is written once
+    container_writer = container.ContainerWriter(
+        writer,
+        cipher_id=cipher._cipher_id,
+        chunk_size=chunk_size,
+        key_block=key_block,
+    )
+    while 1:
+        chunk = await _read_chunk(reader, chunk_size)
+        if not chunk:
+            break
+        token = await runner.run(
+            encrypt_frame,
+            chunk,
+            container_writer.header.frame_aad(container_writer.chunk_count),
+        )
+        container_writer.write_frame(token, len(chunk))
+        await writer.drain()
+    container_writer.finish(encrypt_frame)
+    await writer.drain()
+
+
+async def _read_header(reader: asyncio.StreamReader) -> container.Header:
+    data = b""
+    size = container.header_size(data)
+    while len(data) < size:
+        more = await _read_chunk(reader, size - len(data))
+        if not more:
+            break  # Header.read raises
+        data += more
+        size = container.header_size(data)
+    return container.Header.read(io.BytesIO(data))
+
+
+async def _read_frame_length(
+    reader: asyncio.StreamReader,
+    required: bool,
+) -> T.Optional[int]:
+    """
+    Read the length prefix of the next frame, None if EOF and the frame is
+    not ``required``.
+    """
+    data = await _read_chunk(reader, container.FRAME_LENGTH_SIZE)
+    if not data and not required:
+        return None
+    if len(data) < container.FRAME_LENGTH_SIZE:
+        raise FileFormatError("file is truncated!")
+    return container.unpack_frame_length(data)
+
+
+async def _read_frame(reader: asyncio.StreamReader, length: int) -> bytes:
+    frame = await _read_chunk(reader, length)
+    if len(frame) < length:
+        raise FileFormatError("file is truncated!")
+    return frame
+
+
+async def decrypt_stream(
+    cipher: "BaseCipher",
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    runner: T.Optional[AsyncRunner] = None,
+) -> container.Header:
+    """
+    Read container format encrypted data from ``reader``, write plain data to
+    ``writer``. The writer is not closed.
+
+    :return: the header
+    """
+    runner = get_runner(runner)
+    header = await _read_header(reader)
+    container.check_cipher_id(header, cipher._cipher_id)
+    decrypt_end_frame = cipher._begin_decrypt(header)
+    decrypt_frame = header.wrap_decrypt_frame(decrypt_end_frame)
+    has_marker = header.has_index or header.has_end_frame
+    plaintext_length = 0
+    chunk_count = 0
+    end_frame = None
+    while 1:
+        length = await _read_frame_length(reader, has_marker)
+        if length is None:  # EOF of a version 1 file
+            break
+        if has_marker and length == 0:
+            if header.has_end_frame:
+                length = await _read_frame_length(reader, True)
+                frame = await _read_frame(reader, length)
+                end_frame = await runner.run(
+                    decrypt_end_frame,
+                    frame,
+                    header.frame_aad(chunk_count, final=True),
+                )
+            # skip the index footer, one chunk at a time
+            while await reader.read(header.chunk_size):
+                pass
+            break
+        frame = await _read_frame(reader, length)
+        content = await runner.run(decrypt_frame, frame, header.frame_aad(chunk_count))
+        writer.write(content)
+        await writer.drain()
+        plaintext_length += len(content)
+        chunk_count += 1
+    container.check_end_frame(header, end_frame, plaintext_length, chunk_count)
+    return header
@@ -1,5 +1,39 @@
 # -*- coding: utf-8 -*-
 
-from .cipher import BaseCipher
-from .asymmetric import AsymmetricCipher
-from .symmetric import SymmetricCipher
+"""
+The public API. The names are imported on first access (PEP 562), so
+``from windtalker.api import SymmetricCipher`` doesn't import ``rsa`` and
+the asymmetric engines.
+"""
+
+import typing as T
+import importlib
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .cipher import BaseCipher
+    from .asymmetric import AsymmetricCipher
+    from .symmetric import SymmetricCipher
+    from .container import inspect_file
+
+_name_to_module = {
+    "BaseCipher": ".cipher",
+    "AsymmetricCipher": ".asymmetric",
+    "SymmetricCipher": ".symmetric",
+    "inspect_file": ".container",
+}
+
+__all__ = list(_name_to_module)
+
+
+def __getattr__(name: str) -> T.Any:
+    try:
+        module_name = _name_to_module[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __package__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> T.List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+"""
+Pack a directory into a single encrypted archive file.
+
+The archive is one container format file (see :mod:`windtalker.container`)
+written with the chunk index footer. The plain data inside is a sequence of
+member records, an end record, a member index and a trailer::
+
+    member record = kind (u8) | path length (u16) | size (u64) | path | data
+    end record    = kind 0xFF | 0 | 0
+    member index  = one entry per member:
+                    kind (u8) | path length (u16) | offset (u64) | size (u64) | path
+    trailer       = index offset (u64) | b"WTKA"
+
+``offset`` is the position of the member data in the plain data. Because the
+container file has a chunk index, a single member can be read by decrypting
+only the chunks covering it, see :func:`read_member`, it returns a
+readable file object that decrypts one chunk at a time.
+
+Many small files become a few large sequential writes of full chunks, and
+only one chunk of data is in memory at a time.
+"""
+
+import typing as T
+import io
+import os
+import struct
+import dataclasses
+
+from pathlib_mate import Path
+
+from .exc import FileFormatError
+from .container import Header, inspect_file, read_range
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .cipher import BaseCipher
+    from .stream import EncryptingWriter, DecryptingReader
+
+KIND_FILE = 0
+KIND_DIR = 1
+KIND_END = 0xFF
+
+ARCHIVE_MAGIC = b"WTKA"
+
+_record = struct.Struct(">BHQ")
+_index_entry = struct.Struct(">BHQQ")
+_trailer = struct.Struct(">Q4s")
+
+COPY_BUFSIZE = 1024 * 1024
+
+
+@dataclasses.dataclass
+class Member:
+    """
+    An archive member.
+
+    :param path: relative path with ``/``
+    :param kind: :data:`KIND_FILE` or :data:`KIND_DIR`
+    :param offset: position of the member data in the plain data
+    :param size: file size, 0 for dir
+    """
+
+    path: str
+    kind: int
+    offset: int
+    size: int
+
+    @property
+    def is_dir(self) -> bool:
+        return self.kind == KIND_DIR
+
+
+def _check_member_path(path: str):
+    """
+    Don't let a crafted archive write outside the output directory.
+    """
+    parts = path.split("/")
+    if path.startswith("/") or ".." in parts or "\\" in path or not path:
+        raise FileFormatError(f"invalid archive member path {path!r}")
+
+
+def pack_dir(writer: "EncryptingWriter", src: Path) -> T.List[Member]:
+    """
+    Write all the files and sub directories in ``src`` to the writer.
+    The writer is not closed.
+
+    :return: the list of members
+    """
+    members = list()
+    position = 0
+
+    def write_record(kind: int, relpath: str, size: int) -> Member:
+        nonlocal position
+        b_path = relpath.encode("utf-8")
+        writer.write(_record.pack(kind, len(b_path), size))
+        writer.write(b_path)
+        position += _record.size + len(b_path)
+        member = Member(path=relpath, kind=kind, offset=position, size=size)
+        members.append(member)
+        return member
+
+    root = src.abspath
+    for current_dir, dir_list, file_list in os.walk(root):
+        dir_list.sort()
+        file_list.sort()
+        rel_dir = os.path.relpath(current_dir, root).replace(os.sep, "/")
+        if rel_dir != ".":
+            write_record(KIND_DIR, rel_dir, 0)
+        for basename in file_list:
+            relpath = basename if rel_dir == "." else f"{rel_dir}/{basename}"
+            with open(os.path.join(current_dir, basename), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                write_record(KIND_FILE, relpath, size)
+                copied = _copy(f, writer, size)
+                if copied != size:
+                    raise RuntimeError(f"{relpath!r} changed while reading")
+                position += size
+
+    writer.write(_record.pack(KIND_END, 0, 0))
+    index_offset = position + _record.size
+    for member in members:
+        b_path = member.path.encode("utf-8")
+        writer.write(
+            _index_entry.pack(member.kind, len(b_path), member.offset, member.size)
+        )
+        writer.write(b_path)
+    writer.write(_trailer.pack(index_offset, ARCHIVE_MAGIC))
+    return members
+
+
+def _copy(f_input, f_output, size: int) -> int:
+    """
+    Copy at most ``size`` bytes, return the number of bytes copied.
+    """
+    copied = 0
+    while copied < size:
+        data = f_input.read(min(COPY_BUFSIZE, size - copied))
+        if not data:
+            break
+        f_output.write(data)
+        copied += len(data)
+    return copied
+
+
+def _read_exactly(f, n: int) -> bytes:
+    data = f.read(n)
+    if len(data) < n:
+        raise FileFormatError("archive is truncated!")
+    return data
+
+
+def unpack_dir(reader: "DecryptingReader", dst: Path) -> T.List[Member]:
+    """
+    Read the members from the reader and write them to ``dst``.
+    It stops at the end record, the member index is not needed.
+
+    :return: the list of members
+    """
+    dst.mkdir_if_not_exists()
+    members = list()
+    position = 0
+    while 1:
+        kind, path_length, size = _record.unpack(_read_exactly(reader, _record.size))
+        position += _record.size
+        if kind == KIND_END:
+            break
+        relpath = _read_exactly(reader, path_length).decode("utf-8")
+        position += path_length
+        _check_member_path(relpath)
+        members.append(Member(path=relpath, kind=kind, offset=position, size=size))
+        p = dst.joinpath(relpath)
+        if kind == KIND_DIR:
+            p.mkdir_if_not_exists()
+        elif kind == KIND_FILE:
+            p.parent.mkdir_if_not_exists()
+            with p.open("wb") as f:
+                if _copy(reader, f, size) != size:
+                    raise FileFormatError("archive is truncated!")
+            position += size
+        else:
+            raise FileFormatError(f"unknown archive member kind {kind}")
+    return members
+
+
+def read_index(cipher: "BaseCipher", path: Path) -> T.List[Member]:
+    """
+    Read the member index of an archive, without decrypting the members.
+    """
+    plaintext_length = inspect_file(path).plaintext_length
+    trailer = cipher.decrypt_range(
+        path, plaintext_length - _trailer.size, _trailer.size
+    )
+    if len(trailer) != _trailer.size:
+        raise FileFormatError("archive is truncated!")
+    index_offset, magic = _trailer.unpack(trailer)
+    if magic != ARCHIVE_MAGIC:
+        raise FileFormatError(f"'{path}' is not a windtalker archive!")
+    data = cipher.decrypt_range(
+        path, index_offset, plaintext_length - _trailer.size - index_offset
+    )
+    members = list()
+    view = memoryview(data)
+    i = 0
+    while i < len(data):
+        kind, path_length, offset, size = _index_entry.unpack_from(view, i)
+        i += _index_entry.size
+        relpath = bytes(view[i : i + path_length]).decode("utf-8")
+        i += path_length
+        members.append(Member(path=relpath, kind=kind, offset=offset, size=size))
+    return members
+
+
+class MemberReader(io.RawIOBase):
+    """
+    A readable binary file object of one file member. It decrypts the
+    chunks covering the member one at a time with
+    :func:`~windtalker.container.read_range`, so only one decrypted chunk is
+    in memory.
+
+    :param cipher: the cipher object
+    :param path: path of the encrypted archive file
+    :param member: the file member
+    """
+
+    def __init__(self, cipher: "BaseCipher", path: Path, member: Member):
+        self.member = member
+        self._f = path.open("rb")
+        try:
+            self._header = Header.read(self._f)
+            self._decrypt_frame = cipher._begin_decrypt(self._header)
+        except Exception:
+            self._f.close()
+            raise
+        self._cipher_id = cipher._cipher_id
+        self._buffer = b""
+        self._pos = 0
+        self._done = 0  # bytes of the member in the previous buffers
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self) -> bool:
+        """
+        Decrypt the rest of the current chunk into the buffer, return False
+        if EOF.
+        """
+        self._done += len(self._buffer)
+        remaining = self.member.size - self._done
+        if remaining <= 0:
+            self._buffer = b""
+            return False
+        start = self.member.offset + self._done
+        chunk_size = self._header.chunk_size
+        length = min(chunk_size - start % chunk_size, remaining)
+        self._f.seek(0)
+        data = read_range(
+            self._f,
+            decrypt_frame=self._decrypt_frame,
+            start=start,
+            length=length,
+            cipher_id=self._cipher_id,
+        )
+        if len(data) != length:
+            raise FileFormatError("archive is truncated!")
+        self._buffer = data
+        self._pos = 0
+        return True
+
+    def readinto(self, b) -> int:
+        if self.closed:
+            raise ValueError("read from closed file")
+        if self._pos >= len(self._buffer):
+            if not self._fill():
+                return 0
+        n = min(len(b), len(self._buffer) - self._pos)
+        b[:n] = self._buffer[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._f.close()
+        finally:
+            super().close()
+
+
+def read_member(
+    cipher: "BaseCipher", path: Path, member: T.Union[str, Member]
+) -> MemberReader:
+    """
+    Open one file member of an archive for reading. Only the chunks covering
+    the member (and the index) are decrypted, one at a time.
+
+    :return: a readable binary file object, close it after use
+    """
+    if isinstance(member, str):
+        mapper = {m.path: m for m in read_index(cipher, path)}
+        try:
+            member = mapper[member]
+        except KeyError:
+            raise KeyError(f"member {member!r} not found in '{path}'")
+    if member.is_dir:
+        raise IsADirectoryError(member.path)
+    return MemberReader(cipher, path, member)
@@ -7,15 +7,64 @@
 """
 
 import typing as T
+import os
+import hmac
+import base64
+import struct
+import hashlib
+import itertools
+import dataclasses
+from concurrent.futures import ProcessPoolExecutor
 
-import rsa
-
+from . import files
 from .cipher import BaseCipher
+from .symmetric import SymmetricCipher, frame_size
+from .container import Header, FLAG_KEY_BLOCK
+from .engines import Engine, get_engine
+from .exc import PasswordError, SignatureError, FileFormatError
+
+_key_block_part_length = struct.Struct(">H")
+
+
+def _signed_message(header: Header, wrapped_key: bytes) -> bytes:
+    """
+    The message signed in the key block: the packed header with the counts
+    unknown and without the key block data, then the wrapped session key.
+    Before container version 3, only the wrapped key is signed.
+    """
+    if header.version < 3:
+        return wrapped_key
+    static_header = dataclasses.replace(
+        header,
+        flags=header.flags | FLAG_KEY_BLOCK,
+        plaintext_length=None,
+        chunk_count=None,
+        key_block=b"",
+    )
+    return static_header.pack() + wrapped_key
+
+
+def _run_batch(
+    cipher: "AsymmetricCipher",
+    method: str,
+    batch: T.List[tuple],
+    kwargs: dict,
+) -> list:
+    func = getattr(cipher, method)
+    return [func(*args, **kwargs) for args in batch]
+
+
+# the cipher object rebuilt in each worker process
+_worker_cipher: T.Optional["AsymmetricCipher"] = None
+
 
-ERROR_MESSAGE = (
-    "Asymmetric Encryption is for safely transfer secret key only! "
-    "It is not suitable for file encryption!"
-)
+def _init_worker(cipher_class: T.Type["AsymmetricCipher"], key_material: dict):
+    global _worker_cipher
+    _worker_cipher = cipher_class.from_key_material(key_material)
+
+
+def _run_batch_in_worker(method: str, batch: T.List[tuple], kwargs: dict) -> list:
+    return _run_batch(_worker_cipher, method, batch, kwargs)
 
 
 class AsymmetricCipher(BaseCipher):
@@ -26,35 +75,93 @@ class AsymmetricCipher(BaseCipher):
     :param my_pubkey: your public key
     :param my_privkey: your private key
     :param his_pubkey: other's public key you use to encrypt message
+    :param engine: the engine name or object, default is the pure Python
+      ``rsa`` engine, see :mod:`windtalker.engines`
+
+    File and directory encryption is hybrid: each file has a random session
+    key, the data is encrypted with :class:`~windtalker.symmetric.SymmetricCipher`
+    by the session key, only the session key is encrypted by ``his_pubkey``
+    and signed by ``my_privkey``. The wrapped session key and the signature
+    are stored in the header of the container format file (see
+    :mod:`windtalker.container`). To decrypt a file, you need ``my_privkey``
+    and the sender's public key as ``his_pubkey``.
 
     **中文文档**
 
     非对称加密器. 主要用于加密少量信息. 通常用于安全地交换秘钥, 然后用该秘钥作为对称加密
     的钥匙对大量数据进行加密.
+
+    加密文件时, 每个文件随机生成一个对称加密的秘钥, 用它加密数据, 然后只用对方的公钥
+    加密这个秘钥, 并用自己的私钥签名, 一起保存在文件头中. 所以加密速度和对称加密一样.
     """
 
-    # key length/max length msg, 512/53, 1024/117, 2045/245
-    _encrypt_chunk_size = 53
-    _decrypt_chunk_size = 53
+    # the file data is encrypted by SymmetricCipher, so is the chunk policy
+    _chunk_policy = SymmetricCipher._chunk_policy
+    _encrypt_chunk_size = SymmetricCipher._encrypt_chunk_size
+    _decrypt_chunk_size = SymmetricCipher._decrypt_chunk_size
+    _sign_method = "SHA-256"
 
     def __init__(
         self,
         my_pubkey,
         my_privkey,
         his_pubkey,
+        engine: T.Optional[T.Union[str, Engine]] = None,
     ):
         self.my_pubkey = my_pubkey
         self.my_privkey = my_privkey
         self.his_pubkey = his_pubkey
+        self.engine = get_engine(engine)
+        # convert the keys once, not on every call
+        self._my_privkey = self.engine.to_private_key(my_privkey)
+        self._his_pubkey = self.engine.to_public_key(his_pubkey)
         self.sign = None
         self.password = None
 
+    @property
+    def _cipher_id(self) -> int:
+        return self.engine.cipher_id
+
+    def to_key_material(self) -> dict:
+        engine = self.engine
+
+        def dump(func, key):
+            return None if key is None else func(key)
+
+        return {
+            "engine": engine.name,
+            "my_pubkey": dump(engine.dump_public_key, self.my_pubkey),
+            "my_privkey": dump(engine.dump_private_key, self.my_privkey),
+            "his_pubkey": dump(engine.dump_public_key, self.his_pubkey),
+        }
+
+    @classmethod
+    def from_key_material(cls, key_material: dict) -> "AsymmetricCipher":
+        engine = get_engine(key_material["engine"])
+
+        def load(func, data):
+            return None if data is None else func(data)
+
+        return cls(
+            my_pubkey=load(engine.load_public_key, key_material["my_pubkey"]),
+            my_privkey=load(engine.load_private_key, key_material["my_privkey"]),
+            his_pubkey=load(engine.load_public_key, key_material["his_pubkey"]),
+            engine=engine,
+        )
+
     @staticmethod
-    def new_keys(nbits=1024):
+    def new_keys(
+        nbits: T.Optional[int] = None,
+        engine: T.Optional[T.Union[str, Engine]] = None,
+    ):
         """
         Create a new pair of public and private key pair to use.
+
+        :param nbits: RSA key size, default is 1024 for the ``rsa`` engine
+          and 2048 for the ``cryptography`` engine
+        :param engine: see :mod:`windtalker.engines`
         """
-        public_key, private_key = rsa.newkeys(nbits, poolsize=1)
+        public_key, private_key = get_engine(engine).new_keys(nbits)
         return public_key, private_key
 
     newkeys = new_keys  # for backward compatibility
@@ -70,17 +177,22 @@ class AsymmetricCipher(BaseCipher):
         """
         Encrypt binary data.
 
-        :param sing_method: one of 'MD5', 'SHA-1', 'SHA-224', SHA-256',
-            'SHA-384' or 'SHA-512'
+        :param sign_method: one of 'SHA-1', 'SHA-224', 'SHA-256', 'SHA-384'
+            or 'SHA-512', the ``rsa`` engine also accepts 'MD5'
+
+        The signature is stored in ``self.sign``, so a cipher shared by many
+        threads may read another caller's signature, use
+        :meth:`AsymmetricCipher.encrypt_and_sign` instead.
 
         **中文文档**
 
         - 发送消息时只需要对方的 public_key
         - 如需使用签名, 则双方都需要持有对方的 public_key
         """
-        token = rsa.encrypt(binary, self.his_pubkey)  # encrypt it
         if use_sign:
-            self.sign = rsa.sign(binary, self.my_privkey, sign_method)  # sign it
+            token, self.sign = self.encrypt_and_sign(binary, sign_method)
+        else:
+            token = self.engine.encrypt(binary, self._his_pubkey)
         return token
 
     def decrypt(
@@ -98,19 +210,261 @@ class AsymmetricCipher(BaseCipher):
         - 接收消息时只需要自己的 private_key
         - 如需使用签名, 则双方都需要持有对方的 public_key
         """
-        binary = rsa.decrypt(token, self.my_privkey)
+        binary = self.engine.decrypt(token, self._my_privkey)
         if signature:
-            rsa.verify(binary, signature, self.his_pubkey)
+            self.verify_binary(binary, signature)
+        return binary
+
+    def sign_binary(self, binary: bytes, sign_method: str = "SHA-256") -> bytes:
+        """
+        Sign binary data with ``my_privkey``.
+        """
+        return self.engine.sign(binary, self._my_privkey, sign_method)
+
+    def verify_binary(
+        self,
+        binary: bytes,
+        signature: bytes,
+        sign_method: str = "SHA-256",
+    ):
+        """
+        Verify the signature with ``his_pubkey``, raise
+        :class:`~windtalker.exc.SignatureError` if it is invalid.
+        """
+        self.engine.verify(binary, signature, self._his_pubkey, sign_method)
+
+    def _is_valid_signature(
+        self,
+        binary: bytes,
+        signature: bytes,
+        sign_method: str = "SHA-256",
+    ) -> bool:
+        try:
+            self.verify_binary(binary, signature, sign_method)
+            return True
+        except SignatureError:
+            return False
+
+    def encrypt_and_sign(
+        self,
+        binary: bytes,
+        sign_method: str = "SHA-256",
+    ) -> T.Tuple[bytes, bytes]:
+        """
+        Encrypt binary data with ``his_pubkey`` and sign it with
+        ``my_privkey``. It doesn't change the cipher object, so it is safe to
+        share one cipher between threads.
+
+        :return: a tuple of (token, signature)
+        """
+        token = self.engine.encrypt(binary, self._his_pubkey)
+        return token, self.sign_binary(binary, sign_method)
+
+    def decrypt_and_verify(
+        self,
+        token: bytes,
+        signature: bytes,
+        sign_method: str = "SHA-256",
+    ) -> bytes:
+        """
+        Reverse of :meth:`AsymmetricCipher.encrypt_and_sign`, raise
+        :class:`~windtalker.exc.SignatureError` if the signature is invalid.
+        """
+        binary = self.engine.decrypt(token, self._my_privkey)
+        self.verify_binary(binary, signature, sign_method)
         return binary
 
-    def encrypt_file(self, **kwargs):  # pragma: no cover
-        raise NotImplementedError(ERROR_MESSAGE)
+    def _get_batch_encrypt(self) -> T.Callable[[bytes], bytes]:
+        # encrypt() stores the signature in self.sign, it is not thread safe,
+        # use encrypt_many to get the signatures
+        return lambda binary: self.encrypt_and_sign(binary)[0]
+
+    def _get_hash_key(self) -> bytes:
+        if self.my_privkey is None:
+            raise ValueError("the content hash requires my private key!")
+        key = self.engine.dump_private_key(self._my_privkey)
+        return hmac.new(key, b"windtalker content hash", hashlib.sha256).digest()
+
+    def _map_batches(
+        self,
+        method: str,
+        args_list: T.Iterable[tuple],
+        kwargs: dict,
+        workers: T.Optional[int],
+        batch_size: int,
+        use_process: bool,
+    ) -> list:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        batches = files.iter_batches(args_list, batch_size)
+        if workers <= 1:
+            results = [_run_batch(self, method, batch, kwargs) for batch in batches]
+        elif use_process:
+            # executor.map would submit all the batches at once, the threads
+            # of imap_ordered only keep ``workers`` batches in flight
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(self.__class__, self.to_key_material()),
+            ) as executor:
+                results = list(
+                    files.imap_ordered(
+                        lambda batch: executor.submit(
+                            _run_batch_in_worker, method, batch, kwargs
+                        ).result(),
+                        batches,
+                        workers=workers,
+                    )
+                )
+        else:
+            results = list(
+                files.imap_ordered(
+                    lambda batch: _run_batch(self, method, batch, kwargs),
+                    batches,
+                    workers=workers,
+                )
+            )
+        return list(itertools.chain.from_iterable(results))
+
+    def sign_many(
+        self,
+        binaries: T.Iterable[bytes],
+        sign_method: str = "SHA-256",
+        workers: T.Optional[int] = None,
+        batch_size: int = 100,
+        use_process: bool = True,
+    ) -> T.List[bytes]:
+        """
+        Sign many binary data, the results are in the same order.
+
+        :param workers: number of workers, default is the number of CPU
+          cores, if 1, run in the current thread
+        :param batch_size: number of items sent to a worker at once
+        :param use_process: if True, use process pool, each worker rebuilds
+          the cipher from :meth:`AsymmetricCipher.to_key_material`. The pure
+          Python ``rsa`` engine holds the GIL, so threads don't help it.
+          Otherwise use thread pool, the ``cryptography`` based engines
+          release the GIL.
+        """
+        return self._map_batches(
+            "sign_binary",
+            ((binary,) for binary in binaries),
+            dict(sign_method=sign_method),
+            workers,
+            batch_size,
+            use_process,
+        )
+
+    def verify_many(
+        self,
+        binaries: T.Iterable[bytes],
+        signatures: T.Iterable[bytes],
+        sign_method: str = "SHA-256",
+        workers: T.Optional[int] = None,
+        batch_size: int = 100,
+        use_process: bool = True,
+    ) -> T.List[bool]:
+        """
+        Verify many signatures, see :meth:`AsymmetricCipher.sign_many`.
+
+        :return: a list of bool, True if the signature is valid
+        """
+        return self._map_batches(
+            "_is_valid_signature",
+            zip(binaries, signatures),
+            dict(sign_method=sign_method),
+            workers,
+            batch_size,
+            use_process,
+        )
+
+    def encrypt_many(
+        self,
+        binaries: T.Iterable[bytes],
+        sign_method: str = "SHA-256",
+        workers: T.Optional[int] = None,
+        batch_size: int = 100,
+        use_process: bool = True,
+    ) -> T.List[T.Tuple[bytes, bytes]]:
+        """
+        Encrypt and sign many binary data, see
+        :meth:`AsymmetricCipher.sign_many`.
+
+        :return: a list of (token, signature)
+        """
+        return self._map_batches(
+            "encrypt_and_sign",
+            ((binary,) for binary in binaries),
+            dict(sign_method=sign_method),
+            workers,
+            batch_size,
+            use_process,
+        )
+
+    def _begin_encrypt(
+        self,
+        header: Header,
+    ) -> T.Tuple[bytes, T.Callable[[bytes, bytes], bytes]]:
+        """
+        Create a random session key, the key block is::
+
+            wrapped key length (u16) | wrapped key | signature length (u16) | signature
+
+        The signature covers the header and the wrapped key. The counts are
+        not known yet, they are authenticated by the end frame instead, see
+        :mod:`windtalker.container`.
+        """
+        session_key = os.urandom(32)
+        wrapped_key = self.engine.encrypt(session_key, self._his_pubkey)
+        signature = self.sign_binary(
+            _signed_message(header, wrapped_key), self._sign_method
+        )
+        key_block = b"".join(
+            [
+                _key_block_part_length.pack(len(wrapped_key)),
+                wrapped_key,
+                _key_block_part_length.pack(len(signature)),
+                signature,
+            ]
+        )
+        session = SymmetricCipher.from_fernet_key(base64.urlsafe_b64encode(session_key))
+        return key_block, session._encrypt_frame
+
+    def _open_session(self, header: Header) -> SymmetricCipher:
+        """
+        Check the signature of the key block and unwrap the session key.
+        """
+        parts = list()
+        data = header.key_block
+        for _ in range(2):
+            if len(data) < _key_block_part_length.size:
+                raise FileFormatError("key block is corrupted!")
+            (length,) = _key_block_part_length.unpack_from(data)
+            part = data[
+                _key_block_part_length.size : _key_block_part_length.size + length
+            ]
+            if len(part) < length:
+                raise FileFormatError("key block is corrupted!")
+            parts.append(part)
+            data = data[_key_block_part_length.size + length :]
+        wrapped_key, signature = parts
+        try:
+            self.verify_binary(
+                _signed_message(header, wrapped_key), signature, self._sign_method
+            )
+        except SignatureError:
+            raise SignatureError("the file is not signed by his_pubkey!")
+        try:
+            session_key = self.engine.decrypt(wrapped_key, self._my_privkey)
+        except PasswordError:
+            raise PasswordError("the file is not encrypted for my_pubkey!")
+        return SymmetricCipher.from_fernet_key(base64.urlsafe_b64encode(session_key))
 
-    def decrypt_file(self, **kwargs):  # pragma: no cover
-        raise NotImplementedError(ERROR_MESSAGE)
+    def _begin_decrypt(self, header: Header) -> T.Callable[[bytes, bytes], bytes]:
+        return self._open_session(header)._decrypt_frame
 
-    def encrypt_dir(self, **kwargs):  # pragma: no cover
-        raise NotImplementedError(ERROR_MESSAGE)
+    def _begin_verify(self, header: Header) -> T.Callable[[bytes, bytes], T.Any]:
+        return self._open_session(header)._verify_frame
 
-    def decrypt_dir(self, **kwargs):  # pragma: no cover
-        raise NotImplementedError(ERROR_MESSAGE)
+    def _frame_size(self, plaintext_length: int) -> int:
+        return frame_size(plaintext_length)
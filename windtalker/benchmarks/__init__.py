@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""
+Performance benchmarks.
+
+Run all the suites and save a json report::
+
+    python -m windtalker.benchmarks --output report.json
+
+Compare with a baseline report, the exit code is 1 if any case is more than
+10% slower::
+
+    python -m windtalker.benchmarks --output new.json --baseline report.json
+
+Use ``--quick`` for a smoke run and ``--suite`` to select suites, see
+``python -m windtalker.benchmarks --help``.
+"""
+
+from .core import (
+    Result,
+    measure,
+    make_report,
+    dump_report,
+    load_report,
+    Comparison,
+    compare,
+    find_regressions,
+)
+from .suites import Config, suite_mapper, run
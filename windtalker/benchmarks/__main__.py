@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+
+from .core import make_report, dump_report, load_report, find_regressions
+from .suites import Config, suite_mapper, run
+
+
+def format_result(result) -> str:
+    line = f"{result.id:<60} median {result.median:10.6f}s"
+    if result.ops > 1:
+        line += f"  latency {result.latency * 1000:10.4f}ms"
+    if result.throughput is not None:
+        line += f"  {result.throughput:10.2f}MB/s"
+    return line
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m windtalker.benchmarks",
+        description="Run the windtalker benchmarks.",
+    )
+    parser.add_argument(
+        "--suite",
+        action="append",
+        choices=list(suite_mapper),
+        help="suite to run, can be used multiple times, default is all",
+    )
+    parser.add_argument("--quick", action="store_true", help="use small sizes")
+    parser.add_argument("--repeat", type=int, help="number of timed runs per case")
+    parser.add_argument("--workdir", help="directory for the synthetic files")
+    parser.add_argument("--output", help="write the json report to this file")
+    parser.add_argument("--baseline", help="compare with this json report")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="allowed slowdown compared to the baseline, default is 0.1",
+    )
+    ns = parser.parse_args(args)
+
+    config = Config.quick() if ns.quick else Config()
+    if ns.repeat:
+        config.repeat = ns.repeat
+    results = run(
+        suites=ns.suite,
+        config=config,
+        workdir=ns.workdir,
+        callback=lambda result: print(format_result(result)),
+    )
+    report = make_report(results)
+    if ns.output:
+        dump_report(report, ns.output)
+
+    if ns.baseline:
+        regressions = find_regressions(
+            report, load_report(ns.baseline), tolerance=ns.tolerance
+        )
+        for c in regressions:
+            print(
+                f"REGRESSION {c.id}: {c.baseline:.6f}s -> {c.current:.6f}s "
+                f"({c.ratio:.2f}x)"
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measure, report and compare.
+"""
+
+import typing as T
+import os
+import json
+import time
+import platform
+import statistics
+import dataclasses
+
+from .._version import __version__
+
+REPORT_VERSION = 1
+
+
+@dataclasses.dataclass
+class Result:
+    """
+    The timing of one benchmark case.
+
+    :param name: the benchmark name, like "encrypt_file"
+    :param params: the case parameters, like ``{"chunk_size": 1048576}``
+    :param times: wall clock seconds of each run
+    :param nbytes: number of bytes processed per run, 0 if not applicable
+    :param ops: number of operations per run
+    """
+
+    name: str
+    params: T.Dict[str, T.Any]
+    times: T.List[float]
+    nbytes: int = 0
+    ops: int = 1
+
+    @property
+    def id(self) -> str:
+        """
+        The unique id to match the same case in a baseline report.
+        """
+        if not self.params:
+            return self.name
+        params = ",".join(f"{k}={v}" for k, v in sorted(self.params.items()))
+        return f"{self.name}[{params}]"
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.times)
+
+    @property
+    def latency(self) -> float:
+        """
+        Seconds per operation.
+        """
+        return self.median / self.ops
+
+    @property
+    def throughput(self) -> T.Optional[float]:
+        """
+        MB per second, None if ``nbytes`` is 0.
+        """
+        if not self.nbytes:
+            return None
+        return self.nbytes / self.median / 1024**2
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "params": self.params,
+            "times": self.times,
+            "nbytes": self.nbytes,
+            "ops": self.ops,
+            "min": min(self.times),
+            "median": self.median,
+            "latency": self.latency,
+            "throughput": self.throughput,
+        }
+
+
+def measure(
+    name: str,
+    func: T.Callable[[], T.Any],
+    params: T.Optional[T.Dict[str, T.Any]] = None,
+    nbytes: int = 0,
+    ops: int = 1,
+    repeat: int = 5,
+    warmup: int = 1,
+) -> Result:
+    """
+    Call ``func`` ``warmup`` times, then time it ``repeat`` times with
+    :func:`time.perf_counter`, so the I/O wait is included.
+    """
+    for _ in range(warmup):
+        func()
+    times = list()
+    for _ in range(repeat):
+        st = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - st)
+    return Result(
+        name=name,
+        params=dict(params or {}),
+        times=times,
+        nbytes=nbytes,
+        ops=ops,
+    )
+
+
+def make_report(results: T.List[Result]) -> dict:
+    """
+    Create a json serializable report with the environment information.
+    """
+    return {
+        "version": REPORT_VERSION,
+        "windtalker": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": [result.to_dict() for result in results],
+    }
+
+
+def dump_report(report: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+
+
+def load_report(path: str) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+@dataclasses.dataclass
+class Comparison:
+    """
+    :param ratio: current median / baseline median, > 1 means slower
+    """
+
+    id: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline
+
+    def is_regression(self, tolerance: float) -> bool:
+        return self.ratio > 1 + tolerance
+
+
+def compare(report: dict, baseline: dict) -> T.List[Comparison]:
+    """
+    Compare the median time of the cases in both reports.
+    """
+    baseline_mapper = {res["id"]: res for res in baseline["results"]}
+    comparisons = list()
+    for res in report["results"]:
+        base = baseline_mapper.get(res["id"])
+        if base is None:
+            continue
+        comparisons.append(
+            Comparison(id=res["id"], baseline=base["median"], current=res["median"])
+        )
+    return comparisons
+
+
+def find_regressions(
+    report: dict,
+    baseline: dict,
+    tolerance: float = 0.1,
+) -> T.List[Comparison]:
+    """
+    :param tolerance: a case is a regression if it is more than
+      ``tolerance`` (10% by default) slower than the baseline
+    """
+    return [c for c in compare(report, baseline) if c.is_regression(tolerance)]
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+"""
+The benchmark suites. Each suite takes a :class:`Config` and a work
+directory for the synthetic files, and returns a list of
+:class:`~windtalker.benchmarks.core.Result`.
+"""
+
+import typing as T
+import os
+import sys
+import tempfile
+import subprocess
+import dataclasses
+
+from pathlib_mate import Path
+
+from ..symmetric import SymmetricCipher
+from ..asymmetric import AsymmetricCipher
+from ..engines import engine_mapper
+from .core import Result, measure
+
+MB = 1024**2
+
+
+@dataclasses.dataclass
+class Config:
+    """
+    The benchmark sizes. :meth:`Config.quick` is small enough for a smoke
+    test, the default is large enough to be dominated by the cipher, not the
+    Python overhead.
+    """
+
+    repeat: int = 5
+    text_size: int = 1024
+    text_ops: int = 1000
+    file_size: int = 64 * MB
+    chunk_sizes: T.List[int] = dataclasses.field(
+        default_factory=lambda: [1 * MB, 4 * MB, 8 * MB]
+    )
+    small_files: int = 1000
+    small_file_size: int = 4 * 1024
+    big_files: int = 4
+    big_file_size: int = 16 * MB
+    sign_ops: int = 100
+    engines: T.List[str] = dataclasses.field(
+        default_factory=lambda: list(engine_mapper)
+    )
+    imports: T.List[str] = dataclasses.field(
+        default_factory=lambda: [
+            "import windtalker",
+            "from windtalker.api import SymmetricCipher",
+            "from windtalker.api import AsymmetricCipher",
+            "import windtalker.cli",
+        ]
+    )
+
+    @classmethod
+    def quick(cls) -> "Config":
+        return cls(
+            repeat=2,
+            text_ops=50,
+            file_size=2 * MB,
+            chunk_sizes=[1 * MB],
+            small_files=20,
+            big_files=2,
+            big_file_size=1 * MB,
+            sign_ops=5,
+        )
+
+
+def _new_symmetric_cipher() -> SymmetricCipher:
+    return SymmetricCipher(password="MyPassword")
+
+
+def bench_text(config: Config, workdir: Path) -> T.List[Result]:
+    """
+    ``encrypt_text`` / ``decrypt_text`` latency of small messages.
+    """
+    cipher = _new_symmetric_cipher()
+    text = "x" * config.text_size
+    token = cipher.encrypt_text(text)
+    params = dict(size=config.text_size)
+    kwargs = dict(
+        params=params,
+        nbytes=config.text_size * config.text_ops,
+        ops=config.text_ops,
+        repeat=config.repeat,
+    )
+
+    def encrypt():
+        for _ in range(config.text_ops):
+            cipher.encrypt_text(text)
+
+    def decrypt():
+        for _ in range(config.text_ops):
+            cipher.decrypt_text(token)
+
+    return [
+        measure("encrypt_text", encrypt, **kwargs),
+        measure("decrypt_text", decrypt, **kwargs),
+    ]
+
+
+def bench_file(config: Config, workdir: Path) -> T.List[Result]:
+    """
+    ``encrypt_file`` / ``decrypt_file`` throughput by chunk size and stream
+    mode.
+    """
+    p = Path(workdir, "file.bin")
+    p_encrypted = Path(workdir, "file.bin.encrypted")
+    p_decrypted = Path(workdir, "file.bin.decrypted")
+    p.write_bytes(os.urandom(config.file_size))
+
+    results = list()
+    for chunk_size in config.chunk_sizes:
+        cipher = _new_symmetric_cipher()
+        for stream in [True, False]:
+            params = dict(chunk_size=chunk_size, stream=stream)
+            kwargs = dict(overwrite=True, stream=stream, enable_verbose=False)
+            results.append(
+                measure(
+                    "encrypt_file",
+                    lambda: cipher.encrypt_file(
+                        p, p_encrypted, chunk_size=chunk_size, **kwargs
+                    ),
+                    params=params,
+                    nbytes=config.file_size,
+                    repeat=config.repeat,
+                )
+            )
+            results.append(
+                measure(
+                    "decrypt_file",
+                    lambda: cipher.decrypt_file(p_encrypted, p_decrypted, **kwargs),
+                    params=params,
+                    nbytes=config.file_size,
+                    repeat=config.repeat,
+                )
+            )
+    for path in [p, p_encrypted, p_decrypted]:
+        path.remove_if_exists()
+    return results
+
+
+def _make_tree(dir_root: Path, n_files: int, file_size: int) -> int:
+    """
+    Create ``n_files`` random files in 10 sub directories.
+
+    :return: total size
+    """
+    for i in range(n_files):
+        p = dir_root.joinpath("%02d" % (i % 10), "%06d.bin" % i)
+        p.parent.mkdir_if_not_exists()
+        p.write_bytes(os.urandom(file_size))
+    return n_files * file_size
+
+
+def bench_dir(config: Config, workdir: Path) -> T.List[Result]:
+    """
+    ``encrypt_dir`` and ``encrypt_dir_parallel`` throughput on a tree of many
+    small files and a tree of a few big files.
+    """
+    cipher = _new_symmetric_cipher()
+    results = list()
+    trees = [
+        ("small", config.small_files, config.small_file_size),
+        ("big", config.big_files, config.big_file_size),
+    ]
+    for tree, n_files, file_size in trees:
+        dir_src = Path(workdir, f"tree-{tree}")
+        dir_dst = Path(workdir, f"tree-{tree}-encrypted")
+        total_size = _make_tree(dir_src, n_files, file_size)
+        params = dict(tree=tree, files=n_files)
+        results.append(
+            measure(
+                "encrypt_dir",
+                lambda: cipher.encrypt_dir(
+                    dir_src, dir_dst, overwrite=True, enable_verbose=False
+                ),
+                params=params,
+                nbytes=total_size,
+                ops=n_files,
+                repeat=config.repeat,
+            )
+        )
+        results.append(
+            measure(
+                "encrypt_dir_parallel",
+                lambda: cipher.encrypt_dir_parallel(
+                    dir_src, dir_dst, overwrite=True, enable_verbose=False
+                ),
+                params=params,
+                nbytes=total_size,
+                ops=n_files,
+                repeat=config.repeat,
+            )
+        )
+        dir_src.remove_if_exists()
+        dir_dst.remove_if_exists()
+    return results
+
+
+def bench_asymmetric(config: Config, workdir: Path) -> T.List[Result]:
+    """
+    Sign / verify latency of each engine, see :mod:`windtalker.engines`.
+    """
+    results = list()
+    messages = [os.urandom(64) for _ in range(config.sign_ops)]
+    for engine in config.engines:
+        A_pubkey, A_privkey = AsymmetricCipher.new_keys(engine=engine)
+        cipher = AsymmetricCipher(A_pubkey, A_privkey, A_pubkey, engine=engine)
+        signatures = [cipher.sign_binary(message) for message in messages]
+        params = dict(engine=engine)
+
+        def sign():
+            for message in messages:
+                cipher.sign_binary(message)
+
+        def verify():
+            for message, signature in zip(messages, signatures):
+                cipher.verify_binary(message, signature)
+
+        results.append(
+            measure(
+                "sign",
+                sign,
+                params=params,
+                ops=config.sign_ops,
+                repeat=config.repeat,
+            )
+        )
+        results.append(
+            measure(
+                "verify",
+                verify,
+                params=params,
+                ops=config.sign_ops,
+                repeat=config.repeat,
+            )
+        )
+    return results
+
+
+def _python_runner(stmt: str) -> T.Callable[[], T.Any]:
+    """
+    Run a statement in a fresh interpreter that imports this copy of
+    windtalker.
+    """
+    dir_site = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [dir_site] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    args = [sys.executable, "-c", stmt]
+
+    def run_python():
+        subprocess.run(args, env=env, check=True)
+
+    return run_python
+
+
+def bench_import(config: Config, workdir: Path) -> T.List[Result]:
+    """
+    Start up time of a fresh interpreter running each import statement, the
+    ``python_startup`` case is the interpreter alone, for reference.
+    """
+    results = [
+        measure(
+            "python_startup",
+            _python_runner("pass"),
+            repeat=config.repeat,
+        )
+    ]
+    for stmt in config.imports:
+        results.append(
+            measure(
+                "import",
+                _python_runner(stmt),
+                params=dict(stmt=stmt),
+                repeat=config.repeat,
+            )
+        )
+    return results
+
+
+suite_mapper: T.Dict[str, T.Callable[[Config, Path], T.List[Result]]] = {
+    "text": bench_text,
+    "file": bench_file,
+    "dir": bench_dir,
+    "asymmetric": bench_asymmetric,
+    "import": bench_import,
+}
+
+
+def run(
+    suites: T.Optional[T.List[str]] = None,
+    config: T.Optional[Config] = None,
+    workdir: T.Optional[Path] = None,
+    callback: T.Optional[T.Callable[[Result], T.Any]] = None,
+) -> T.List[Result]:
+    """
+    Run the benchmark suites.
+
+    :param suites: suite names, default is all of them
+    :param config: default is :class:`Config`
+    :param workdir: directory for the synthetic files, default is a temp dir
+    :param callback: a function to call with each result as soon as its
+      suite is finished
+    """
+    if suites is None:
+        suites = list(suite_mapper)
+    for name in suites:
+        if name not in suite_mapper:
+            raise ValueError(
+                f"unknown suite {name!r}, available: {', '.join(suite_mapper)}"
+            )
+    if config is None:
+        config = Config()
+
+    results = list()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workdir = Path(tmp_dir) if workdir is None else Path(workdir)
+        workdir.mkdir_if_not_exists()
+        for name in suites:
+            suite_results = suite_mapper[name](config, workdir)
+            if callback is not None:
+                for result in suite_results:
+                    callback(result)
+            results.extend(suite_results)
+    return results
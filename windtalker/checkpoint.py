@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+
+"""
+Atomic and resumable file encryption.
+
+``encrypt_file`` writes into ``<output>.part`` and renames it to the output
+path when it is complete, so the output path never holds a partial file.
+
+While a big file is encrypted, a checkpoint journal ``<output>.journal``
+records the frames that are safely on disk, at most once per
+``checkpoint_interval`` seconds. If the run is killed, the next
+``encrypt_file`` (or ``encrypt_dir``, file by file) with ``resume=True``
+continues after the last checkpoint, when:
+
+- the source file has the same size and mtime,
+- the cipher, chunk size, index and compression options are the same,
+- the frames in the part file match the journal,
+- the last frame decrypts with this cipher to the same source chunk.
+
+Otherwise it starts over from byte zero. Example content of the journal::
+
+    {
+        "version": 1,
+        "src_size": 536870912000,
+        "src_mtime_ns": 1700000000000000000,
+        "cipher_id": 1,
+        "chunk_size": 1048576,
+        "index": false,
+        "compression": null,
+        "chunk_count": 1024,
+        "plaintext_length": 1073741824,
+        "position": 1073791025
+    }
+
+``encrypt_dir`` and ``encrypt_dir_parallel`` with ``resume=True`` also keep
+a directory journal ``.windtalker-journal`` in the output dir (see
+:class:`DirJournal`), it lists the files whose output is complete. A re-run
+of an interrupted directory skips them and only does the rest, without
+``overwrite=True``. Any other existing output still raises.
+
+The ciphers with a per file key block (see
+:meth:`~windtalker.cipher.BaseCipher._begin_encrypt`), like
+:class:`~windtalker.asymmetric.AsymmetricCipher`, can't resume: the session
+key is only in memory, so their files are written atomically but always from
+byte zero.
+"""
+
+import typing as T
+import os
+import hmac
+import json
+import time
+import hashlib
+import dataclasses
+
+from pathlib_mate import Path
+
+from . import files
+from . import container
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .cipher import BaseCipher
+
+JOURNAL_VERSION = 1
+JOURNAL_SUFFIX = ".journal"
+
+DEFAULT_INTERVAL = 10.0
+"""
+Seconds between two checkpoints, each checkpoint flushes the part file to
+disk with ``fsync``.
+"""
+
+
+def get_journal_path(output_path: Path) -> Path:
+    """
+    Like ``${home}/test-encrypted.txt.journal``.
+    """
+    return output_path.change(new_basename=output_path.basename + JOURNAL_SUFFIX)
+
+
+@dataclasses.dataclass
+class Journal:
+    """
+    The identity of a file encryption and its progress.
+
+    :param chunk_count: number of frames safely written
+    :param plaintext_length: number of source bytes encrypted in them
+    :param position: the end of the last frame in the part file
+    """
+
+    src_size: int
+    src_mtime_ns: int
+    cipher_id: int
+    chunk_size: int
+    index: bool
+    compression: T.Optional[str]
+    chunk_count: int = 0
+    plaintext_length: int = 0
+    position: int = 0
+    version: int = JOURNAL_VERSION
+
+    def is_same_job(self, other: "Journal") -> bool:
+        """
+        Test if both journals are for the same source file and options.
+        """
+        return (
+            self.version,
+            self.src_size,
+            self.src_mtime_ns,
+            self.cipher_id,
+            self.chunk_size,
+            self.index,
+            self.compression,
+        ) == (
+            other.version,
+            other.src_size,
+            other.src_mtime_ns,
+            other.cipher_id,
+            other.chunk_size,
+            other.index,
+            other.compression,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> T.Optional["Journal"]:
+        """
+        Return None if the journal doesn't exist or can't be read.
+        """
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            return cls(**data)
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def dump(self, path: Path):
+        """
+        Write the journal atomically.
+        """
+        tmp_path = path.abspath + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dataclasses.asdict(self), f, indent=4)
+        os.replace(tmp_path, path.abspath)
+
+
+class Checkpointer:
+    """
+    The ``on_frame`` hook of :func:`windtalker.container.encrypt_stream`,
+    it flushes the part file and updates the journal at most once per
+    ``interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        journal: Journal,
+        path: Path,
+        f_output: T.BinaryIO,
+        interval: float = DEFAULT_INTERVAL,
+    ):
+        self.journal = journal
+        self.path = path
+        self.f_output = f_output
+        self.interval = interval
+        self._last = time.monotonic()
+
+    def __call__(self, writer: container.ContainerWriter):
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self.save(writer)
+            self._last = now
+
+    def save(self, writer: container.ContainerWriter):
+        # the frames must be on disk before the journal says so
+        self.f_output.flush()
+        os.fsync(self.f_output.fileno())
+        self.journal.chunk_count = writer.chunk_count
+        self.journal.plaintext_length = writer.plaintext_length
+        self.journal.position = writer.position
+        self.journal.dump(self.path)
+
+
+def _reopen_writer(
+    cipher: "BaseCipher",
+    f_input: T.BinaryIO,
+    f_output: T.BinaryIO,
+    journal: Journal,
+) -> T.Optional[container.ContainerWriter]:
+    """
+    Validate the part file against the journal and the source file.
+    """
+    f_output.seek(0)
+    header = container.Header.read(f_output)
+    if (
+        header.version != container.VERSION
+        or header.cipher_id != journal.cipher_id
+        or header.chunk_size != journal.chunk_size
+        or header.has_index != journal.index
+        or header.is_compressed != (journal.compression is not None)
+        or header.key_block
+    ):
+        return None
+    offsets, position = container.scan_frames(f_output, header, journal.chunk_count)
+    plaintext_length = min(journal.chunk_count * journal.chunk_size, journal.src_size)
+    if position != journal.position or plaintext_length != journal.plaintext_length:
+        return None
+    if offsets:
+        f_output.seek(offsets[-1])
+        token = next(container.iter_frames(f_output, header))
+        decrypt_frame = header.wrap_decrypt_frame(cipher._begin_decrypt(header))
+        f_input.seek((journal.chunk_count - 1) * journal.chunk_size)
+        aad = header.frame_aad(journal.chunk_count - 1)
+        if decrypt_frame(token, aad) != f_input.read(journal.chunk_size):
+            return None
+    return container.ContainerWriter.reopen(
+        f_output,
+        header=header,
+        offsets=offsets,
+        position=position,
+        plaintext_length=plaintext_length,
+    )
+
+
+def open_part(
+    cipher: "BaseCipher",
+    f_input: T.BinaryIO,
+    output_path: Path,
+    journal: Journal,
+    resume: bool = True,
+) -> T.Tuple[T.BinaryIO, T.Optional[container.ContainerWriter]]:
+    """
+    Open the part file of ``output_path``. If ``resume`` is True and the
+    part file is a valid checkpoint of the same job, reopen it and return
+    the writer to continue with, otherwise truncate it.
+
+    :param journal: the journal of this job, without progress
+    :return: the part file object (at the position to write), and the
+      writer, or None to start over
+    """
+    p_part = files.get_part_path(output_path)
+    if resume and p_part.exists():
+        saved = Journal.load(get_journal_path(output_path))
+        if saved is not None and saved.is_same_job(journal):
+            f_output = p_part.open("r+b")
+            try:
+                writer = _reopen_writer(cipher, f_input, f_output, saved)
+            except Exception:  # a damaged part file, start over
+                writer = None
+            finally:
+                f_input.seek(0)
+            if writer is not None:
+                journal.chunk_count = saved.chunk_count
+                journal.plaintext_length = saved.plaintext_length
+                journal.position = saved.position
+                return f_output, writer
+            f_output.close()
+    get_journal_path(output_path).remove_if_exists()
+    return p_part.open("wb"), None
+
+
+DIR_JOURNAL_FILENAME = ".windtalker-journal"
+
+
+def get_key_check(cipher: "BaseCipher") -> T.Optional[str]:
+    """
+    A value that tells if two ciphers have the same key, without revealing
+    it. None if the cipher doesn't support it (see
+    :meth:`~windtalker.cipher.BaseCipher._get_hash_key`).
+    """
+    try:
+        key = cipher._get_hash_key()
+    except (NotImplementedError, ValueError):
+        return None
+    return hmac.new(key, b"windtalker dir journal", hashlib.sha256).hexdigest()
+
+
+@dataclasses.dataclass
+class DirJournal:
+    """
+    The progress of a resumable directory encryption. It is a JSON lines
+    file in the output dir, the first line identifies the cipher key, each
+    other line is a file whose output is complete, appended when it is done::
+
+        {"version": 1, "key_check": "9f2c...41d0"}
+        {"path": "images/windtalker.jpg", "size": 15678, "mtime_ns": 17000...}
+
+    :param path: the journal file path
+    :param done: relative path (with ``/``) to the source (size, mtime_ns)
+    """
+
+    path: Path
+    key_check: str
+    done: T.Dict[str, T.Tuple[int, int]] = dataclasses.field(default_factory=dict)
+
+    @classmethod
+    def exists(cls, dir_output: Path) -> bool:
+        return dir_output.joinpath(DIR_JOURNAL_FILENAME).exists()
+
+    @classmethod
+    def load(cls, dir_output: Path) -> T.Optional["DirJournal"]:
+        """
+        Return None if the journal doesn't exist or can't be read, a broken
+        last line (the process died while appending it) is ignored.
+        """
+        path = dir_output.joinpath(DIR_JOURNAL_FILENAME)
+        try:
+            lines = path.read_text(encoding="utf-8").splitlines()
+            journal = cls(path=path, key_check=json.loads(lines[0])["key_check"])
+        except (OSError, ValueError, KeyError, IndexError):
+            return None
+        for line in lines[1:]:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                break
+            journal.done[data["path"]] = (data["size"], data["mtime_ns"])
+        return journal
+
+    @classmethod
+    def begin(
+        cls,
+        dir_output: Path,
+        key_check: str,
+        overwrite: bool = False,
+    ) -> "DirJournal":
+        """
+        Continue the journal of an interrupted run, or start a new one if
+        ``overwrite`` is True or there is no journal.
+
+        :raise EnvironmentError: if the journal is written with another key
+          and ``overwrite`` is False
+        """
+        journal = None if overwrite else cls.load(dir_output)
+        if journal is not None and journal.key_check == key_check:
+            return journal
+        if journal is not None:
+            raise EnvironmentError(
+                f"'{journal.path}' is written with another key, "
+                f"use overwrite=True to start over!"
+            )
+        journal = cls(
+            path=dir_output.joinpath(DIR_JOURNAL_FILENAME), key_check=key_check
+        )
+        with open(journal.path.abspath, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"version": 1, "key_check": key_check}) + "\n")
+        return journal
+
+    def is_done(self, relpath: str, src: str, dst: str) -> bool:
+        """
+        Test if the output of a source file is complete in a previous run,
+        and the source is not changed since.
+        """
+        st = os.stat(src)
+        return self.done.get(relpath) == (
+            st.st_size,
+            st.st_mtime_ns,
+        ) and os.path.exists(dst)
+
+    def add(self, relpath: str, src: str):
+        """
+        Record a file whose output is complete.
+        """
+        st = os.stat(src)
+        self.done[relpath] = (st.st_size, st.st_mtime_ns)
+        line = {"path": relpath, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        with open(self.path.abspath, "a", encoding="utf-8") as f:
+            f.write(json.dumps(line) + "\n")
+
+    def remove(self):
+        self.path.remove_if_exists()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+"""
+Chunk size policy and auto tuning.
+
+Each cipher class declares a :class:`ChunkPolicy`: the default chunk size
+and the range of chunk sizes that make sense for it. The chunk size used by
+``encrypt_file``, :class:`~windtalker.stream.EncryptingWriter` and the async
+API is the cipher's ``_encrypt_chunk_size`` clamped into the range.
+
+The best chunk size depends on the host, the number of workers and the
+storage medium. :func:`autotune` encrypts and decrypts a sample file in the
+given directory with each candidate chunk size and picks the fastest one::
+
+    >>> from windtalker.api import SymmetricCipher
+    >>> cipher = SymmetricCipher(password="MyPassword")
+    >>> cipher.autotune_chunk_size(dir_path="/mnt/nfs/backup", workers=4)
+    4194304
+
+The files are flushed to the device and dropped from the page cache
+(``posix_fadvise(POSIX_FADV_DONTNEED)``) around each run, so the device is
+timed, not the memory. Where ``posix_fadvise`` is not available (Windows,
+macOS) only the flush is done, use a sample larger than the RAM there.
+
+The results are cached by cipher class, workers, device, sample size and
+repeat in the current process, so calling it again for the same storage is
+free.
+"""
+
+from __future__ import annotations
+
+import typing as T
+import os
+import time
+import threading
+import dataclasses
+
+from .lazy import lazy_import
+
+pathlib_mate = lazy_import("pathlib_mate")
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from pathlib_mate import Path
+    from .cipher import BaseCipher
+
+KB = 1024
+MB = 1024 * KB
+
+
+@dataclasses.dataclass(frozen=True)
+class ChunkPolicy:
+    """
+    :param default: the default chunk size
+    :param min_size: the smallest chunk size, the per chunk overhead
+      dominates below it
+    :param max_size: the largest chunk size, to bound the memory usage per
+      chunk (times the number of workers)
+    """
+
+    default: int
+    min_size: int
+    max_size: int
+
+    def clamp(self, size: int) -> int:
+        """
+        Fix the chunk size into the range.
+        """
+        return min(max(size, self.min_size), self.max_size)
+
+    def check(self, size: int):
+        """
+        Raise ValueError if the chunk size is out of range.
+        """
+        if not (self.min_size <= size <= self.max_size):
+            raise ValueError(
+                f"Cannot set encrypt chunk size = {size}, encrypt chunk size "
+                f"has to be between {self.min_size} and {self.max_size}"
+            )
+
+    def candidates(self, max_size: T.Optional[int] = None) -> T.List[int]:
+        """
+        The chunk sizes to try in :func:`autotune`, powers of 4 from 64KB
+        within the range.
+        """
+        upper = self.max_size if max_size is None else min(max_size, self.max_size)
+        sizes = list()
+        size = 64 * KB
+        while size <= upper:
+            if size >= self.min_size:
+                sizes.append(size)
+            size *= 4
+        if not sizes:
+            sizes.append(self.clamp(upper))
+        return sizes
+
+
+DEFAULT_POLICY = ChunkPolicy(default=1 * MB, min_size=1 * MB, max_size=10 * MB)
+"""
+The policy for custom ciphers, their per chunk cost is unknown.
+"""
+
+
+@dataclasses.dataclass
+class TuneResult:
+    """
+    :param chunk_size: the fastest chunk size
+    :param throughputs: chunk size to MB per second (encrypt + decrypt)
+    """
+
+    chunk_size: int
+    throughputs: T.Dict[int, float]
+    workers: int
+    dir_path: str
+
+
+_cache: T.Dict[tuple, TuneResult] = dict()
+_cache_lock = threading.Lock()
+
+
+def _drop_cache(path: Path):
+    """
+    Flush a file to the device and drop it from the page cache, so the next
+    read hits the device.
+    """
+    fd = os.open(path.abspath, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:  # pragma: no cover
+        pass
+    finally:
+        os.close(fd)
+
+
+def _measure(
+    cipher: "BaseCipher",
+    p_sample: Path,
+    p_encrypted: Path,
+    p_decrypted: Path,
+    chunk_size: int,
+    workers: int,
+) -> float:
+    _drop_cache(p_sample)
+    st = time.perf_counter()
+    kwargs = dict(overwrite=True, enable_verbose=False, workers=workers)
+    cipher.encrypt_file(p_sample, p_encrypted, chunk_size=chunk_size, **kwargs)
+    _drop_cache(p_encrypted)
+    cipher.decrypt_file(p_encrypted, p_decrypted, **kwargs)
+    _drop_cache(p_decrypted)
+    return time.perf_counter() - st
+
+
+def autotune(
+    cipher: "BaseCipher",
+    workers: int = 1,
+    dir_path: T.Optional[str] = None,
+    sample_size: int = 32 * MB,
+    candidates: T.Optional[T.List[int]] = None,
+    repeat: int = 1,
+    use_cache: bool = True,
+) -> TuneResult:
+    """
+    Find the chunk size with the best throughput.
+
+    :param cipher: the cipher to tune, it is not changed
+    :param workers: the number of threads you will use in ``encrypt_file``
+    :param dir_path: a directory on the storage medium you will use, the
+      sample files are written there and removed. Default is the temp dir.
+    :param sample_size: the sample file size
+    :param candidates: the chunk sizes to try, default is
+      :meth:`ChunkPolicy.candidates` up to 1/4 of the sample size
+    :param repeat: number of timed runs per candidate, the best one is used
+    :param use_cache: if True, reuse the result of the same cipher class,
+      workers, device, sample size and repeat, it is ignored if
+      ``candidates`` is given
+    """
+    if dir_path is None:
+        import tempfile
+
+        dir_path = tempfile.gettempdir()
+    dir_path = pathlib_mate.Path(dir_path).abspath
+    policy = cipher._chunk_policy
+    key = (cipher.__class__, workers, os.stat(dir_path).st_dev, sample_size, repeat)
+    use_cache = use_cache and candidates is None
+    if use_cache:
+        with _cache_lock:
+            if key in _cache:
+                return _cache[key]
+
+    if candidates is None:
+        candidates = policy.candidates(max_size=sample_size // 4)
+    else:
+        candidates = [policy.clamp(size) for size in candidates]
+
+    suffix = "%s-%s" % (os.getpid(), threading.get_ident())
+    p_sample = pathlib_mate.Path(dir_path, f".windtalker-tune-{suffix}")
+    p_encrypted = pathlib_mate.Path(dir_path, f".windtalker-tune-{suffix}-encrypted")
+    p_decrypted = pathlib_mate.Path(dir_path, f".windtalker-tune-{suffix}-decrypted")
+    throughputs = dict()
+    try:
+        p_sample.write_bytes(os.urandom(sample_size))
+        for chunk_size in candidates:
+            elapsed = min(
+                _measure(
+                    cipher, p_sample, p_encrypted, p_decrypted, chunk_size, workers
+                )
+                for _ in range(repeat)
+            )
+            throughputs[chunk_size] = 2 * sample_size / elapsed / MB
+    finally:
+        for p in [p_sample, p_encrypted, p_decrypted]:
+            p.remove_if_exists()
+
+    result = TuneResult(
+        chunk_size=max(throughputs, key=throughputs.get),
+        throughputs=throughputs,
+        workers=workers,
+        dir_path=dir_path,
+    )
+    if use_cache:
+        with _cache_lock:
+            _cache[key] = result
+    return result
@@ -1,13 +1,37 @@
 # -*- coding: utf-8 -*-
 
+from __future__ import annotations
+
 import typing as T
 import os
+import io
 import time
 import base64
+import shutil
+import itertools
+
+from . import container
+from . import metrics
+from . import chunking
+from .exc import FileFormatError
+from .lazy import lazy_import
 
-from pathlib_mate import Path, T_PATH_ARG
+# the file, directory and async machinery is imported on first use,
+# see windtalker/lazy.py
+files = lazy_import("windtalker.files")
+aio = lazy_import("windtalker.aio")
+dirs = lazy_import("windtalker.dirs")
+manifest_ = lazy_import("windtalker.manifest")
+dedup_ = lazy_import("windtalker.dedup")
+archive = lazy_import("windtalker.archive")
+stream_ = lazy_import("windtalker.stream")
+checkpoint = lazy_import("windtalker.checkpoint")
+verify_ = lazy_import("windtalker.verify")
+pathlib_mate = lazy_import("pathlib_mate")
 
-from . import files
+if T.TYPE_CHECKING:  # pragma: no cover
+    from pathlib_mate import Path, T_PATH_ARG
+    from .verify import FileReport, DirReport
 
 
 class BaseCipher:
@@ -20,8 +44,15 @@ class BaseCipher:
     can encrypt binary data, then you can encrypt text, file, and directory.
     """
 
-    _encrypt_chunk_size = 1024
-    _decrypt_chunk_size = 1024
+    _chunk_policy = chunking.DEFAULT_POLICY
+    _encrypt_chunk_size = chunking.DEFAULT_POLICY.default
+    _decrypt_chunk_size = chunking.DEFAULT_POLICY.default
+    _cipher_id = container.CIPHER_ID_CUSTOM
+    instrument: metrics.Instrument = metrics.NULL_INSTRUMENT
+    """
+    Receive the chunk and file events of ``encrypt_file`` and
+    ``decrypt_file``, see :mod:`windtalker.metrics`.
+    """
 
     def b64encode_str(self, text: str) -> str:
         """
@@ -79,6 +110,301 @@ class BaseCipher:
         token = base64.b64decode(b)
         return self.decrypt(token, *args, **kwargs).decode("utf-8")
 
+    def _get_batch_encrypt(self) -> T.Callable[[bytes], bytes]:
+        """
+        The encrypt function of the batch methods like
+        :meth:`BaseCipher.encrypt_binary_many`, it must be thread safe. The
+        default is :meth:`BaseCipher.encrypt`.
+        """
+        return self.encrypt
+
+    def _get_hash_key(self) -> bytes:
+        """
+        The secret key of the keyed content hashes in the incremental
+        manifest, it must be derived from the cipher's own secret, so the
+        same cipher gets the same key in the next run.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} doesn't support the content hash!"
+        )
+
+    def _map_many(
+        self,
+        func: T.Callable[[list], list],
+        items: T.Iterable,
+        workers: int,
+        batch_size: int,
+        stream: bool,
+    ) -> T.Union[list, T.Iterator]:
+        batches = files.iter_batches(items, batch_size)
+        if workers > 1:
+            results = files.imap_ordered(func, batches, workers=workers)
+        else:
+            results = map(func, batches)
+        flat_results = itertools.chain.from_iterable(results)
+        if stream:
+            return flat_results
+        else:
+            return list(flat_results)
+
+    def encrypt_binary_many(
+        self,
+        binaries: T.Iterable[bytes],
+        workers: int = 1,
+        batch_size: int = 1000,
+        stream: bool = False,
+    ) -> T.Union[T.List[bytes], T.Iterator[bytes]]:
+        """
+        Encrypt many binary data, the results are in the same order.
+
+        :param binaries: a sequence or an iterator of binary data
+        :param workers: number of threads, items are processed in batches
+        :param batch_size: number of items per batch
+        :param stream: if True, return a generator, so you can process an
+          unbounded iterator with bounded memory
+
+        :return: a list of encrypted binary data, or a generator if ``stream``
+        """
+        encrypt = self._get_batch_encrypt()
+
+        def func(batch: T.List[bytes]) -> T.List[bytes]:
+            return [encrypt(binary) for binary in batch]
+
+        return self._map_many(func, binaries, workers, batch_size, stream)
+
+    def decrypt_binary_many(
+        self,
+        binaries: T.Iterable[bytes],
+        workers: int = 1,
+        batch_size: int = 1000,
+        stream: bool = False,
+    ) -> T.Union[T.List[bytes], T.Iterator[bytes]]:
+        """
+        Decrypt many binary data, see :meth:`BaseCipher.encrypt_binary_many`.
+        """
+        decrypt = self.decrypt
+
+        def func(batch: T.List[bytes]) -> T.List[bytes]:
+            return [decrypt(binary) for binary in batch]
+
+        return self._map_many(func, binaries, workers, batch_size, stream)
+
+    def encrypt_text_many(
+        self,
+        texts: T.Iterable[str],
+        workers: int = 1,
+        batch_size: int = 1000,
+        stream: bool = False,
+    ) -> T.Union[T.List[str], T.Iterator[str]]:
+        """
+        Encrypt many strings, see :meth:`BaseCipher.encrypt_binary_many`.
+        The output is the same as :meth:`BaseCipher.encrypt_text`.
+        """
+        encrypt = self._get_batch_encrypt()
+        b64encode = base64.b64encode
+
+        def func(batch: T.List[str]) -> T.List[str]:
+            return [
+                b64encode(encrypt(text.encode("utf-8"))).decode("utf-8")
+                for text in batch
+            ]
+
+        return self._map_many(func, texts, workers, batch_size, stream)
+
+    def decrypt_text_many(
+        self,
+        texts: T.Iterable[str],
+        workers: int = 1,
+        batch_size: int = 1000,
+        stream: bool = False,
+    ) -> T.Union[T.List[str], T.Iterator[str]]:
+        """
+        Decrypt many strings, see :meth:`BaseCipher.encrypt_binary_many`.
+        """
+        decrypt = self.decrypt
+        b64decode = base64.b64decode
+
+        def func(batch: T.List[str]) -> T.List[str]:
+            return [
+                decrypt(b64decode(text.encode("utf-8"))).decode("utf-8")
+                for text in batch
+            ]
+
+        return self._map_many(func, texts, workers, batch_size, stream)
+
+    async def aencrypt_binary(
+        self,
+        binary: bytes,
+        *args,
+        runner: T.Optional[aio.AsyncRunner] = None,
+        **kwargs,
+    ) -> bytes:
+        """
+        Async version of :meth:`BaseCipher.encrypt_binary`, it runs on the
+        executor of :mod:`windtalker.aio`.
+        """
+        return await aio.get_runner(runner).run(
+            self.encrypt_binary, binary, *args, **kwargs
+        )
+
+    async def adecrypt_binary(
+        self,
+        binary: bytes,
+        *args,
+        runner: T.Optional[aio.AsyncRunner] = None,
+        **kwargs,
+    ) -> bytes:
+        """
+        Async version of :meth:`BaseCipher.decrypt_binary`.
+        """
+        return await aio.get_runner(runner).run(
+            self.decrypt_binary, binary, *args, **kwargs
+        )
+
+    async def aencrypt_text(
+        self,
+        text: str,
+        *args,
+        runner: T.Optional[aio.AsyncRunner] = None,
+        **kwargs,
+    ) -> str:
+        """
+        Async version of :meth:`BaseCipher.encrypt_text`.
+        """
+        return await aio.get_runner(runner).run(
+            self.encrypt_text, text, *args, **kwargs
+        )
+
+    async def adecrypt_text(
+        self,
+        text: str,
+        *args,
+        runner: T.Optional[aio.AsyncRunner] = None,
+        **kwargs,
+    ) -> str:
+        """
+        Async version of :meth:`BaseCipher.decrypt_text`.
+        """
+        return await aio.get_runner(runner).run(
+            self.decrypt_text, text, *args, **kwargs
+        )
+
+    def _encrypt_frame(self, binary: bytes, aad: bytes = b"") -> bytes:
+        """
+        Encrypt one chunk of a file in container format, see
+        :mod:`windtalker.container`. The default implementation is
+        :meth:`BaseCipher.encrypt` of the associated data followed by the
+        chunk, override it if your cipher has a more compact binary output.
+
+        ``binary`` can be any bytes-like object, like a memoryview of a
+        memory mapped file. The default implementation converts it to
+        ``bytes`` first.
+
+        :param aad: the associated data of the frame, see
+          :meth:`windtalker.container.Header.frame_aad`. It must be
+          authenticated with the frame, it is not stored in it.
+        """
+        return self.encrypt(aad + bytes(binary))
+
+    def _decrypt_frame(self, binary: bytes, aad: bytes = b"") -> bytes:
+        """
+        Decrypt one frame of a file in container format, the inverse of
+        :meth:`BaseCipher._encrypt_frame`.
+
+        :param aad: the associated data of the frame, the same as the one
+          given to :meth:`BaseCipher._encrypt_frame`
+        """
+        if not isinstance(binary, bytes):
+            binary = bytes(binary)
+        data = self.decrypt(binary)
+        if data[: len(aad)] != aad:
+            raise FileFormatError("the frame doesn't belong here!")
+        return data[len(aad) :]
+
+    def _begin_encrypt(
+        self,
+        header: container.Header,
+    ) -> T.Tuple[bytes, T.Callable[[bytes, bytes], bytes]]:
+        """
+        Called once before writing a new container format file.
+
+        :param header: the header of the new file, without the key block and
+          the counts, see :func:`windtalker.container.new_header`
+
+        :return: a tuple of (key block, frame encrypt function). The key block
+          is stored in the header, a cipher can put per file data in it, like
+          a wrapped session key. The default is no key block and
+          :meth:`BaseCipher._encrypt_frame`.
+        """
+        return b"", self._encrypt_frame
+
+    def _begin_decrypt(
+        self,
+        header: container.Header,
+    ) -> T.Callable[[bytes, bytes], bytes]:
+        """
+        Called once after reading the header of a container format file,
+        the inverse of :meth:`BaseCipher._begin_encrypt`.
+
+        :return: the frame decrypt function
+        """
+        return self._decrypt_frame
+
+    def _begin_verify(
+        self,
+        header: container.Header,
+    ) -> T.Callable[[bytes, bytes], T.Any]:
+        """
+        Called once after reading the header of a container format file to
+        verify it, see :mod:`windtalker.verify`.
+
+        :return: a function that raises if a frame is not authentic. The
+          default decrypts the frame and drops the plain data, a cipher can
+          check the MAC / tag only.
+        """
+        return self._begin_decrypt(header)
+
+    def _frame_size(self, plaintext_length: int) -> T.Optional[int]:
+        """
+        The exact size of the output of :meth:`BaseCipher._encrypt_frame`,
+        used to preallocate the output file. None means unknown.
+        """
+        return None
+
+    def _get_chunk_size(self, chunk_size: T.Optional[int] = None) -> int:
+        """
+        The plain data chunk size for the container format, clamped by the
+        cipher's chunk policy, see :mod:`windtalker.chunking`.
+        """
+        if chunk_size is None:
+            chunk_size = self._encrypt_chunk_size
+        return self._chunk_policy.clamp(chunk_size)
+
+    def set_encrypt_chunk_size(self, size: int):
+        """
+        Set the plain data chunk size, raise ValueError if it is out of the
+        cipher's chunk policy range.
+        """
+        self._chunk_policy.check(size)
+        self._encrypt_chunk_size = size
+
+    def autotune_chunk_size(
+        self,
+        workers: int = 1,
+        dir_path: T.Optional[str] = None,
+        **kwargs,
+    ) -> int:
+        """
+        Time a short calibration run and set the chunk size with the best
+        throughput, see :func:`windtalker.chunking.autotune` for the
+        arguments.
+
+        :return: the new chunk size
+        """
+        result = chunking.autotune(self, workers=workers, dir_path=dir_path, **kwargs)
+        self.set_encrypt_chunk_size(result.chunk_size)
+        return result.chunk_size
+
     def _show(
         self,
         message: str,
@@ -96,6 +422,12 @@ class BaseCipher:
         overwrite: bool = False,
         stream: bool = True,
         enable_verbose: bool = True,
+        workers: int = 1,
+        index: bool = False,
+        compression: T.Optional[str] = None,
+        chunk_size: T.Optional[int] = None,
+        resume: bool = True,
+        checkpoint_interval: T.Optional[float] = None,
         **kwargs,
     ):
         """
@@ -103,12 +435,32 @@ class BaseCipher:
         path with a surfix appended. The default automatical file path handling
         is defined here :meth:`windtalker.files.get_encrypted_file_path`
 
+        The output file is in the binary container format, see
+        :mod:`windtalker.container`.
+
         :param path: path of the file you need to encrypt
         :param output_path: encrypted file output path
         :param overwrite: if True, then silently overwrite output file if exists
         :param stream: if it is a very big file, stream mode can avoid using
-          too much memory
+          too much memory. If False, the whole file is one chunk, files
+          larger than :data:`windtalker.container.MAX_CHUNK_SIZE` are split
+          into chunks of that size
         :param enable_verbose: trigger on/off the help information
+        :param workers: number of threads to encrypt chunks in parallel,
+          see :func:`windtalker.files.transform`
+        :param index: if True, append a chunk index to the file, so
+          :meth:`BaseCipher.decrypt_range` can seek to any chunk directly
+        :param compression: compress each chunk before encryption, one of
+          "zlib", "lzma", "bz2", see :mod:`windtalker.compress`. It is
+          detected automatically when decrypting.
+        :param chunk_size: plain data chunk size, default is the cipher's,
+          see :meth:`BaseCipher.autotune_chunk_size`
+        :param resume: the output is written to ``<output_path>.part`` and
+          renamed when it is complete. If True, a checkpoint journal is kept
+          while writing, and an interrupted run continues from the last
+          checkpoint, see :mod:`windtalker.checkpoint`
+        :param checkpoint_interval: seconds between two checkpoints, default
+          is :data:`windtalker.checkpoint.DEFAULT_INTERVAL`
         """
         path, output_path = files.process_dst_overwrite_args(
             src=path,
@@ -118,17 +470,92 @@ class BaseCipher:
         )
 
         self._show("Encrypt '%s' ..." % path, enable_verbose=enable_verbose)
-        st = time.process_time()
-        files.transform(
-            path,
-            output_path,
-            converter=self.encrypt,
-            overwrite=overwrite,
-            stream=stream,
-            chunksize=self._encrypt_chunk_size,
-        )
+        st = time.perf_counter()
+        chunksize = self._get_chunk_size(chunk_size)
+        p_part = files.get_part_path(output_path)
+        p_journal = checkpoint.get_journal_path(output_path)
+        with path.open("rb") as f_input, files.open_mmap(f_input) as mm:
+            st_input = os.fstat(f_input.fileno())
+            size = st_input.st_size
+            if not stream:  # the whole file is one chunk, if it fits in one
+                chunksize = min(size, container.MAX_CHUNK_SIZE)
+            key_block, encrypt_frame = self._begin_encrypt(
+                container.new_header(
+                    cipher_id=self._cipher_id,
+                    chunk_size=chunksize,
+                    index=index,
+                    compressed=compression is not None,
+                )
+            )
+            # the session key of a key block is lost if the process dies
+            resume = resume and stream and not key_block
+            journal = checkpoint.Journal(
+                src_size=size,
+                src_mtime_ns=st_input.st_mtime_ns,
+                cipher_id=self._cipher_id,
+                chunk_size=chunksize,
+                index=index,
+                compression=compression,
+            )
+            f_output, writer = checkpoint.open_part(
+                self, f_input, output_path, journal, resume=resume
+            )
+            on_frame = None
+            if resume:
+                on_frame = checkpoint.Checkpointer(
+                    journal,
+                    p_journal,
+                    f_output,
+                    interval=(
+                        checkpoint.DEFAULT_INTERVAL
+                        if checkpoint_interval is None
+                        else checkpoint_interval
+                    ),
+                )
+            try:
+                with f_output, metrics.meter_file(
+                    self.instrument,
+                    metrics.OP_ENCRYPT,
+                    path.abspath,
+                    output_path.abspath,
+                    size,
+                ) as meter:
+                    total_size = None
+                    if stream and compression is None:
+                        total_size = container.encrypted_size(
+                            size,
+                            chunk_size=chunksize,
+                            frame_size=self._frame_size,
+                            index=index,
+                            key_block_size=len(key_block),
+                        )
+                    if total_size is not None:
+                        # from the end of the frames already written
+                        files.preallocate(f_output, total_size - f_output.tell())
+                    container.encrypt_stream(
+                        f_input if mm is None else mm,
+                        f_output,
+                        encrypt_frame=encrypt_frame,
+                        chunksize=chunksize,
+                        stream=stream,
+                        workers=workers,
+                        cipher_id=self._cipher_id,
+                        index=index,
+                        compression=compression,
+                        key_block=key_block,
+                        meter=meter,
+                        writer=writer,
+                        on_frame=on_frame,
+                    )
+                    f_output.truncate()
+            except BaseException:
+                if not resume:
+                    p_part.remove_if_exists()
+                raise
+        os.replace(p_part.abspath, output_path.abspath)
+        p_journal.remove_if_exists()
         self._show(
-            "    Finished! Elapse %.6f seconds" % (time.process_time() - st,),
+            "    Finished! Elapse %.6f seconds" % (time.perf_counter() - st,),
             enable_verbose=enable_verbose,
         )
 
@@ -141,6 +568,7 @@ class BaseCipher:
         overwrite: bool = False,
         stream: bool = True,
         enable_verbose: bool = True,
+        workers: int = 1,
         **kwargs,
     ):
         """
@@ -148,12 +576,17 @@ class BaseCipher:
         path with a surfix appended. The default automatical file path handling
         is defined here :meth:`windtalker.files.recover_path`
 
+        Both the container format and the legacy format (concatenated
+        tokens) are supported, the format is detected automatically.
+
         :param path: path of the file you need to decrypt
         :param output_path: decrypted file output path
         :param overwrite: if True, then silently overwrite output file if exists
         :param stream: if it is a very big file, stream mode can avoid using
           too much memory
         :param enable_verbose: boolean, trigger on/off the help information
+        :param workers: number of threads to decrypt chunks in parallel,
+          see :func:`windtalker.files.transform`
         """
         path, output_path = files.process_dst_overwrite_args(
             src=path,
@@ -163,22 +596,415 @@ class BaseCipher:
         )
 
         self._show("Decrypt '%s' ..." % path, enable_verbose=enable_verbose)
-        st = time.process_time()
-        files.transform(
-            path,
-            output_path,
-            converter=self.decrypt,
-            overwrite=overwrite,
-            stream=stream,
-            chunksize=self._decrypt_chunk_size,
-        )
+        st = time.perf_counter()
+        with metrics.meter_file(
+            self.instrument,
+            metrics.OP_DECRYPT,
+            path.abspath,
+            output_path.abspath,
+            path.size,
+        ) as meter:
+            with path.open("rb") as f_input:
+                is_container = container.is_container_file(f_input)
+                if is_container:
+                    header = container.Header.read(f_input)
+                    f_input.seek(0)
+                    with files.open_mmap(f_input) as mm, files.atomic_write(
+                        output_path
+                    ) as f_output:
+                        if header.plaintext_length is not None:
+                            # the header counts are not authenticated, an
+                            # uncompressed file is never larger than the input
+                            files.preallocate(
+                                f_output, min(header.plaintext_length, path.size)
+                            )
+                        container.decrypt_stream(
+                            f_input if mm is None else mm,
+                            f_output,
+                            decrypt_frame=self._begin_decrypt(header),
+                            workers=workers,
+                            cipher_id=self._cipher_id,
+                            meter=meter,
+                        )
+                        f_output.truncate()
+            if not is_container:  # legacy format
+                files.transform(
+                    path,
+                    output_path,
+                    converter=self.decrypt,
+                    overwrite=overwrite,
+                    stream=stream,
+                    chunksize=self._decrypt_chunk_size,
+                    workers=workers,
+                    meter=meter,
+                )
         self._show(
-            "    Finished! Elapse %.6f seconds" % (time.process_time() - st,),
+            "    Finished! Elapse %.6f seconds" % (time.perf_counter() - st,),
             enable_verbose=enable_verbose,
         )
 
         return output_path
 
+    def verify_file(
+        self,
+        path: T_PATH_ARG,
+        workers: int = 1,
+    ) -> FileReport:
+        """
+        Check that an encrypted file is intact and encrypted with this
+        cipher, without writing the plain data anywhere. Each chunk is
+        authenticated, it stops at the first bad chunk.
+
+        :param path: path of the encrypted file
+        :param workers: number of threads to verify chunks in parallel
+
+        :return: a :class:`~windtalker.verify.FileReport` object, see
+          :mod:`windtalker.verify`
+        """
+        return verify_.verify_file(self, path, workers=workers)
+
+    def verify_dir(
+        self,
+        path: T_PATH_ARG,
+        workers: T.Optional[int] = None,
+        use_process: bool = True,
+    ) -> DirReport:
+        """
+        Verify all the files in an encrypted directory on a process pool
+        (or thread pool), see :meth:`BaseCipher.verify_file`.
+
+        :param path: path of the encrypted directory
+        :param workers: number of workers, default is the number of CPU cores
+        :param use_process: if True, use process pool, otherwise use thread
+          pool
+
+        :return: a :class:`~windtalker.verify.DirReport` object
+        """
+        return verify_.verify_dir(self, path, workers=workers, use_process=use_process)
+
+    def encrypt_stream(
+        self,
+        f_input: T.BinaryIO,
+        f_output: T.BinaryIO,
+        workers: int = 1,
+        index: bool = False,
+        compression: T.Optional[str] = None,
+        chunk_size: T.Optional[int] = None,
+    ) -> container.Header:
+        """
+        Encrypt from a readable binary file object to a writable one, like
+        ``sys.stdin.buffer`` to ``sys.stdout.buffer``. Neither of them need
+        to be seekable. See :meth:`BaseCipher.encrypt_file` for the
+        arguments.
+
+        :return: the final header
+        """
+        chunksize = self._get_chunk_size(chunk_size)
+        key_block, encrypt_frame = self._begin_encrypt(
+            container.new_header(
+                cipher_id=self._cipher_id,
+                chunk_size=chunksize,
+                index=index,
+                compressed=compression is not None,
+            )
+        )
+        with metrics.meter_file(
+            self.instrument,
+            metrics.OP_ENCRYPT,
+            str(getattr(f_input, "name", "<stream>")),
+            str(getattr(f_output, "name", "<stream>")),
+            0,
+        ) as meter:
+            return container.encrypt_stream(
+                f_input,
+                f_output,
+                encrypt_frame=encrypt_frame,
+                chunksize=chunksize,
+                workers=workers,
+                cipher_id=self._cipher_id,
+                index=index,
+                compression=compression,
+                key_block=key_block,
+                meter=meter,
+            )
+
+    def decrypt_stream(
+        self,
+        f_input: T.BinaryIO,
+        f_output: T.BinaryIO,
+        workers: int = 1,
+    ) -> container.Header:
+        """
+        Reverse of :meth:`BaseCipher.encrypt_stream`, the input must be in
+        the container format.
+
+        :return: the header
+        """
+        header = container.Header.read(f_input)
+        with metrics.meter_file(
+            self.instrument,
+            metrics.OP_DECRYPT,
+            str(getattr(f_input, "name", "<stream>")),
+            str(getattr(f_output, "name", "<stream>")),
+            0,
+        ) as meter:
+            return container.decrypt_stream(
+                f_input,
+                f_output,
+                decrypt_frame=self._begin_decrypt(header),
+                workers=workers,
+                cipher_id=self._cipher_id,
+                meter=meter,
+                header=header,
+            )
+
+    async def aencrypt_file(
+        self,
+        path: T_PATH_ARG,
+        output_path: T.Optional[T_PATH_ARG] = None,
+        *args,
+        runner: T.Optional[aio.AsyncRunner] = None,
+        **kwargs,
+    ):
+        """
+        Async version of :meth:`BaseCipher.encrypt_file`. The whole file is
+        encrypted in one executor job, pass ``workers`` to use more threads.
+        """
+        kwargs.setdefault("enable_verbose", False)
+        return await aio.get_runner(runner).run(
+            self.encrypt_file, path, output_path, *args, **kwargs
+        )
+
+    async def adecrypt_file(
+        self,
+        path: T_PATH_ARG,
+        output_path: T.Optional[T_PATH_ARG] = None,
+        *args,
+        runner: T.Optional[aio.AsyncRunner] = None,
+        **kwargs,
+    ):
+        """
+        Async version of :meth:`BaseCipher.decrypt_file`.
+        """
+        kwargs.setdefault("enable_verbose", False)
+        return await aio.get_runner(runner).run(
+            self.decrypt_file, path, output_path, *args, **kwargs
+        )
+
+    def decrypt_range(
+        self,
+        path: T_PATH_ARG,
+        start: int,
+        length: int,
+    ) -> bytes:
+        """
+        Decrypt a byte range of the original file from a container format
+        encrypted file. Only the chunks covering the range are decrypted.
+
+        If the file is encrypted with ``index=True``, it seeks to the chunks
+        directly, otherwise it has to skip over the frames before ``start``
+        (without decrypting them).
+
+        :param path: path of the encrypted file
+        :param start: start position in the original file
+        :param length: number of bytes to read
+
+        :return: decrypted binary data, it may be shorter than ``length``
+          if it reaches the end of file
+        """
+        with pathlib_mate.Path(path).open("rb") as f:
+            header = container.Header.read(f)
+            f.seek(0)
+            return container.read_range(
+                f,
+                decrypt_frame=self._begin_decrypt(header),
+                start=start,
+                length=length,
+                cipher_id=self._cipher_id,
+            )
+
+    def to_key_material(self) -> dict:
+        """
+        Return the minimal data to rebuild this cipher in another process,
+        see :meth:`BaseCipher.from_key_material`. Override this method if
+        your cipher has state, like a secret key.
+        """
+        return {}
+
+    @classmethod
+    def from_key_material(cls, key_material: dict) -> "BaseCipher":
+        """
+        Rebuild a cipher from the output of :meth:`BaseCipher.to_key_material`.
+        """
+        return cls(**key_material)
+
+    def _process_dir(
+        self,
+        method: str,
+        path: Path,
+        output_path: Path,
+        overwrite: bool,
+        stream: bool,
+        enable_verbose: bool,
+        workers: int,
+        use_process: bool,
+        fail_fast: bool,
+        incremental: bool = False,
+        use_hash: bool = False,
+        delete_removed: bool = False,
+        dedup: bool = False,
+        resume: bool = False,
+        file_kwargs: T.Optional[dict] = None,
+    ) -> dirs.DirSummary:
+        """
+        :param resume: keep a :class:`~windtalker.checkpoint.DirJournal` in
+          the output dir, and skip the files it lists as complete. It is
+          ignored in dedup and incremental mode, they have their own
+          bookkeeping, and for the ciphers without
+          :meth:`BaseCipher._get_hash_key`.
+        :param file_kwargs: more arguments for ``getattr(self, method)``
+        """
+        if dedup and incremental:
+            raise ValueError("dedup mode doesn't support incremental mode!")
+        st = time.perf_counter()
+        summary = dirs.DirSummary(output_path=output_path)
+        copies = list()
+        if method == "decrypt_file" and dedup_.is_dedup_dir(path):
+            new_dirs, tasks, copies = dedup_.plan_decrypt(self, path, output_path)
+            if workers > 1:
+                tasks.sort(key=lambda task: task.size, reverse=True)
+        else:
+            new_dirs, tasks = dirs.plan_dir(
+                path,
+                output_path,
+                largest_first=workers > 1,
+                exclude={
+                    manifest_.MANIFEST_FILENAME,
+                    checkpoint.DIR_JOURNAL_FILENAME,
+                },
+            )
+            if dedup:
+                dedup_.prepare_output(output_path, overwrite)
+                tasks, duplicated_tasks, index = dedup_.plan_encrypt(
+                    path, output_path, new_dirs, tasks, workers=workers
+                )
+                new_dirs = [output_path.joinpath(dedup_.OBJECTS_DIRNAME)]
+                summary.skipped = [task.src for task in duplicated_tasks]
+        for new_dir in new_dirs:
+            new_dir.mkdir_if_not_exists()
+
+        if incremental:
+            manifest = manifest_.Manifest.load(output_path)
+            tasks, unchanged, new_entries = manifest.plan(
+                path,
+                tasks,
+                use_hash=use_hash,
+                hash_key=self._get_hash_key() if use_hash else None,
+            )
+            summary.skipped = [task.src for task in unchanged]
+            for task in unchanged:
+                relpath = manifest_.relpath_of(path, task.src)
+                if relpath in new_entries:
+                    manifest.entries[relpath] = new_entries[relpath]
+            if delete_removed:
+                for relpath in manifest.find_removed(path, tasks + unchanged):
+                    manifest.remove_output(output_path, relpath)
+                    manifest.entries.pop(relpath)
+                    summary.removed.append(relpath)
+            overwrite = True
+        dir_journal = None
+        if method == "encrypt_file" and resume and not (dedup or incremental):
+            key_check = checkpoint.get_key_check(self)
+            if key_check is not None:
+                dir_journal = checkpoint.DirJournal.begin(
+                    output_path, key_check, overwrite=overwrite
+                )
+                done = {
+                    id(task)
+                    for task in tasks
+                    if dir_journal.is_done(
+                        manifest_.relpath_of(path, task.src), task.src, task.dst
+                    )
+                }
+                summary.skipped = [task.src for task in tasks if id(task) in done]
+                tasks = [task for task in tasks if id(task) not in done]
+
+        kwargs = dict(overwrite=overwrite, stream=stream)
+        if file_kwargs:
+            kwargs.update(file_kwargs)
+        if workers > 1:
+            kwargs["enable_verbose"] = False
+        else:
+            kwargs["enable_verbose"] = enable_verbose
+
+        # the worker processes don't have the instrument
+        send_file_events = (
+            workers > 1
+            and use_process
+            and self.instrument is not metrics.NULL_INSTRUMENT
+        )
+        operation = (
+            metrics.OP_ENCRYPT if method == "encrypt_file" else metrics.OP_DECRYPT
+        )
+
+        def callback(res: dirs.FileResult):
+            if send_file_events:
+                self.instrument.on_file_end(
+                    metrics.FileEvent(
+                        operation=operation,
+                        path=res.src,
+                        output_path=res.dst,
+                        bytes_in=res.size,
+                        bytes_out=os.path.getsize(res.dst) if res.ok else 0,
+                        chunks=0,
+                        wall_time=res.elapsed,
+                        cpu_time=0.0,
+                        error=res.error,
+                    )
+                )
+            if incremental and res.ok:
+                relpath = manifest_.relpath_of(path, res.src)
+                manifest.entries[relpath] = new_entries[relpath]
+            if dir_journal is not None and res.ok:
+                dir_journal.add(manifest_.relpath_of(path, res.src), res.src)
+            if workers > 1:
+                if res.ok:
+                    self._show(
+                        "Finished '%s'" % res.src,
+                        enable_verbose=enable_verbose,
+                    )
+                else:
+                    self._show(
+                        "Failed '%s': %s" % (res.src, res.error),
+                        enable_verbose=enable_verbose,
+                    )
+
+        try:
+            summary.results = dirs.run_tasks(
+                self,
+                method,
+                tasks,
+                workers=workers,
+                use_process=use_process,
+                fail_fast=fail_fast,
+                callback=callback,
+                **kwargs,
+            )
+        finally:
+            if incremental:
+                manifest.dump()
+        if dedup and summary.ok:
+            dedup_.finish_encrypt(self, output_path, index)
+        if dir_journal is not None and summary.ok:
+            dir_journal.remove()
+        if copies:
+            decrypted = {res.dst for res in summary.succeeded}
+            for src, dst in copies:
+                if src in decrypted:
+                    shutil.copyfile(src, dst)
+        summary.elapsed = time.perf_counter() - st
+        return summary
+
     def encrypt_dir(
         self,
         path: T_PATH_ARG,
@@ -186,6 +1012,15 @@ class BaseCipher:
         overwrite: bool = False,
         stream: bool = True,
         enable_verbose: bool = True,
+        incremental: bool = False,
+        use_hash: bool = False,
+        delete_removed: bool = False,
+        dedup: bool = False,
+        index: bool = False,
+        compression: T.Optional[str] = None,
+        chunk_size: T.Optional[int] = None,
+        resume: bool = True,
+        checkpoint_interval: T.Optional[float] = None,
     ):
         """
         Encrypt everything in a directory.
@@ -196,33 +1031,73 @@ class BaseCipher:
         :param stream: if it is a very big file, stream mode can avoid using
           too much memory
         :param enable_verbose: boolean, trigger on/off the help information
+        :param incremental: if True, keep a change manifest (see
+          :mod:`windtalker.manifest`) in the output dir, and only encrypt
+          new or changed files. The output dir can already exist.
+        :param use_hash: in incremental mode, also record the content hash,
+          so a file with a new mtime but the same content is not re-encrypted
+        :param delete_removed: in incremental mode, delete the encrypted
+          files whose source files are removed
+        :param dedup: if True, encrypt each unique file content only once
+          into an object store, see :mod:`windtalker.dedup`.
+          :meth:`BaseCipher.decrypt_dir` detects it automatically.
+        :param index: see :meth:`BaseCipher.encrypt_file`
+        :param compression: see :meth:`BaseCipher.encrypt_file`
+        :param chunk_size: see :meth:`BaseCipher.encrypt_file`
+        :param resume: if True, keep a directory journal of the complete
+          files in the output dir while it runs. If the run is interrupted,
+          the next run continues without ``overwrite``: the complete files
+          are skipped, and the interrupted files continue from their
+          checkpoint. Any other existing output still raises. See
+          :mod:`windtalker.checkpoint`
+        :param checkpoint_interval: see :meth:`BaseCipher.encrypt_file`
         """
         path, output_path = files.process_dst_overwrite_args(
             src=path,
             dst=output_path,
-            overwrite=overwrite,
+            overwrite=True,
             src_to_dst_func=files.get_encrypted_path,
         )
+        # only an interrupted run is resumed, any other existing output raises
+        files.process_dst_overwrite_args(
+            src=path,
+            dst=output_path,
+            overwrite=(
+                overwrite
+                or incremental
+                or (resume and checkpoint.DirJournal.exists(output_path))
+            ),
+        )
 
         self._show(
             "--- Encrypt directory '%s' ---" % path, enable_verbose=enable_verbose
         )
-        st = time.process_time()
-        for current_dir, _, file_list in os.walk(path.abspath):
-            new_dir = output_path.joinpath(Path(current_dir).relative_to(path))
-            new_dir.mkdir_if_not_exists()
-            for basename in file_list:
-                old_path = os.path.join(current_dir, basename)
-                new_path = new_dir.joinpath(basename)
-                self.encrypt_file(
-                    old_path,
-                    new_path,
-                    overwrite=overwrite,
-                    stream=stream,
-                    enable_verbose=enable_verbose,
-                )
+        st = time.perf_counter()
+        self._process_dir(
+            "encrypt_file",
+            path,
+            output_path,
+            overwrite=overwrite,
+            stream=stream,
+            enable_verbose=enable_verbose,
+            workers=1,
+            use_process=False,
+            fail_fast=True,
+            incremental=incremental,
+            use_hash=use_hash,
+            delete_removed=delete_removed,
+            dedup=dedup,
+            resume=resume,
+            file_kwargs=dict(
+                index=index,
+                compression=compression,
+                chunk_size=chunk_size,
+                resume=resume,
+                checkpoint_interval=checkpoint_interval,
+            ),
+        )
         self._show(
-            "Complete! Elapse %.6f seconds" % (time.process_time() - st,),
+            "Complete! Elapse %.6f seconds" % (time.perf_counter() - st,),
             enable_verbose=enable_verbose,
         )
         return output_path
@@ -255,23 +1130,259 @@ class BaseCipher:
         self._show(
             "--- Decrypt directory '%s' ---" % path, enable_verbose=enable_verbose
         )
-        st = time.process_time()
-        for current_dir, _, file_list in os.walk(path):
-            new_dir = output_path.joinpath(Path(current_dir).relative_to(path))
-            new_dir.mkdir_if_not_exists()
-            for basename in file_list:
-                old_path = os.path.join(current_dir, basename)
-                new_path = new_dir.joinpath(basename)
-                self.decrypt_file(
-                    old_path,
-                    new_path,
-                    overwrite=overwrite,
-                    stream=stream,
-                    enable_verbose=enable_verbose,
-                )
+        st = time.perf_counter()
+        self._process_dir(
+            "decrypt_file",
+            path,
+            output_path,
+            overwrite=overwrite,
+            stream=stream,
+            enable_verbose=enable_verbose,
+            workers=1,
+            use_process=False,
+            fail_fast=True,
+        )
+        self._show(
+            "Complete! Elapse %.6f seconds" % (time.perf_counter() - st,),
+            enable_verbose=enable_verbose,
+        )
+
+        return output_path
+
+    def encrypt_dir_parallel(
+        self,
+        path: T_PATH_ARG,
+        output_path: T.Optional[T_PATH_ARG] = None,
+        overwrite: bool = False,
+        stream: bool = True,
+        enable_verbose: bool = True,
+        workers: T.Optional[int] = None,
+        use_process: bool = True,
+        incremental: bool = False,
+        use_hash: bool = False,
+        delete_removed: bool = False,
+        dedup: bool = False,
+        index: bool = False,
+        compression: T.Optional[str] = None,
+        chunk_size: T.Optional[int] = None,
+        resume: bool = True,
+        checkpoint_interval: T.Optional[float] = None,
+    ) -> dirs.DirSummary:
+        """
+        Encrypt everything in a directory on a process pool (or thread pool).
+        The largest files are scheduled first. An error on one file doesn't
+        stop the others, it is recorded in the returned summary.
+
+        :param path: path of the dir you need to encrypt
+        :param output_path: encrypted dir output path
+        :param overwrite: if True, then silently overwrite output file if exists
+        :param stream: if it is a very big file, stream mode can avoid using
+          too much memory
+        :param enable_verbose: boolean, trigger on/off the help information
+        :param workers: number of workers, default is the number of CPU
+        :param use_process: if True, use process pool, each worker rebuilds
+          the cipher from :meth:`BaseCipher.to_key_material`. Otherwise,
+          use thread pool and share this cipher object.
+        :param incremental: see :meth:`BaseCipher.encrypt_dir`
+        :param use_hash: see :meth:`BaseCipher.encrypt_dir`
+        :param delete_removed: see :meth:`BaseCipher.encrypt_dir`
+        :param dedup: see :meth:`BaseCipher.encrypt_dir`
+        :param index: see :meth:`BaseCipher.encrypt_file`
+        :param compression: see :meth:`BaseCipher.encrypt_file`
+        :param chunk_size: see :meth:`BaseCipher.encrypt_file`
+        :param resume: see :meth:`BaseCipher.encrypt_dir`
+        :param checkpoint_interval: see :meth:`BaseCipher.encrypt_file`
+
+        :return: a :class:`~windtalker.dirs.DirSummary` object
+        """
+        path, output_path = files.process_dst_overwrite_args(
+            src=path,
+            dst=output_path,
+            overwrite=True,
+            src_to_dst_func=files.get_encrypted_path,
+        )
+        # only an interrupted run is resumed, any other existing output raises
+        files.process_dst_overwrite_args(
+            src=path,
+            dst=output_path,
+            overwrite=(
+                overwrite
+                or incremental
+                or (resume and checkpoint.DirJournal.exists(output_path))
+            ),
+        )
+        self._show(
+            "--- Encrypt directory '%s' ---" % path, enable_verbose=enable_verbose
+        )
+        summary = self._process_dir(
+            "encrypt_file",
+            path,
+            output_path,
+            overwrite=overwrite,
+            stream=stream,
+            enable_verbose=enable_verbose,
+            workers=workers or os.cpu_count() or 1,
+            use_process=use_process,
+            fail_fast=False,
+            incremental=incremental,
+            use_hash=use_hash,
+            delete_removed=delete_removed,
+            dedup=dedup,
+            resume=resume,
+            file_kwargs=dict(
+                index=index,
+                compression=compression,
+                chunk_size=chunk_size,
+                resume=resume,
+                checkpoint_interval=checkpoint_interval,
+            ),
+        )
         self._show(
-            "Complete! Elapse %.6f seconds" % (time.process_time() - st,),
+            "Complete! %s succeeded, %s failed, elapse %.6f seconds"
+            % (len(summary.succeeded), len(summary.failed), summary.elapsed),
             enable_verbose=enable_verbose,
         )
+        return summary
 
+    def decrypt_dir_parallel(
+        self,
+        path: T_PATH_ARG,
+        output_path: T.Optional[T_PATH_ARG] = None,
+        overwrite: bool = False,
+        stream: bool = True,
+        enable_verbose: bool = True,
+        workers: T.Optional[int] = None,
+        use_process: bool = True,
+    ) -> dirs.DirSummary:
+        """
+        Decrypt everything in a directory on a process pool (or thread pool).
+        See :meth:`BaseCipher.encrypt_dir_parallel`.
+
+        :return: a :class:`~windtalker.dirs.DirSummary` object
+        """
+        path, output_path = files.process_dst_overwrite_args(
+            src=path,
+            dst=output_path,
+            overwrite=overwrite,
+            src_to_dst_func=files.get_decrypted_path,
+        )
+        self._show(
+            "--- Decrypt directory '%s' ---" % path, enable_verbose=enable_verbose
+        )
+        summary = self._process_dir(
+            "decrypt_file",
+            path,
+            output_path,
+            overwrite=overwrite,
+            stream=stream,
+            enable_verbose=enable_verbose,
+            workers=workers or os.cpu_count() or 1,
+            use_process=use_process,
+            fail_fast=False,
+        )
+        self._show(
+            "Complete! %s succeeded, %s failed, elapse %.6f seconds"
+            % (len(summary.succeeded), len(summary.failed), summary.elapsed),
+            enable_verbose=enable_verbose,
+        )
+        return summary
+
+    def encrypt_dir_to_archive(
+        self,
+        path: T_PATH_ARG,
+        output_path: T.Optional[T_PATH_ARG] = None,
+        overwrite: bool = False,
+        enable_verbose: bool = True,
+    ) -> Path:
+        """
+        Pack everything in a directory into one encrypted archive file, see
+        :mod:`windtalker.archive`. It is much faster than
+        :meth:`BaseCipher.encrypt_dir` for a tree of many small files.
+
+        :param path: path of the dir you need to encrypt
+        :param output_path: encrypted archive file output path
+        :param overwrite: if True, then silently overwrite output file if exists
+        :param enable_verbose: boolean, trigger on/off the help information
+        """
+        path, output_path = files.process_dst_overwrite_args(
+            src=path,
+            dst=output_path,
+            overwrite=overwrite,
+            src_to_dst_func=files.get_encrypted_path,
+        )
+        self._show(
+            "--- Encrypt directory '%s' to archive ---" % path,
+            enable_verbose=enable_verbose,
+        )
+        st = time.perf_counter()
+        with files.atomic_write(output_path) as f_output, stream_.EncryptingWriter(
+            self, f_output, index=True, close_raw=False
+        ) as writer:
+            members = archive.pack_dir(writer, path)
+        self._show(
+            "Complete! %s members, elapse %.6f seconds"
+            % (len(members), time.perf_counter() - st),
+            enable_verbose=enable_verbose,
+        )
+        return output_path
+
+    def decrypt_archive(
+        self,
+        path: T_PATH_ARG,
+        output_path: T.Optional[T_PATH_ARG] = None,
+        overwrite: bool = False,
+        enable_verbose: bool = True,
+    ) -> Path:
+        """
+        Unpack an encrypted archive created by
+        :meth:`BaseCipher.encrypt_dir_to_archive` into a directory.
+
+        :param path: path of the encrypted archive file
+        :param output_path: decrypted dir output path
+        :param overwrite: if True, then silently overwrite output files if exists
+        :param enable_verbose: boolean, trigger on/off the help information
+        """
+        path, output_path = files.process_dst_overwrite_args(
+            src=path,
+            dst=output_path,
+            overwrite=overwrite,
+            src_to_dst_func=files.get_decrypted_path,
+        )
+        self._show(
+            "--- Decrypt archive '%s' ---" % path,
+            enable_verbose=enable_verbose,
+        )
+        st = time.perf_counter()
+        with stream_.DecryptingReader(self, path.open("rb")) as reader:
+            members = archive.unpack_dir(io.BufferedReader(reader), output_path)
+        self._show(
+            "Complete! %s members, elapse %.6f seconds"
+            % (len(members), time.perf_counter() - st),
+            enable_verbose=enable_verbose,
+        )
         return output_path
+
+    def list_archive(self, path: T_PATH_ARG) -> T.List[archive.Member]:
+        """
+        List the members of an encrypted archive, only the index is decrypted.
+        """
+        return archive.read_index(self, pathlib_mate.Path(path))
+
+    def read_archive_member(
+        self,
+        path: T_PATH_ARG,
+        member: T.Union[str, archive.Member],
+    ) -> archive.MemberReader:
+        """
+        Open one file from an encrypted archive without decrypting the rest,
+        it returns a readable binary file object that decrypts one chunk at a
+        time::
+
+            with cipher.read_archive_member(path, "images/photo.jpg") as f:
+                shutil.copyfileobj(f, f_out)
+
+        :param path: path of the encrypted archive file
+        :param member: the relative path (with ``/``) of the file in the
+          archive, or a member from :meth:`BaseCipher.list_archive`
+        """
+        return archive.read_member(self, pathlib_mate.Path(path), member)
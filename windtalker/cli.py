@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+"""
+The ``windtalker`` command line tool.
+
+Usage::
+
+    # file or directory, output is ``<path>-encrypted`` by default
+    windtalker encrypt my-file.txt
+    windtalker encrypt my-folder --workers 8
+    windtalker decrypt my-file-encrypted.txt -o my-file.txt
+    windtalker decrypt my-file-encrypted.txt -o - | less
+
+    # text
+    windtalker encrypt --text "Turn right at blue tree"
+
+    # stdin to stdout, nothing is written to disk
+    tar -c my-folder | windtalker encrypt --workers 4 | split -b 1G - backup.
+    cat backup.* | windtalker decrypt | tar -x
+
+The password is read from ``--password-file``, the environment variable
+given by ``--password-env`` or ``${HOME}/.windtalker``, in that order.
+
+Only the standard library is imported at start up, the cipher modules are
+imported when a command runs, so the tool starts fast in shell pipelines.
+"""
+
+import typing as T
+import os
+import sys
+import argparse
+
+from .exc import PasswordError, SignatureError, FileFormatError
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .cipher import BaseCipher
+
+STDIO = "-"
+
+_size_units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+def parse_size(value: str) -> int:
+    """
+    Parse a size like ``65536``, ``64K``, ``4M`` or ``1G``.
+    """
+    value = value.strip().upper().rstrip("B")
+    try:
+        if value and value[-1] in _size_units:
+            return int(float(value[:-1]) * _size_units[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size {value!r}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="windtalker",
+        description="Encrypt and decrypt text, files, directories and streams.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ["encrypt", "decrypt"]:
+        sub = subparsers.add_parser(command, help=f"{command} data")
+        sub.add_argument(
+            "path",
+            nargs="?",
+            default=STDIO,
+            help="file or directory, '-' (default) for stdin to stdout",
+        )
+        sub.add_argument("-o", "--output", help="output path, '-' for stdout")
+        sub.add_argument("-t", "--text", help=f"{command} this text instead")
+        sub.add_argument(
+            "--overwrite", action="store_true", help="overwrite the output"
+        )
+        sub.add_argument(
+            "-w", "--workers", type=int, default=1, help="number of workers"
+        )
+        sub.add_argument("--password-file", help="read the password from this file")
+        sub.add_argument(
+            "--password-env", help="read the password from this environment variable"
+        )
+        sub.add_argument(
+            "--kdf",
+            choices=["scrypt", "pbkdf2"],
+            help="derive the key with this KDF, default is the legacy key",
+        )
+        sub.add_argument(
+            "--salt",
+            help="base64 encoded salt for the KDF, "
+            "default is the salt in ${HOME}/.windtalker-salt",
+        )
+        sub.add_argument(
+            "--progress", action="store_true", help="print the progress to stderr"
+        )
+        sub.add_argument(
+            "--metrics", help="write json lines metrics events to this file"
+        )
+        sub.add_argument(
+            "-v", "--verbose", action="store_true", help="print the file names"
+        )
+        if command == "encrypt":
+            sub.add_argument(
+                "--chunk-size",
+                type=parse_size,
+                help="plain data chunk size, like 64K, 4M",
+            )
+            sub.add_argument(
+                "--compression",
+                choices=["zlib", "lzma", "bz2"],
+                help="compress each chunk before encryption",
+            )
+            sub.add_argument(
+                "--index",
+                action="store_true",
+                help="write a chunk index for random access",
+            )
+    return parser
+
+
+def read_password(args: argparse.Namespace) -> T.Optional[str]:
+    if args.password_file:
+        with open(args.password_file, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    if args.password_env:
+        try:
+            return os.environ[args.password_env]
+        except KeyError:
+            raise SystemExit(f"environment variable {args.password_env} is not set")
+    return None
+
+
+def make_cipher(args: argparse.Namespace) -> "BaseCipher":
+    from . import kdf
+    from .symmetric import SymmetricCipher, read_windtalker_password
+
+    password = read_password(args)
+    if password is None:
+        try:
+            password = read_windtalker_password()
+        except FileNotFoundError:
+            raise SystemExit(
+                "no password, use --password-file, --password-env "
+                "or create ${HOME}/.windtalker"
+            )
+    kdf_ = {None: None, "scrypt": kdf.Scrypt, "pbkdf2": kdf.PBKDF2}[args.kdf]
+    return SymmetricCipher(
+        password=password,
+        kdf=None if kdf_ is None else kdf_(),
+        salt=None if args.salt is None else kdf.decode_salt(args.salt, "--salt"),
+    )
+
+
+def make_instrument(args: argparse.Namespace, stack: list):
+    from . import metrics
+
+    instruments = list()
+    if args.progress:
+        instruments.append(metrics.ProgressReporter(stream=sys.stderr))
+    if args.metrics:
+        f = open(args.metrics, "a", encoding="utf-8")
+        stack.append(f)
+        instruments.append(metrics.JsonLinesExporter(f, chunks=True))
+    if not instruments:
+        return metrics.NULL_INSTRUMENT
+    if len(instruments) == 1:
+        return instruments[0]
+    return metrics.MultiInstrument(*instruments)
+
+
+def run(args: argparse.Namespace) -> int:
+    cipher = make_cipher(args)
+    encrypt = args.command == "encrypt"
+
+    if args.text is not None:
+        if encrypt:
+            print(cipher.encrypt_text(args.text))
+        else:
+            print(cipher.decrypt_text(args.text))
+        return 0
+
+    stack = list()
+    try:
+        cipher.instrument = make_instrument(args, stack)
+        kwargs = dict()
+        if encrypt:
+            kwargs = dict(
+                chunk_size=args.chunk_size,
+                compression=args.compression,
+                index=args.index,
+            )
+
+        if args.path == STDIO or args.output == STDIO:
+            if args.path == STDIO:
+                f_input = sys.stdin.buffer
+            elif os.path.isdir(args.path):
+                raise ValueError(f"can't write directory '{args.path}' to stdout")
+            else:
+                f_input = open(args.path, "rb")
+                stack.append(f_input)
+            f_output = sys.stdout.buffer
+            if args.output not in (None, STDIO):
+                f_output = open(args.output, "wb")
+                stack.append(f_output)
+            if encrypt:
+                cipher.encrypt_stream(f_input, f_output, workers=args.workers, **kwargs)
+            else:
+                cipher.decrypt_stream(f_input, f_output, workers=args.workers)
+            f_output.flush()
+            return 0
+
+        common = dict(
+            output_path=args.output,
+            overwrite=args.overwrite,
+            enable_verbose=args.verbose,
+        )
+        if os.path.isdir(args.path):
+            method = (
+                cipher.encrypt_dir_parallel if encrypt else cipher.decrypt_dir_parallel
+            )
+            summary = method(args.path, workers=args.workers, **common, **kwargs)
+            for res in summary.failed:
+                print(f"failed '{res.src}': {res.error}", file=sys.stderr)
+            return 0 if summary.ok else 1
+
+        method = cipher.encrypt_file if encrypt else cipher.decrypt_file
+        method(args.path, workers=args.workers, **common, **kwargs)
+        return 0
+    finally:
+        for f in stack:
+            f.close()
+
+
+def main(argv: T.Optional[T.List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return run(args)
+    except (
+        OSError,
+        ValueError,
+        PasswordError,
+        SignatureError,
+        FileFormatError,
+    ) as e:
+        print(f"windtalker: {e.__class__.__name__}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per chunk compression before encryption.
+
+Ciphertext cannot be compressed, so the only place to compress is before
+encryption. When a container file is written with compression, the plain
+data of each frame is one codec byte followed by the (maybe) compressed
+chunk::
+
+    +-------+--------------------------+
+    | codec | compressed or raw chunk  |
+    +-------+--------------------------+
+      1 B
+
+A chunk that doesn't shrink is stored raw with ``CODEC_NONE``. Before
+compressing a large chunk, a small sample is compressed with the fastest
+zlib level first, so already compressed data (images, videos, archives)
+costs almost no extra CPU.
+
+.. note::
+
+    Compression leaks information about the content through the ciphertext
+    size. Don't use it if an attacker can mix their own data with the secret
+    data in the same file.
+"""
+
+import typing as T
+import bz2
+import lzma
+import zlib
+
+from .exc import FileFormatError
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_BZ2 = 3
+
+codec_mapper = {
+    "zlib": CODEC_ZLIB,
+    "lzma": CODEC_LZMA,
+    "bz2": CODEC_BZ2,
+}
+
+_compressors = {
+    CODEC_ZLIB: zlib.compress,
+    CODEC_LZMA: lzma.compress,
+    CODEC_BZ2: bz2.compress,
+}
+
+_decompressors = {
+    CODEC_ZLIB: zlib.decompress,
+    CODEC_LZMA: lzma.decompress,
+    CODEC_BZ2: bz2.decompress,
+}
+
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_RATIO = 0.9
+"""
+If the sample doesn't shrink below this ratio, skip the chunk.
+"""
+
+
+def get_codec(name: str) -> int:
+    """
+    Get the codec id by name, one of "zlib", "lzma", "bz2".
+    """
+    try:
+        return codec_mapper[name]
+    except KeyError:
+        raise ValueError(
+            f"unknown compression {name!r}, available: {', '.join(codec_mapper)}"
+        )
+
+
+def is_compressible(chunk: bytes) -> bool:
+    """
+    Compress a small sample with the fastest zlib level to guess if the
+    chunk is worth compressing.
+    """
+    if len(chunk) <= SAMPLE_SIZE:
+        return True
+    sample = chunk[:SAMPLE_SIZE]
+    return len(zlib.compress(sample, 1)) < len(sample) * SAMPLE_RATIO
+
+
+def compress_chunk(chunk: bytes, codec: int) -> bytes:
+    """
+    Compress a chunk and prepend the codec byte. The chunk is stored raw if
+    it doesn't shrink.
+    """
+    if is_compressible(chunk):
+        data = _compressors[codec](chunk)
+        if len(data) < len(chunk):
+            return bytes((codec,)) + data
+    return bytes((CODEC_NONE,)) + chunk
+
+
+def decompress_chunk(data: bytes) -> bytes:
+    """
+    Reverse of :func:`compress_chunk`.
+    """
+    if not data:
+        raise FileFormatError("compressed chunk is empty!")
+    codec = data[0]
+    if codec == CODEC_NONE:
+        return data[1:]
+    try:
+        decompress = _decompressors[codec]
+    except KeyError:
+        raise FileFormatError(f"unknown compression codec {codec}!")
+    return decompress(data[1:])
+
+
+def wrap_encrypt_frame(
+    encrypt_frame: T.Callable[..., bytes],
+    codec: int,
+) -> T.Callable[..., bytes]:
+    """
+    Compress then encrypt. The other arguments (like the associated data)
+    are passed to ``encrypt_frame``.
+    """
+
+    def func(chunk: bytes, *args) -> bytes:
+        return encrypt_frame(compress_chunk(chunk, codec), *args)
+
+    return func
+
+
+def wrap_decrypt_frame(
+    decrypt_frame: T.Callable[..., bytes],
+) -> T.Callable[..., bytes]:
+    """
+    Decrypt then decompress. The other arguments (like the associated data)
+    are passed to ``decrypt_frame``.
+    """
+
+    def func(frame: bytes, *args) -> bytes:
+        return decompress_chunk(decrypt_frame(frame, *args))
+
+    return func
@@ -0,0 +1,1123 @@
+# -*- coding: utf-8 -*-
+
+"""
+The binary container format of encrypted files.
+
+Legacy windtalker encrypted file is simply the concatenation of the encrypted
+chunks, the reader has to know the exact encrypted chunk size to split them.
+The container format is a fixed size header followed by frames::
+
+    +--------+---------------------+---------------------+-----
+    | header | frame 1             | frame 2             | ...
+    |        | length | ciphertext | length | ciphertext |
+    +--------+---------------------+---------------------+-----
+      26 B     4 B      length B
+
+The header (version 3) is, all integers are big endian unsigned:
+
+==================  =====  ====================================================
+field               size   description
+==================  =====  ====================================================
+magic               4 B    ``b"\\x89WTK"``, it can never be the start of a
+                           legacy file, because Fernet token is base64 text
+version             1 B    format version
+cipher_id           1 B    which cipher wrote this file, see ``CIPHER_ID_*``
+flags               1 B    feature bits, see ``FLAG_*``
+chunk_size          4 B    plain data size of each chunk (except the last one)
+plaintext_length    8 B    total plain data size
+chunk_count         8 B    number of frames
+==================  =====  ====================================================
+
+``plaintext_length`` and ``chunk_count`` are filled in after all frames are
+written. If the output is not seekable (a pipe for example), they stay
+``0xFFFFFFFFFFFFFFFF``, which means unknown.
+
+Each frame is a 4 bytes length and the output of ``BaseCipher._encrypt_frame``,
+for :class:`~windtalker.symmetric.SymmetricCipher` it is the raw binary Fernet
+token without the base64 encoding.
+
+Since version 3, each frame is bound to its file and position by associated
+data (see :meth:`Header.frame_aad`): the SHA-256 of the header (with the
+counts unknown, the key block included), the frame number (8 B) and a final
+frame flag (1 B), it is 1 for the end frame only. The cipher authenticates
+it with the frame, so the frames can't be reordered, duplicated or dropped,
+and the header can't be changed.
+
+After the last frame, a zero length frame marks the end of frames, and it is
+followed by the end frame. It is an encrypted frame too, its plain data is
+the final chunk count and plaintext length (8 B each). The readers require
+it, and they compare it with what they decrypted (and with the header
+counts if they are known), so a file that lost its last frames is rejected
+even if it was written to a pipe::
+
+    +--------+-----+---------+---------+--------+-----------+---------
+    | header | ... | frame n | 0x0000  | length | end frame | index
+    +--------+-----+---------+---------+--------+-----------+---------
+                               4 B       4 B
+
+If ``FLAG_INDEX`` is set, the end frame is followed by the chunk index
+footer::
+
+    +-------------------------------------------+--------------+--------+
+    | frame 1 offset | ... | end frame offset   | index offset | "WTKI" |
+    +-------------------------------------------+--------------+--------+
+      8 B each                                    8 B            4 B
+
+All offsets are relative to the first byte of the header. With the index,
+:func:`read_range` can seek to any chunk directly. The index itself is not
+encrypted, but it can't mislead the reader: a frame only decrypts with its
+own frame number, and the end frame (at the last offset) only decrypts with
+the real chunk count, so a wrong offset or a wrong number of offsets fails
+authentication.
+
+If ``FLAG_KEY_BLOCK`` is set, the header is followed by a 4 bytes length and
+a key block, it is a part of the header. The cipher stores per file data in
+it, for example :class:`~windtalker.asymmetric.AsymmetricCipher` stores the
+RSA wrapped session key and its signature, see ``BaseCipher._begin_encrypt``.
+
+If ``FLAG_COMPRESSED`` is set, each chunk is compressed before encryption,
+see :mod:`windtalker.compress`. ``chunk_size`` and ``plaintext_length`` are
+still the sizes before compression, so random access works the same way.
+
+Version 1 files (magic + version only, no other header field) and version 2
+files (no end frame, the end of frames marker only comes with the index) are
+still readable.
+"""
+
+import typing as T
+import mmap
+import struct
+import hashlib
+import dataclasses
+import itertools
+
+from .exc import FileFormatError
+from .lazy import lazy_import
+
+files = lazy_import("windtalker.files")
+compress = lazy_import("windtalker.compress")
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .metrics import FileMeter
+
+MAGIC = b"\x89WTK"
+VERSION = 3
+
+CIPHER_ID_CUSTOM = 0
+CIPHER_ID_FERNET = 1
+CIPHER_ID_HYBRID_RSA = 2
+CIPHER_ID_HYBRID_RSA_OAEP = 3
+CIPHER_ID_HYBRID_X25519 = 4
+
+FLAG_INDEX = 0x01
+FLAG_COMPRESSED = 0x02
+FLAG_KEY_BLOCK = 0x04
+
+MAX_KEY_BLOCK_SIZE = 64 * 1024
+
+# the chunk size is an u32 in the header, and the frame of a chunk (with the
+# cipher and compression overhead) must fit in the u32 frame length
+MAX_CHUNK_SIZE = 2**31
+
+UNKNOWN = 0xFFFFFFFFFFFFFFFF
+
+INDEX_MAGIC = b"WTKI"
+
+_preamble = struct.Struct(">4sB")
+_header_v2_fields = struct.Struct(">BBIQQ")
+_frame_length = struct.Struct(">I")
+_offset = struct.Struct(">Q")
+_trailer = struct.Struct(">Q4s")
+_end_frame = struct.Struct(">QQ")
+_frame_aad = struct.Struct(">Q?")
+
+PREAMBLE_SIZE = _preamble.size
+FRAME_LENGTH_SIZE = _frame_length.size
+
+
+@dataclasses.dataclass
+class Header:
+    """
+    The container file header. See :mod:`windtalker.container` for the
+    binary layout.
+
+    :param plaintext_length: None if unknown
+    :param chunk_count: None if unknown
+    :param key_block: the cipher's per file data, ``FLAG_KEY_BLOCK`` is set
+      if it is not empty
+    """
+
+    version: int = VERSION
+    cipher_id: int = CIPHER_ID_CUSTOM
+    flags: int = 0
+    chunk_size: int = 0
+    plaintext_length: T.Optional[int] = None
+    chunk_count: T.Optional[int] = None
+    key_block: bytes = b""
+
+    @property
+    def has_index(self) -> bool:
+        return bool(self.flags & FLAG_INDEX)
+
+    @property
+    def is_compressed(self) -> bool:
+        return bool(self.flags & FLAG_COMPRESSED)
+
+    @property
+    def has_end_frame(self) -> bool:
+        return self.version >= 3
+
+    def frame_aad(self, number: int, final: bool = False) -> bytes:
+        """
+        The associated data of a frame, the cipher authenticates it with the
+        frame. It is empty before version 3.
+
+        :param number: the frame number, starting from 0, the end frame's
+          number is the chunk count
+        :param final: True for the end frame
+        """
+        if self.version < 3:
+            return b""
+        static_header = dataclasses.replace(
+            self, plaintext_length=None, chunk_count=None
+        )
+        return hashlib.sha256(static_header.pack()).digest() + _frame_aad.pack(
+            number, final
+        )
+
+    def wrap_decrypt_frame(
+        self,
+        decrypt_frame: T.Callable[[bytes, bytes], bytes],
+    ) -> T.Callable[[bytes, bytes], bytes]:
+        """
+        Add the decompression stage if the file is compressed.
+        """
+        if self.is_compressed:
+            return compress.wrap_decrypt_frame(decrypt_frame)
+        return decrypt_frame
+
+    @property
+    def size(self) -> int:
+        """
+        The size of the header in bytes.
+        """
+        if self.version == 1:
+            return PREAMBLE_SIZE
+        size = PREAMBLE_SIZE + _header_v2_fields.size
+        if self.key_block:
+            size += _frame_length.size + len(self.key_block)
+        return size
+
+    def pack(self) -> bytes:
+        flags = self.flags
+        if self.key_block:
+            flags |= FLAG_KEY_BLOCK
+        data = _preamble.pack(MAGIC, self.version) + _header_v2_fields.pack(
+            self.cipher_id,
+            flags,
+            self.chunk_size,
+            UNKNOWN if self.plaintext_length is None else self.plaintext_length,
+            UNKNOWN if self.chunk_count is None else self.chunk_count,
+        )
+        if self.key_block:
+            data += pack_frame(self.key_block)
+        return data
+
+    @classmethod
+    def read(cls, f) -> "Header":
+        """
+        Read the header from the current position of a binary file object.
+        """
+        data = f.read(PREAMBLE_SIZE)
+        if not is_container(data):
+            raise FileFormatError("not a windtalker encrypted file!")
+        if len(data) < PREAMBLE_SIZE:
+            raise FileFormatError("file is truncated!")
+        _, version = _preamble.unpack(data)
+        if version == 1:
+            return cls(version=version)
+        if version not in (2, VERSION):
+            raise FileFormatError(f"unsupported container version {version}!")
+        data = f.read(_header_v2_fields.size)
+        if len(data) < _header_v2_fields.size:
+            raise FileFormatError("file is truncated!")
+        (
+            cipher_id,
+            flags,
+            chunk_size,
+            plaintext_length,
+            chunk_count,
+        ) = _header_v2_fields.unpack(data)
+        key_block = b""
+        if flags & FLAG_KEY_BLOCK:
+            data = f.read(_frame_length.size)
+            if len(data) < _frame_length.size:
+                raise FileFormatError("file is truncated!")
+            (length,) = _frame_length.unpack(data)
+            if length > MAX_KEY_BLOCK_SIZE:
+                raise FileFormatError("key block is too large!")
+            key_block = f.read(length)
+            if len(key_block) < length:
+                raise FileFormatError("file is truncated!")
+        return cls(
+            version=version,
+            cipher_id=cipher_id,
+            flags=flags,
+            chunk_size=chunk_size,
+            plaintext_length=None if plaintext_length == UNKNOWN else plaintext_length,
+            chunk_count=None if chunk_count == UNKNOWN else chunk_count,
+            key_block=key_block,
+        )
+
+
+def is_container(head: bytes) -> bool:
+    """
+    Test if the first few bytes of a file is the container magic bytes.
+    """
+    return head[: len(MAGIC)] == MAGIC
+
+
+def is_container_file(f) -> bool:
+    """
+    Test if a seekable binary file object is in container format. The file
+    position is restored.
+    """
+    pos = f.tell()
+    head = f.read(len(MAGIC))
+    f.seek(pos)
+    return is_container(head)
+
+
+def header_size(head: bytes) -> int:
+    """
+    The size of a header starting with ``head``, as far as these bytes can
+    tell. Read until you have that many bytes, call it again, and stop when
+    it doesn't grow, then parse them with :meth:`Header.read`. It is for the
+    readers that can't use :meth:`Header.read` directly, like an
+    ``asyncio.StreamReader``.
+    """
+    size = PREAMBLE_SIZE
+    if len(head) < size or not is_container(head):
+        return size
+    _, version = _preamble.unpack_from(head)
+    if version not in (2, VERSION):  # version 1, or Header.read rejects it
+        return size
+    size += _header_v2_fields.size
+    if len(head) < size:
+        return size
+    _, flags, *_ = _header_v2_fields.unpack_from(head, PREAMBLE_SIZE)
+    if not flags & FLAG_KEY_BLOCK:
+        return size
+    size += _frame_length.size
+    if len(head) < size:
+        return size
+    (length,) = _frame_length.unpack_from(head, size - _frame_length.size)
+    if length > MAX_KEY_BLOCK_SIZE:  # Header.read rejects it
+        return size
+    return size + length
+
+
+def unpack_frame_length(data: bytes) -> int:
+    """
+    Parse the length prefix of a frame.
+    """
+    (length,) = _frame_length.unpack(data)
+    return length
+
+
+def inspect_file(path) -> Header:
+    """
+    Read the header of a container format encrypted file, without reading
+    and decrypting any frame.
+    """
+    with open(path, "rb") as f:
+        return Header.read(f)
+
+
+def pack_frame(payload: bytes) -> bytes:
+    return _frame_length.pack(len(payload)) + payload
+
+
+def _is_buffer(obj) -> bool:
+    return isinstance(obj, (bytes, bytearray, memoryview, mmap.mmap))
+
+
+class _BufferReader:
+    """
+    A minimal file-like reader over a memoryview, to parse the header.
+    """
+
+    def __init__(self, view: memoryview):
+        self.view = view
+        self.position = 0
+
+    def read(self, n: int) -> bytes:
+        data = self.view[self.position : self.position + n].tobytes()
+        self.position += len(data)
+        return data
+
+
+def encrypted_size(
+    plaintext_length: int,
+    chunk_size: int,
+    frame_size: T.Callable[[int], T.Optional[int]],
+    index: bool = False,
+    key_block_size: int = 0,
+) -> T.Optional[int]:
+    """
+    Compute the exact container file size before encryption.
+
+    :param frame_size: the function to compute the frame payload size from
+      the chunk size, see ``BaseCipher._frame_size``
+    :param key_block_size: the size of the key block in the header
+
+    :return: None if the frame size is unknown
+    """
+    full_count, rest = divmod(plaintext_length, chunk_size)
+    full_size = frame_size(chunk_size)
+    if full_size is None:
+        return None
+    total = Header(key_block=b"\x00" * key_block_size).size
+    total += full_count * (_frame_length.size + full_size)
+    chunk_count = full_count
+    if rest:
+        total += _frame_length.size + frame_size(rest)
+        chunk_count += 1
+    # the end of frames marker and the end frame
+    total += 2 * _frame_length.size + frame_size(_end_frame.size)
+    if index:
+        total += (chunk_count + 1) * _offset.size + _trailer.size
+    return total
+
+
+def iter_frame_views(
+    buffer,
+    position: int,
+    header: T.Optional[Header] = None,
+) -> T.Iterator[memoryview]:
+    """
+    Same as :func:`iter_frames`, but slice the frames from a bytes-like
+    object (like a :class:`mmap.mmap`) without copying.
+
+    :param position: the position of the first frame
+    """
+    has_marker = _has_marker(header)
+    size = _frame_length.size
+    is_end_frame = False
+    with memoryview(buffer) as view:
+        end = len(view)
+        while 1:
+            if position == end:
+                if has_marker:
+                    raise FileFormatError("file is truncated!")
+                break
+            if position + size > end:
+                raise FileFormatError("file is truncated!")
+            (length,) = _frame_length.unpack_from(view, position)
+            position += size
+            if has_marker and length == 0 and not is_end_frame:
+                if not header.has_end_frame:
+                    break
+                is_end_frame = True
+                continue
+            if position + length > end:
+                raise FileFormatError("file is truncated!")
+            if is_end_frame:
+                yield EndFrame(view[position : position + length])
+                break
+            yield view[position : position + length]
+            position += length
+
+
+def _has_marker(header: T.Optional[Header]) -> bool:
+    return header is not None and (header.has_index or header.has_end_frame)
+
+
+class EndFrame(bytes):
+    """
+    The payload of the end frame. :func:`iter_frames` and
+    :func:`iter_frame_views` yield it after the data frames, it is decrypted
+    by the frame decrypt function without decompression, and checked by
+    :func:`check_end_frame`.
+    """
+
+
+def iter_frames(f, header: T.Optional[Header] = None) -> T.Iterator[bytes]:
+    """
+    Read frame payload one by one until EOF, or until the end of frames
+    marker if the file has one. If the file has an end frame, it is yielded
+    last as an :class:`EndFrame`, and it must be there.
+    """
+    has_marker = _has_marker(header)
+    size = _frame_length.size
+    is_end_frame = False
+    while 1:
+        data = f.read(size)
+        if not data:
+            if has_marker:
+                raise FileFormatError("file is truncated!")
+            break
+        if len(data) < size:
+            raise FileFormatError("file is truncated!")
+        (length,) = _frame_length.unpack(data)
+        if has_marker and length == 0 and not is_end_frame:
+            if not header.has_end_frame:
+                break
+            is_end_frame = True
+            continue
+        payload = f.read(length)
+        if len(payload) < length:
+            raise FileFormatError("file is truncated!")
+        if is_end_frame:
+            yield EndFrame(payload)
+            break
+        yield payload
+
+
+def scan_frames(f, header: Header, chunk_count: int) -> T.Tuple[T.List[int], int]:
+    """
+    Walk the first ``chunk_count`` frames after the header of a seekable
+    file by their length prefix, the payloads are skipped, not read.
+
+    :return: the frame offsets and the end of the last frame, relative to
+      the header
+    """
+    end = f.seek(0, 2)
+    position = header.size
+    offsets = list()
+    for _ in range(chunk_count):
+        f.seek(position)
+        data = f.read(_frame_length.size)
+        if len(data) < _frame_length.size:
+            raise FileFormatError("file is truncated!")
+        (length,) = _frame_length.unpack(data)
+        offsets.append(position)
+        position += _frame_length.size + length
+    if position > end:
+        raise FileFormatError("file is truncated!")
+    return offsets, position
+
+
+def _map(
+    func: T.Callable,
+    iterable: T.Iterable,
+    workers: int,
+) -> T.Iterable:
+    if workers > 1:
+        return files.imap_ordered(func, iterable, workers=workers)
+    else:
+        return map(func, iterable)
+
+
+def _seekable(f) -> bool:
+    try:
+        return f.seekable()
+    except AttributeError:  # pragma: no cover
+        return False
+
+
+def new_header(
+    cipher_id: int = CIPHER_ID_CUSTOM,
+    chunk_size: int = 0,
+    index: bool = False,
+    compressed: bool = False,
+) -> Header:
+    """
+    The header of a new container, without the key block and the counts.
+    It is given to ``BaseCipher._begin_encrypt``, so a cipher can sign it.
+
+    :param index: if True, set ``FLAG_INDEX``
+    :param compressed: if True, set ``FLAG_COMPRESSED``
+    """
+    flags = 0
+    if index:
+        flags |= FLAG_INDEX
+    if compressed:
+        flags |= FLAG_COMPRESSED
+    return Header(cipher_id=cipher_id, flags=flags, chunk_size=chunk_size)
+
+
+class ContainerWriter:
+    """
+    Write the header, the frames and the chunk index footer of a container
+    to a binary file object.
+
+    :param f_output: writable binary file object, if it is seekable, the
+      header is updated with the total length and chunk count at the end
+    :param cipher_id: the cipher id to write in the header
+    :param chunk_size: plain data chunk size
+    :param index: if True, write the chunk index footer
+    :param compressed: if True, set ``FLAG_COMPRESSED``, the tokens must be
+      compressed by :mod:`windtalker.compress` before encryption
+    :param key_block: the cipher's per file data to store in the header
+    """
+
+    def __init__(
+        self,
+        f_output,
+        cipher_id: int = CIPHER_ID_CUSTOM,
+        chunk_size: int = 0,
+        index: bool = False,
+        compressed: bool = False,
+        key_block: bytes = b"",
+    ):
+        self.f_output = f_output
+        self.header = new_header(
+            cipher_id=cipher_id,
+            chunk_size=chunk_size,
+            index=index,
+            compressed=compressed,
+        )
+        self.header.key_block = key_block
+        self.offsets = list()
+        self.plaintext_length = 0
+        self.chunk_count = 0
+        self._seekable = _seekable(f_output)
+        if self._seekable:
+            self._header_pos = f_output.tell()
+        packed_header = self.header.pack()
+        f_output.write(packed_header)
+        self.position = len(packed_header)  # relative to the header
+
+    @classmethod
+    def reopen(
+        cls,
+        f_output,
+        header: Header,
+        offsets: T.List[int],
+        position: int,
+        plaintext_length: int,
+    ) -> "ContainerWriter":
+        """
+        Continue a container partially written to a seekable file, see
+        :mod:`windtalker.checkpoint`. The header must be at position 0,
+        anything after ``position`` is dropped.
+
+        :param offsets: the offsets of the frames already written, see
+          :func:`scan_frames`
+        :param position: the end of the last frame
+        :param plaintext_length: the size of the data already encrypted
+        """
+        writer = cls.__new__(cls)
+        writer.f_output = f_output
+        writer.header = header
+        writer.offsets = list(offsets) if header.has_index else list()
+        writer.plaintext_length = plaintext_length
+        writer.chunk_count = len(offsets)
+        writer._seekable = True
+        writer._header_pos = 0
+        writer.position = position
+        f_output.seek(position)
+        f_output.truncate()
+        return writer
+
+    def write_frame(self, token: bytes, plaintext_length: int):
+        """
+        :param token: the encrypted chunk
+        :param plaintext_length: the size of the chunk before encryption
+        """
+        # write the length and the token separately, so the token (it may be
+        # a big chunk) is not copied
+        self.f_output.write(_frame_length.pack(len(token)))
+        self.f_output.write(token)
+        if self.header.has_index:
+            self.offsets.append(self.position)
+        self.position += _frame_length.size + len(token)
+        self.plaintext_length += plaintext_length
+        self.chunk_count += 1
+
+    def finish(self, encrypt_frame: T.Callable[[bytes, bytes], bytes]) -> Header:
+        """
+        Write the end of frames marker, the end frame and the index footer,
+        and update the header if the output is seekable.
+
+        :param encrypt_frame: the function to encrypt the end frame, without
+          the compression stage
+
+        :return: the final header
+        """
+        end_frame = encrypt_frame(
+            _end_frame.pack(self.chunk_count, self.plaintext_length),
+            self.header.frame_aad(self.chunk_count, final=True),
+        )
+        self.f_output.write(_frame_length.pack(0))
+        self.f_output.write(pack_frame(end_frame))
+        end_frame_offset = self.position + _frame_length.size
+        self.position += 2 * _frame_length.size + len(end_frame)
+        if self.header.has_index:
+            index = pack_index(self.offsets + [end_frame_offset], self.position)
+            self.f_output.write(index)
+            self.position += len(index)
+        self.header.plaintext_length = self.plaintext_length
+        self.header.chunk_count = self.chunk_count
+        if self._seekable:
+            end_pos = self.f_output.tell()
+            self.f_output.seek(self._header_pos)
+            self.f_output.write(self.header.pack())
+            self.f_output.seek(end_pos)
+        return self.header
+
+
+def encrypt_stream(
+    f_input,
+    f_output,
+    encrypt_frame: T.Callable[[bytes, bytes], bytes],
+    chunksize: int,
+    stream: bool = True,
+    workers: int = 1,
+    cipher_id: int = CIPHER_ID_CUSTOM,
+    index: bool = False,
+    compression: T.Optional[str] = None,
+    key_block: bytes = b"",
+    meter: T.Optional["FileMeter"] = None,
+    writer: T.Optional[ContainerWriter] = None,
+    on_frame: T.Optional[T.Callable[[ContainerWriter], T.Any]] = None,
+) -> Header:
+    """
+    Read plain data from ``f_input``, write container format encrypted data
+    to ``f_output``.
+
+    :param f_input: readable binary file object, or a bytes-like object
+      (like a :class:`mmap.mmap`), the chunks are sliced from it without
+      copying
+    :param f_output: writable binary file object, if it is seekable, the
+      header is updated with the total length and chunk count at the end
+    :param encrypt_frame: the function to encrypt one chunk, it takes the
+      chunk and its associated data (see :meth:`Header.frame_aad`)
+    :param chunksize: plain data chunk size
+    :param stream: if False, read the whole input as one chunk, an input
+      larger than :data:`MAX_CHUNK_SIZE` is split into chunks of that size
+    :param workers: number of threads to encrypt chunks in parallel
+    :param cipher_id: the cipher id to write in the header
+    :param index: if True, write the chunk index footer
+    :param compression: compress each chunk before encryption, one of
+      "zlib", "lzma", "bz2", see :mod:`windtalker.compress`
+    :param key_block: the cipher's per file data to store in the header
+    :param meter: if given, measure each chunk, see :mod:`windtalker.metrics`
+    :param writer: a reopened writer (see :meth:`ContainerWriter.reopen`),
+      to continue a partially written file, the input is read from
+      ``writer.plaintext_length``. The header arguments are ignored.
+    :param on_frame: called with the writer after each frame is written,
+      see :mod:`windtalker.checkpoint`
+
+    :return: the final header
+    """
+    offset = 0 if writer is None else writer.plaintext_length
+    encrypt_end_frame = encrypt_frame
+    if compression is not None:
+        encrypt_frame = compress.wrap_encrypt_frame(
+            encrypt_frame, compress.get_codec(compression)
+        )
+    is_buffer = _is_buffer(f_input)
+    if not stream:
+        chunksize = min(len(f_input), MAX_CHUNK_SIZE) if is_buffer else None
+    if is_buffer:
+        chunks = files.iter_views(f_input, chunksize or 1, offset)
+    elif stream:
+        if offset:
+            f_input.seek(offset)
+        chunks = files.iter_chunks(f_input, chunksize)
+    else:
+        chunks = [f_input.read(MAX_CHUNK_SIZE)]
+        chunksize = len(chunks[0])
+        if chunksize == MAX_CHUNK_SIZE:
+            chunks = itertools.chain(chunks, files.iter_chunks(f_input, chunksize))
+    if writer is None:
+        writer = ContainerWriter(
+            f_output,
+            cipher_id=cipher_id,
+            chunk_size=chunksize,
+            index=index,
+            compressed=compression is not None,
+            key_block=key_block,
+        )
+    if meter is not None:
+        chunks = meter.count(chunks)
+        encrypt_frame = meter.wrap(encrypt_frame)
+    header = writer.header
+
+    def func(item: T.Tuple[int, bytes]) -> T.Tuple[bytes, int]:
+        number, chunk = item
+        return encrypt_frame(chunk, header.frame_aad(number)), len(chunk)
+
+    for token, plaintext_length in _map(
+        func,
+        enumerate(chunks, start=writer.chunk_count),
+        workers,
+    ):
+        writer.write_frame(token, plaintext_length)
+        if on_frame is not None:
+            on_frame(writer)
+    return writer.finish(encrypt_end_frame)
+
+
+def decrypt_stream(
+    f_input,
+    f_output,
+    decrypt_frame: T.Callable[[bytes, bytes], bytes],
+    workers: int = 1,
+    cipher_id: T.Optional[int] = None,
+    meter: T.Optional["FileMeter"] = None,
+    header: T.Optional[Header] = None,
+) -> Header:
+    """
+    Read container format encrypted data from ``f_input``, write plain data
+    to ``f_output``.
+
+    :param f_input: readable binary file object, or a bytes-like object
+      (like a :class:`mmap.mmap`), the frames are sliced from it without
+      copying
+    :param f_output: writable binary file object
+    :param decrypt_frame: the function to decrypt one frame, it takes the
+      frame and its associated data (see :meth:`Header.frame_aad`)
+    :param workers: number of threads to decrypt frames in parallel
+    :param cipher_id: if given, raise :class:`~windtalker.exc.FileFormatError`
+      when the file is written by another cipher
+    :param meter: if given, measure each frame, see :mod:`windtalker.metrics`
+    :param header: the header already read from the file object ``f_input``,
+      for input that can't seek back, like a pipe
+
+    :return: the header
+    """
+    if header is not None:
+        frames = iter_frames(f_input, header)
+    elif _is_buffer(f_input):
+        with memoryview(f_input) as view:
+            header = Header.read(_BufferReader(view))
+        frames = iter_frame_views(f_input, header.size, header)
+    else:
+        header = Header.read(f_input)
+        frames = iter_frames(f_input, header)
+    check_cipher_id(header, cipher_id)
+    for content in decrypt_frames(
+        frames, header, decrypt_frame, workers=workers, meter=meter
+    ):
+        f_output.write(content)
+    return header
+
+
+def decrypt_frames(
+    frames: T.Iterable[bytes],
+    header: Header,
+    decrypt_frame: T.Callable[[bytes, bytes], bytes],
+    workers: int = 1,
+    meter: T.Optional["FileMeter"] = None,
+) -> T.Iterator[bytes]:
+    """
+    Decrypt the frames from :func:`iter_frames` or :func:`iter_frame_views`
+    in order, then check the end frame and the counts, see
+    :func:`check_end_frame`.
+
+    :param decrypt_frame: the function to decrypt one frame, without the
+      decompression stage
+    """
+    decrypt_chunk = header.wrap_decrypt_frame(decrypt_frame)
+    if meter is not None:
+        frames = meter.count(frames)
+        decrypt_chunk = meter.wrap(decrypt_chunk)
+
+    def func(item: T.Tuple[int, bytes]) -> bytes:
+        number, frame = item
+        if isinstance(frame, EndFrame):
+            return EndFrame(decrypt_frame(frame, header.frame_aad(number, final=True)))
+        return decrypt_chunk(frame, header.frame_aad(number))
+
+    plaintext_length = 0
+    chunk_count = 0
+    end_frame = None
+    for content in _map(func, enumerate(frames), workers):
+        if isinstance(content, EndFrame):
+            end_frame = content
+            continue
+        plaintext_length += len(content)
+        chunk_count += 1
+        yield content
+    check_end_frame(header, end_frame, plaintext_length, chunk_count)
+
+
+def check_end_frame(
+    header: Header,
+    end_frame: T.Optional[bytes],
+    plaintext_length: int,
+    chunk_count: int,
+):
+    """
+    Raise :class:`~windtalker.exc.FileFormatError` if the decrypted end
+    frame is missing, or the decrypted data doesn't match the counts in the
+    end frame, or in the header (see :func:`check_counts`).
+
+    :param end_frame: the decrypted end frame, None if there isn't one
+    :param plaintext_length: None if unknown, it is not checked
+    """
+    if header.has_end_frame:
+        if end_frame is None or len(end_frame) != _end_frame.size:
+            raise FileFormatError("the end frame is missing, file is truncated!")
+        expected_chunk_count, expected_plaintext_length = _end_frame.unpack(end_frame)
+        _check_counts(
+            expected_plaintext_length,
+            expected_chunk_count,
+            plaintext_length,
+            chunk_count,
+        )
+    check_counts(header, plaintext_length, chunk_count)
+
+
+def check_counts(
+    header: Header,
+    plaintext_length: T.Optional[int],
+    chunk_count: int,
+):
+    """
+    Raise :class:`~windtalker.exc.FileFormatError` if the decrypted data
+    doesn't match the plaintext length and chunk count in the header.
+
+    :param plaintext_length: None if unknown, it is not checked
+    """
+    _check_counts(
+        header.plaintext_length,
+        header.chunk_count,
+        plaintext_length,
+        chunk_count,
+    )
+
+
+def _check_counts(
+    expected_plaintext_length: T.Optional[int],
+    expected_chunk_count: T.Optional[int],
+    plaintext_length: T.Optional[int],
+    chunk_count: int,
+):
+    if expected_chunk_count is not None and expected_chunk_count != chunk_count:
+        raise FileFormatError(
+            f"expect {expected_chunk_count} chunks, found {chunk_count}, "
+            f"file is truncated!"
+        )
+    if (
+        expected_plaintext_length is not None
+        and plaintext_length is not None
+        and expected_plaintext_length != plaintext_length
+    ):
+        raise FileFormatError(
+            f"expect {expected_plaintext_length} bytes, found {plaintext_length}, "
+            f"file is truncated!"
+        )
+
+
+def check_cipher_id(header: Header, cipher_id: T.Optional[int]):
+    """
+    Raise :class:`~windtalker.exc.FileFormatError` if the file is written by
+    another cipher.
+    """
+    if header.version == 1 or cipher_id is None:
+        return
+    if header.cipher_id != cipher_id:
+        raise FileFormatError(
+            f"the file is encrypted by cipher id {header.cipher_id}, "
+            f"but current cipher id is {cipher_id}!"
+        )
+
+
+def pack_index(offsets: T.List[int], position: int) -> bytes:
+    """
+    Create the chunk index footer.
+
+    :param offsets: the frame offsets, and the end frame offset since
+      version 3
+    :param position: the current position relative to the header, where the
+      index will be written
+    """
+    return b"".join(
+        [
+            b"".join([_offset.pack(offset) for offset in offsets]),
+            _trailer.pack(position, INDEX_MAGIC),
+        ]
+    )
+
+
+def _read_index_trailer(f, header: Header, base: int) -> T.Tuple[int, int]:
+    """
+    :return: the index offset and the number of data frames in the index
+    """
+    trailer_pos = f.seek(-_trailer.size, 2)
+    index_offset, magic = _trailer.unpack(f.read(_trailer.size))
+    if magic != INDEX_MAGIC or base + index_offset > trailer_pos:
+        raise FileFormatError("chunk index is corrupted!")
+    entries = (trailer_pos - base - index_offset) // _offset.size
+    if header.has_end_frame:  # the last entry is the end frame
+        if entries == 0:
+            raise FileFormatError("chunk index is corrupted!")
+        entries -= 1
+    return index_offset, entries
+
+
+def _find_end_frame(f, header: Header, base: int) -> T.Tuple[int, int]:
+    """
+    Find the end frame by the index, or by skipping over the frames.
+
+    :return: the number of data frames before it, and its offset
+    """
+    if header.has_index:
+        index_offset, chunk_count = _read_index_trailer(f, header, base)
+        f.seek(base + index_offset + chunk_count * _offset.size)
+        (offset,) = _offset.unpack(f.read(_offset.size))
+        return chunk_count, offset
+    chunk_count = 0
+    position = header.size
+    while 1:
+        length = _read_frame_length_at(f, base + position)
+        position += _frame_length.size
+        if length == 0:
+            return chunk_count, position
+        position += length
+        chunk_count += 1
+
+
+def _read_frame_length_at(f, position: int) -> int:
+    f.seek(position)
+    data = f.read(_frame_length.size)
+    if len(data) < _frame_length.size:
+        raise FileFormatError("file is truncated!")
+    (length,) = _frame_length.unpack(data)
+    return length
+
+
+def _read_frame_at(f, position: int) -> bytes:
+    length = _read_frame_length_at(f, position)
+    payload = f.read(length)
+    if len(payload) < length:
+        raise FileFormatError("file is truncated!")
+    return payload
+
+
+def read_frame_offsets(
+    f,
+    header: Header,
+    first: int,
+    last: int,
+    base: int = 0,
+) -> T.List[int]:
+    """
+    Find the offsets of the frames from ``first`` to ``last`` (inclusive).
+    If the file has an index, read it from the footer, otherwise skip over
+    the frames one by one.
+
+    :param base: the absolute position of the header in the file
+    """
+    if header.has_index:
+        index_offset, chunk_count = _read_index_trailer(f, header, base)
+        last = min(last, chunk_count - 1)
+        if first > last:  # the range is beyond the end of file
+            return []
+        f.seek(base + index_offset + first * _offset.size)
+        data = f.read((last - first + 1) * _offset.size)
+        return [offset for (offset,) in _offset.iter_unpack(data)]
+
+    offsets = list()
+    position = header.size
+    for nth in range(last + 1):
+        f.seek(base + position)
+        data = f.read(_frame_length.size)
+        if not data:  # the range is beyond the end of file
+            break
+        if len(data) < _frame_length.size:
+            raise FileFormatError("file is truncated!")
+        (length,) = _frame_length.unpack(data)
+        if length == 0 and _has_marker(header):  # the end of frames
+            break
+        if nth >= first:
+            offsets.append(position)
+        position += _frame_length.size + length
+    return offsets
+
+
+def read_range(
+    f,
+    decrypt_frame: T.Callable[[bytes, bytes], bytes],
+    start: int,
+    length: int,
+    cipher_id: T.Optional[int] = None,
+) -> bytes:
+    """
+    Decrypt ``length`` bytes of plain data from ``start``, only the frames
+    covering this range are read and decrypted.
+
+    Since version 3, the header counts are not used, they are not
+    authenticated. Each frame is decrypted with its frame number, and if the
+    range reaches the end of the data, the end frame is decrypted to check
+    that no frame is missing.
+
+    :param f: seekable binary file object, positioned at the header
+    :param decrypt_frame: the function to decrypt one frame
+    :param start: start position in the plain data
+    :param length: number of bytes to read
+    :param cipher_id: if given, raise :class:`~windtalker.exc.FileFormatError`
+      when the file is written by another cipher
+    """
+    if start < 0 or length < 0:
+        raise ValueError("start and length cannot be negative!")
+    base = f.tell()
+    header = Header.read(f)
+    check_cipher_id(header, cipher_id)
+    if header.version == 1 or header.chunk_size == 0:
+        raise FileFormatError("this file doesn't support random access!")
+    decrypt_chunk = header.wrap_decrypt_frame(decrypt_frame)
+    use_counts = not header.has_end_frame
+    if use_counts and header.plaintext_length is not None:
+        length = min(length, header.plaintext_length - start)
+    if length <= 0 or (use_counts and header.chunk_count == 0):
+        return b""
+
+    first = start // header.chunk_size
+    last = (start + length - 1) // header.chunk_size
+    if use_counts and header.chunk_count is not None:
+        last = min(last, header.chunk_count - 1)
+        if first > last:
+            return b""
+    offsets = read_frame_offsets(f, header, first, last, base=base)
+    contents = list()
+    for number, offset in enumerate(offsets, start=first):
+        payload = _read_frame_at(f, base + offset)
+        contents.append(decrypt_chunk(payload, header.frame_aad(number)))
+    if header.has_end_frame and (
+        len(offsets) < last - first + 1 or len(contents[-1]) < header.chunk_size
+    ):
+        # the range reaches the end of the data
+        _check_range_end(f, header, decrypt_frame, base, first, contents)
+    data = b"".join(contents)
+    skip = start - first * header.chunk_size
+    return data[skip : skip + length]
+
+
+def _check_range_end(
+    f,
+    header: Header,
+    decrypt_frame: T.Callable[[bytes, bytes], bytes],
+    base: int,
+    first: int,
+    contents: T.List[bytes],
+):
+    """
+    Decrypt the end frame, and check that the last chunk of ``contents``
+    (from frame number ``first``) is the last chunk of the file, or that
+    the file has no more than ``first`` chunks if ``contents`` is empty.
+    """
+    chunk_count, offset = _find_end_frame(f, header, base)
+    payload = _read_frame_at(f, base + offset)
+    end_frame = decrypt_frame(payload, header.frame_aad(chunk_count, final=True))
+    if len(end_frame) != _end_frame.size:
+        raise FileFormatError("the end frame is corrupted!")
+    expected_chunk_count, expected_plaintext_length = _end_frame.unpack(end_frame)
+    found = first + len(contents)
+    if contents:
+        plaintext_length = (found - 1) * header.chunk_size + len(contents[-1])
+        _check_counts(
+            expected_plaintext_length,
+            expected_chunk_count,
+            plaintext_length,
+            found,
+        )
+    elif first < expected_chunk_count:
+        raise FileFormatError(
+            f"expect {expected_chunk_count} chunks, found {first}, "
+            f"file is truncated!"
+        )
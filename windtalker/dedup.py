@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed deduplication for directory encryption.
+
+In dedup mode, each unique file content is encrypted once into an object
+store inside the output directory, and an encrypted index maps each relative
+path to its object::
+
+    MySecretFolder-encrypted/
+        .windtalker-dedup  # encrypted json index
+        .windtalker-objects/
+            00000000
+            00000001
+            ...
+
+Only files with the same size can have the same content, so a file with a
+unique size is never hashed. The object names are sequence numbers, not
+content hashes, so the output dir doesn't tell which files are identical
+without the key.
+
+An existing dedup output is only reused with ``overwrite=True``, its old
+index is removed first, because the new objects replace the old ones with
+the same names. The new index is written only when every object is
+encrypted, then the old objects it doesn't reference are removed. A failed
+run leaves no index, and ``decrypt_dir`` refuses to decrypt it.
+"""
+
+import typing as T
+import os
+import json
+import dataclasses
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from pathlib_mate import Path
+
+from .exc import FileFormatError
+from .files import atomic_write
+from .dirs import FileTask
+from .manifest import hash_file, relpath_of
+from .stream import EncryptingWriter, DecryptingReader
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .cipher import BaseCipher
+
+INDEX_FILENAME = ".windtalker-dedup"
+OBJECTS_DIRNAME = ".windtalker-objects"
+
+
+@dataclasses.dataclass
+class DedupIndex:
+    """
+    :param dirs: relative paths (with ``/``) of all the sub directories,
+      so empty directories are restored too
+    :param files: relative path to object name mapping
+    """
+
+    dirs: T.List[str] = dataclasses.field(default_factory=list)
+    files: T.Dict[str, str] = dataclasses.field(default_factory=dict)
+
+    def dump(self, cipher: "BaseCipher", dir_output: Path):
+        data = {"version": 1, "dirs": self.dirs, "files": self.files}
+        b = json.dumps(data).encode("utf-8")
+        path = dir_output.joinpath(INDEX_FILENAME)
+        with atomic_write(path) as f, EncryptingWriter(
+            cipher, f, close_raw=False
+        ) as writer:
+            writer.write(b)
+
+    @classmethod
+    def load(cls, cipher: "BaseCipher", dir_input: Path) -> "DedupIndex":
+        path = dir_input.joinpath(INDEX_FILENAME)
+        if not path.exists():
+            raise FileFormatError(
+                f"'{dir_input}' has no dedup index, the dedup run didn't finish!"
+            )
+        with DecryptingReader(cipher, path.open("rb")) as reader:
+            b = reader.read()
+        data = json.loads(b.decode("utf-8"))
+        return cls(dirs=data["dirs"], files=data["files"])
+
+
+def is_dedup_dir(path: Path) -> bool:
+    """
+    Test if an encrypted directory is written in dedup mode, finished or not.
+    """
+    return (
+        path.joinpath(INDEX_FILENAME).exists()
+        or path.joinpath(OBJECTS_DIRNAME).exists()
+    )
+
+
+def prepare_output(dst: Path, overwrite: bool):
+    """
+    Check an existing dedup output before a new run.
+
+    :raise EnvironmentError: if ``dst`` is a dedup output and ``overwrite``
+      is False
+    """
+    if not is_dedup_dir(dst):
+        return
+    if not overwrite:
+        raise EnvironmentError(f"dedup output '{dst}' already exists..")
+    # the old index doesn't match the objects once they are replaced
+    dst.joinpath(INDEX_FILENAME).remove_if_exists()
+
+
+def find_duplicates(
+    tasks: T.List[FileTask],
+    workers: int = 1,
+) -> T.List[T.List[FileTask]]:
+    """
+    Group the tasks by file content, the first task in each group is the one
+    to process.
+    """
+    by_size: T.Dict[int, T.List[FileTask]] = defaultdict(list)
+    for task in tasks:
+        by_size[task.size].append(task)
+
+    to_hash = [task for group in by_size.values() if len(group) > 1 for task in group]
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as executor:
+            digests = list(executor.map(hash_file, [task.src for task in to_hash]))
+    else:
+        digests = [hash_file(task.src) for task in to_hash]
+    digest_mapper = {id(task): digest for task, digest in zip(to_hash, digests)}
+
+    # dict keeps the insertion order, so the original task order is kept
+    groups: T.Dict[tuple, T.List[FileTask]] = dict()
+    for task in tasks:
+        key = (task.size, digest_mapper.get(id(task)))
+        groups.setdefault(key, []).append(task)
+    return list(groups.values())
+
+
+def plan_encrypt(
+    src: Path,
+    dst: Path,
+    new_dirs: T.List[Path],
+    tasks: T.List[FileTask],
+    workers: int = 1,
+) -> T.Tuple[T.List[FileTask], T.List[FileTask], DedupIndex]:
+    """
+    :param new_dirs: the output directories from
+      :func:`~windtalker.dirs.plan_dir`
+    :param tasks: the file tasks from :func:`~windtalker.dirs.plan_dir`
+
+    :return: a tuple of (object tasks, duplicated tasks, index)
+    """
+    dir_objects = dst.joinpath(OBJECTS_DIRNAME)
+    index = DedupIndex(
+        dirs=sorted(
+            relpath_of(dst, new_dir.abspath) for new_dir in new_dirs if new_dir != dst
+        )
+    )
+    object_tasks, duplicated_tasks = list(), list()
+    for ith, group in enumerate(find_duplicates(tasks, workers=workers)):
+        name = "%08x" % ith
+        first = group[0]
+        object_tasks.append(
+            FileTask(
+                src=first.src,
+                dst=dir_objects.joinpath(name).abspath,
+                size=first.size,
+            )
+        )
+        duplicated_tasks.extend(group[1:])
+        for task in group:
+            index.files[relpath_of(src, task.src)] = name
+    return object_tasks, duplicated_tasks, index
+
+
+def finish_encrypt(cipher: "BaseCipher", dst: Path, index: DedupIndex):
+    """
+    Write the index after every object is encrypted, then remove the objects
+    of a previous run that the new index doesn't reference.
+    """
+    index.dump(cipher, dst)
+    names = set(index.files.values())
+    dir_objects = dst.joinpath(OBJECTS_DIRNAME).abspath
+    for basename in os.listdir(dir_objects):
+        if basename not in names:
+            os.remove(os.path.join(dir_objects, basename))
+
+
+def plan_decrypt(
+    cipher: "BaseCipher",
+    src: Path,
+    dst: Path,
+) -> T.Tuple[T.List[Path], T.List[FileTask], T.List[T.Tuple[str, str]]]:
+    """
+    :return: a tuple of (output directories, object tasks, copies), each copy
+      is a (decrypted file, another output file) pair, do the copies after
+      the object tasks succeeded
+    """
+    index = DedupIndex.load(cipher, src)
+    dir_objects = src.joinpath(OBJECTS_DIRNAME)
+    new_dirs = [dst] + [dst.joinpath(relpath) for relpath in index.dirs]
+    tasks, copies = list(), list()
+    decrypted: T.Dict[str, str] = dict()
+    for relpath, name in index.files.items():
+        p_dst = dst.joinpath(relpath).abspath
+        if name in decrypted:
+            copies.append((decrypted[name], p_dst))
+        else:
+            p_src = dir_objects.joinpath(name)
+            tasks.append(FileTask(src=p_src.abspath, dst=p_dst, size=p_src.size))
+            decrypted[name] = p_dst
+    return new_dirs, tasks, copies
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""
+Directory processing utility functions.
+
+A directory job is split into two steps:
+
+1. :func:`plan_dir` walks the source tree and creates a list of
+   :class:`FileTask`.
+2. :func:`run_tasks` executes the tasks, either one by one in the current
+   thread, or on a thread / process pool, and returns a list of
+   :class:`FileResult`.
+
+When using a process pool, the cipher object is never pickled. Each worker
+process rebuilds its own cipher once from
+:meth:`~windtalker.cipher.BaseCipher.to_key_material`.
+"""
+
+import typing as T
+import os
+import time
+import dataclasses
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    ProcessPoolExecutor,
+    Future,
+    wait,
+    FIRST_COMPLETED,
+)
+
+from pathlib_mate import Path
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .cipher import BaseCipher
+
+
+@dataclasses.dataclass
+class FileTask:
+    """
+    Encrypt / decrypt one file from ``src`` to ``dst``.
+    """
+
+    src: str
+    dst: str
+    size: int
+
+
+@dataclasses.dataclass
+class FileResult:
+    """
+    The result of a :class:`FileTask`.
+
+    :param error: the error message if failed, None if succeeded
+    """
+
+    src: str
+    dst: str
+    size: int
+    elapsed: float
+    error: T.Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclasses.dataclass
+class DirSummary:
+    """
+    The summary of a directory encryption / decryption.
+
+    :param skipped: the unchanged source files in incremental mode, or the
+      duplicated source files in dedup mode
+    :param removed: the relative paths of the deleted output files in
+      incremental mode
+    """
+
+    output_path: Path
+    results: T.List[FileResult] = dataclasses.field(default_factory=list)
+    elapsed: float = 0.0
+    skipped: T.List[str] = dataclasses.field(default_factory=list)
+    removed: T.List[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def succeeded(self) -> T.List[FileResult]:
+        return [res for res in self.results if res.ok]
+
+    @property
+    def failed(self) -> T.List[FileResult]:
+        return [res for res in self.results if not res.ok]
+
+    @property
+    def ok(self) -> bool:
+        return all(res.ok for res in self.results)
+
+    @property
+    def total_size(self) -> int:
+        return sum(res.size for res in self.results)
+
+
+def plan_dir(
+    src: Path,
+    dst: Path,
+    largest_first: bool = False,
+    exclude: T.Optional[T.Container[str]] = None,
+) -> T.Tuple[T.List[Path], T.List[FileTask]]:
+    """
+    Walk the ``src`` directory, find out all the output directories to create
+    and all the files to process.
+
+    :param largest_first: if True, sort the tasks by file size in descending
+      order, so the slowest file won't be the last one to start.
+    :param exclude: relative paths (with ``/``) of the files to skip
+
+    :return: a tuple of (list of output dirs, list of file tasks)
+    """
+    dirs = list()
+    tasks = list()
+    for current_dir, _, file_list in os.walk(src.abspath):
+        new_dir = dst.joinpath(Path(current_dir).relative_to(src))
+        dirs.append(new_dir)
+        for basename in file_list:
+            old_path = os.path.join(current_dir, basename)
+            if exclude and Path(old_path).relative_to(src).as_posix() in exclude:
+                continue
+            tasks.append(
+                FileTask(
+                    src=old_path,
+                    dst=new_dir.joinpath(basename).abspath,
+                    size=os.path.getsize(old_path),
+                )
+            )
+    if largest_first:
+        tasks.sort(key=lambda task: task.size, reverse=True)
+    return dirs, tasks
+
+
+def _run_task(
+    cipher: "BaseCipher",
+    method: str,
+    task: FileTask,
+    kwargs: dict,
+    fail_fast: bool = False,
+) -> FileResult:
+    st = time.perf_counter()
+    try:
+        getattr(cipher, method)(task.src, task.dst, **kwargs)
+        error = None
+    except Exception as e:
+        if fail_fast:
+            raise
+        error = f"{e.__class__.__name__}: {e}"
+    return FileResult(
+        src=task.src,
+        dst=task.dst,
+        size=task.size,
+        elapsed=time.perf_counter() - st,
+        error=error,
+    )
+
+
+# the cipher object rebuilt in each worker process
+_worker_cipher: T.Optional["BaseCipher"] = None
+
+
+def _init_worker(cipher_class: T.Type["BaseCipher"], key_material: dict):
+    global _worker_cipher
+    _worker_cipher = cipher_class.from_key_material(key_material)
+
+
+def _run_task_in_worker(method: str, task: FileTask, kwargs: dict) -> FileResult:
+    return _run_task(_worker_cipher, method, task, kwargs)
+
+
+def submit_bounded(
+    submit: T.Callable[[T.Any], Future],
+    items: T.Iterable,
+    max_in_flight: int,
+) -> T.Iterator[Future]:
+    """
+    Call ``submit(item)`` for each item, and yield the futures as they are
+    finished. Only keep a few items in the queue, so we don't create hundreds
+    of thousands of futures for big directories.
+
+    :param submit: submit one item to an executor, and return the future
+    :param items: the items, they are submitted in order
+    :param max_in_flight: max number of submitted but not yet yielded futures
+    """
+    pending = set()
+    for item in items:
+        pending.add(submit(item))
+        if len(pending) >= max_in_flight:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from done
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        yield from done
+
+
+def run_tasks(
+    cipher: "BaseCipher",
+    method: str,
+    tasks: T.List[FileTask],
+    workers: int = 1,
+    use_process: bool = True,
+    fail_fast: bool = False,
+    callback: T.Optional[T.Callable[[FileResult], T.Any]] = None,
+    **kwargs,
+) -> T.List[FileResult]:
+    """
+    Call ``getattr(cipher, method)(task.src, task.dst, **kwargs)`` for each
+    task.
+
+    :param cipher: the cipher object
+    :param method: the method name, usually "encrypt_file" or "decrypt_file"
+    :param tasks: list of file tasks, they are submitted in order
+    :param workers: number of workers, if 1, run in the current thread
+    :param use_process: if True, use process pool, otherwise use thread pool
+    :param fail_fast: if True, raise the error immediately in serial mode,
+      instead of recording it in the :class:`FileResult`
+    :param callback: a function to call with each :class:`FileResult` as soon
+      as it is finished
+    """
+    results = list()
+
+    def collect(res: FileResult):
+        results.append(res)
+        if callback is not None:
+            callback(res)
+
+    if workers <= 1:
+        for task in tasks:
+            collect(_run_task(cipher, method, task, kwargs, fail_fast=fail_fast))
+        return results
+
+    if use_process:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(cipher.__class__, cipher.to_key_material()),
+        )
+        submit = lambda task: executor.submit(_run_task_in_worker, method, task, kwargs)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        submit = lambda task: executor.submit(_run_task, cipher, method, task, kwargs)
+
+    with executor:
+        for future in submit_bounded(submit, tasks, max_in_flight=workers * 4):
+            collect(future.result())
+    return results
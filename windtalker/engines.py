@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+
+"""
+Asymmetric encryption engines used by
+:class:`~windtalker.asymmetric.AsymmetricCipher`.
+
+==================  =========================  =================================
+engine              algorithm                  note
+==================  =========================  =================================
+``rsa``             RSA PKCS#1 v1.5            pure Python ``rsa`` package, the
+                                               default, for backward
+                                               compatibility
+``cryptography``    RSA-OAEP / RSA-PSS         OpenSSL via ``cryptography``,
+                                               accepts the ``rsa`` package keys
+``x25519``          X25519 + Ed25519           OpenSSL via ``cryptography``,
+                                               small keys, fastest
+==================  =========================  =================================
+
+Usage::
+
+    >>> from windtalker.api import AsymmetricCipher
+    >>> from windtalker.engines import X25519Engine
+    >>> engine = X25519Engine()
+    >>> A_pubkey, A_privkey = engine.new_keys()
+    >>> B_pubkey, B_privkey = engine.new_keys()
+    >>> cipher = AsymmetricCipher(A_pubkey, A_privkey, B_pubkey, engine=engine)
+"""
+
+import typing as T
+import os
+import dataclasses
+
+import rsa
+from cryptography.exceptions import InvalidSignature, InvalidTag
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import (
+    rsa as crypto_rsa,
+    padding,
+    x25519,
+    ed25519,
+)
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .container import (
+    CIPHER_ID_HYBRID_RSA,
+    CIPHER_ID_HYBRID_RSA_OAEP,
+    CIPHER_ID_HYBRID_X25519,
+)
+from .exc import PasswordError, SignatureError
+
+
+class DecryptionError(PasswordError, rsa.DecryptionError):
+    """
+    Decryption with the private key failed. It is also a
+    ``rsa.DecryptionError``, the error ``AsymmetricCipher.decrypt`` raised
+    before the engines were added.
+    """
+
+
+class VerificationError(SignatureError, rsa.VerificationError):
+    """
+    Signature verification failed. It is also a ``rsa.VerificationError``,
+    the error ``AsymmetricCipher.decrypt`` raised before the engines were
+    added.
+    """
+
+
+class Engine:
+    """
+    The engine interface. All the methods raise :class:`DecryptionError`
+    (a :class:`~windtalker.exc.PasswordError`) if decryption fails and
+    :class:`VerificationError` (a :class:`~windtalker.exc.SignatureError`) if
+    verification fails.
+
+    :param name: the engine name, used in :meth:`~windtalker.cipher.BaseCipher.to_key_material`
+    :param cipher_id: the cipher id in the container format file header
+    """
+
+    name: str = None
+    cipher_id: int = None
+
+    def new_keys(self, nbits: T.Optional[int] = None) -> tuple:
+        """
+        Create a new pair of public and private keys.
+
+        :return: a tuple of (public key, private key)
+        """
+        raise NotImplementedError
+
+    def to_public_key(self, pubkey):
+        """
+        Convert a public key to the engine's native type, it is called once
+        when the cipher is created.
+        """
+        return pubkey
+
+    def to_private_key(self, privkey):
+        """
+        Convert a private key to the engine's native type.
+        """
+        return privkey
+
+    def encrypt(self, binary: bytes, pubkey) -> bytes:
+        raise NotImplementedError
+
+    def decrypt(self, token: bytes, privkey) -> bytes:
+        raise NotImplementedError
+
+    def sign(self, binary: bytes, privkey, hash_method: str = "SHA-256") -> bytes:
+        """
+        :param hash_method: one of 'SHA-1', 'SHA-224', 'SHA-256', 'SHA-384'
+          or 'SHA-512', the ``rsa`` engine also accepts 'MD5'. It is ignored
+          by the engines with a fixed hash.
+        """
+        raise NotImplementedError
+
+    def verify(
+        self,
+        binary: bytes,
+        signature: bytes,
+        pubkey,
+        hash_method: str = "SHA-256",
+    ):
+        raise NotImplementedError
+
+    def dump_public_key(self, pubkey) -> bytes:
+        raise NotImplementedError
+
+    def dump_private_key(self, privkey) -> bytes:
+        raise NotImplementedError
+
+    def load_public_key(self, data: bytes):
+        raise NotImplementedError
+
+    def load_private_key(self, data: bytes):
+        raise NotImplementedError
+
+
+class RsaEngine(Engine):
+    """
+    Pure Python RSA engine based on the ``rsa`` package.
+    """
+
+    name = "rsa"
+    cipher_id = CIPHER_ID_HYBRID_RSA
+
+    def new_keys(self, nbits: T.Optional[int] = None) -> tuple:
+        return rsa.newkeys(nbits or 1024, poolsize=1)
+
+    def encrypt(self, binary: bytes, pubkey: rsa.PublicKey) -> bytes:
+        return rsa.encrypt(binary, pubkey)
+
+    def decrypt(self, token: bytes, privkey: rsa.PrivateKey) -> bytes:
+        try:
+            return rsa.decrypt(token, privkey)
+        except rsa.DecryptionError:
+            raise DecryptionError("Ops, wrong private key!")
+
+    def sign(
+        self,
+        binary: bytes,
+        privkey: rsa.PrivateKey,
+        hash_method: str = "SHA-256",
+    ) -> bytes:
+        return rsa.sign(binary, privkey, hash_method)
+
+    def verify(
+        self,
+        binary: bytes,
+        signature: bytes,
+        pubkey: rsa.PublicKey,
+        hash_method: str = "SHA-256",
+    ):
+        try:
+            rsa.verify(binary, signature, pubkey)
+        except rsa.VerificationError:
+            raise VerificationError("Ops, signature verification failed!")
+
+    def dump_public_key(self, pubkey: rsa.PublicKey) -> bytes:
+        return pubkey.save_pkcs1("DER")
+
+    def dump_private_key(self, privkey: rsa.PrivateKey) -> bytes:
+        return privkey.save_pkcs1("DER")
+
+    def load_public_key(self, data: bytes) -> rsa.PublicKey:
+        return rsa.PublicKey.load_pkcs1(data, "DER")
+
+    def load_private_key(self, data: bytes) -> rsa.PrivateKey:
+        return rsa.PrivateKey.load_pkcs1(data, "DER")
+
+
+_hash_mapper = {
+    "SHA-1": hashes.SHA1,
+    "SHA-224": hashes.SHA224,
+    "SHA-256": hashes.SHA256,
+    "SHA-384": hashes.SHA384,
+    "SHA-512": hashes.SHA512,
+}
+
+
+def _get_hash(hash_method: str) -> hashes.HashAlgorithm:
+    try:
+        return _hash_mapper[hash_method]()
+    except KeyError:
+        raise ValueError(
+            f"hash method {hash_method!r} is not supported, "
+            f"use one of {list(_hash_mapper)}"
+        )
+
+
+class CryptographyRsaEngine(Engine):
+    """
+    RSA engine based on ``cryptography`` (OpenSSL), it uses OAEP for
+    encryption and PSS for signature. The keys of the ``rsa`` package are
+    converted automatically, so you can switch to this engine with your
+    existing keys (the ciphertext and signature are not compatible with
+    :class:`RsaEngine` because of the different padding).
+    """
+
+    name = "cryptography"
+    cipher_id = CIPHER_ID_HYBRID_RSA_OAEP
+
+    _oaep = padding.OAEP(
+        mgf=padding.MGF1(algorithm=hashes.SHA256()),
+        algorithm=hashes.SHA256(),
+        label=None,
+    )
+
+    def new_keys(self, nbits: T.Optional[int] = None) -> tuple:
+        privkey = crypto_rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=nbits or 2048,
+        )
+        return privkey.public_key(), privkey
+
+    def to_public_key(self, pubkey) -> crypto_rsa.RSAPublicKey:
+        """
+        Convert a ``rsa`` package public key to ``cryptography`` key.
+        """
+        if isinstance(pubkey, rsa.PublicKey):
+            return crypto_rsa.RSAPublicNumbers(pubkey.e, pubkey.n).public_key()
+        return pubkey
+
+    def to_private_key(self, privkey) -> crypto_rsa.RSAPrivateKey:
+        """
+        Convert a ``rsa`` package private key to ``cryptography`` key.
+        """
+        if isinstance(privkey, rsa.PrivateKey):
+            return crypto_rsa.RSAPrivateNumbers(
+                p=privkey.p,
+                q=privkey.q,
+                d=privkey.d,
+                dmp1=privkey.exp1,
+                dmq1=privkey.exp2,
+                iqmp=privkey.coef,
+                public_numbers=crypto_rsa.RSAPublicNumbers(privkey.e, privkey.n),
+            ).private_key()
+        return privkey
+
+    def encrypt(self, binary: bytes, pubkey) -> bytes:
+        return self.to_public_key(pubkey).encrypt(binary, self._oaep)
+
+    def decrypt(self, token: bytes, privkey) -> bytes:
+        try:
+            return self.to_private_key(privkey).decrypt(token, self._oaep)
+        except ValueError:
+            raise DecryptionError("Ops, wrong private key!")
+
+    def _pss(self, hash_method: str) -> padding.PSS:
+        return padding.PSS(
+            mgf=padding.MGF1(_get_hash(hash_method)),
+            salt_length=padding.PSS.MAX_LENGTH,
+        )
+
+    def sign(self, binary: bytes, privkey, hash_method: str = "SHA-256") -> bytes:
+        return self.to_private_key(privkey).sign(
+            binary,
+            self._pss(hash_method),
+            _get_hash(hash_method),
+        )
+
+    def verify(
+        self,
+        binary: bytes,
+        signature: bytes,
+        pubkey,
+        hash_method: str = "SHA-256",
+    ):
+        try:
+            self.to_public_key(pubkey).verify(
+                signature,
+                binary,
+                self._pss(hash_method),
+                _get_hash(hash_method),
+            )
+        except InvalidSignature:
+            raise VerificationError("Ops, signature verification failed!")
+
+    def dump_public_key(self, pubkey) -> bytes:
+        return self.to_public_key(pubkey).public_bytes(
+            serialization.Encoding.DER,
+            serialization.PublicFormat.PKCS1,
+        )
+
+    def dump_private_key(self, privkey) -> bytes:
+        return self.to_private_key(privkey).private_bytes(
+            serialization.Encoding.DER,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        )
+
+    def load_public_key(self, data: bytes) -> crypto_rsa.RSAPublicKey:
+        return serialization.load_der_public_key(data)
+
+    def load_private_key(self, data: bytes) -> crypto_rsa.RSAPrivateKey:
+        return serialization.load_der_private_key(data, password=None)
+
+
+def _raw_public_bytes(key) -> bytes:
+    return key.public_bytes(
+        serialization.Encoding.Raw,
+        serialization.PublicFormat.Raw,
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class Curve25519PublicKey:
+    """
+    An X25519 public key for encryption and an Ed25519 public key for
+    signature verification.
+    """
+
+    exchange_key: x25519.X25519PublicKey
+    verify_key: ed25519.Ed25519PublicKey
+
+    def to_bytes(self) -> bytes:
+        raw = (serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return self.exchange_key.public_bytes(*raw) + self.verify_key.public_bytes(*raw)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Curve25519PublicKey":
+        return cls(
+            exchange_key=x25519.X25519PublicKey.from_public_bytes(data[:32]),
+            verify_key=ed25519.Ed25519PublicKey.from_public_bytes(data[32:]),
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class Curve25519PrivateKey:
+    """
+    An X25519 private key for decryption and an Ed25519 private key for
+    signing.
+    """
+
+    exchange_key: x25519.X25519PrivateKey
+    sign_key: ed25519.Ed25519PrivateKey
+
+    def public_key(self) -> Curve25519PublicKey:
+        return Curve25519PublicKey(
+            exchange_key=self.exchange_key.public_key(),
+            verify_key=self.sign_key.public_key(),
+        )
+
+    def to_bytes(self) -> bytes:
+        raw = (
+            serialization.Encoding.Raw,
+            serialization.PrivateFormat.Raw,
+            serialization.NoEncryption(),
+        )
+        return self.exchange_key.private_bytes(*raw) + self.sign_key.private_bytes(*raw)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Curve25519PrivateKey":
+        return cls(
+            exchange_key=x25519.X25519PrivateKey.from_private_bytes(data[:32]),
+            sign_key=ed25519.Ed25519PrivateKey.from_private_bytes(data[32:]),
+        )
+
+
+class X25519Engine(Engine):
+    """
+    Elliptic curve engine: ECIES style encryption (ephemeral X25519 key
+    exchange, HKDF-SHA256 and AES-GCM) and Ed25519 signature.
+
+    The token is ``ephemeral public key (32 B) | nonce (12 B) | AES-GCM output``.
+    """
+
+    name = "x25519"
+    cipher_id = CIPHER_ID_HYBRID_X25519
+
+    _info = b"windtalker-x25519"
+
+    def new_keys(
+        self,
+        nbits: T.Optional[int] = None,
+    ) -> T.Tuple[Curve25519PublicKey, Curve25519PrivateKey]:
+        privkey = Curve25519PrivateKey(
+            exchange_key=x25519.X25519PrivateKey.generate(),
+            sign_key=ed25519.Ed25519PrivateKey.generate(),
+        )
+        return privkey.public_key(), privkey
+
+    def _derive_key(
+        self,
+        shared_key: bytes,
+        ephemeral_public: bytes,
+        recipient_public: x25519.X25519PublicKey,
+    ) -> bytes:
+        # bind both public keys, so the key is only valid for this exchange
+        info = self._info + ephemeral_public + _raw_public_bytes(recipient_public)
+        return HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=info,
+        ).derive(shared_key)
+
+    def encrypt(self, binary: bytes, pubkey: Curve25519PublicKey) -> bytes:
+        ephemeral_key = x25519.X25519PrivateKey.generate()
+        ephemeral_public = _raw_public_bytes(ephemeral_key.public_key())
+        key = self._derive_key(
+            ephemeral_key.exchange(pubkey.exchange_key),
+            ephemeral_public,
+            pubkey.exchange_key,
+        )
+        nonce = os.urandom(12)
+        return ephemeral_public + nonce + AESGCM(key).encrypt(nonce, binary, None)
+
+    def decrypt(self, token: bytes, privkey: Curve25519PrivateKey) -> bytes:
+        if len(token) < 44:
+            raise DecryptionError("Ops, wrong private key!")
+        ephemeral_public = token[:32]
+        try:
+            shared_key = privkey.exchange_key.exchange(
+                x25519.X25519PublicKey.from_public_bytes(ephemeral_public)
+            )
+            key = self._derive_key(
+                shared_key,
+                ephemeral_public,
+                privkey.exchange_key.public_key(),
+            )
+            return AESGCM(key).decrypt(token[32:44], token[44:], None)
+        except (InvalidTag, ValueError):
+            raise DecryptionError("Ops, wrong private key!")
+
+    def sign(
+        self,
+        binary: bytes,
+        privkey: Curve25519PrivateKey,
+        hash_method: str = "SHA-256",
+    ) -> bytes:
+        return privkey.sign_key.sign(binary)
+
+    def verify(
+        self,
+        binary: bytes,
+        signature: bytes,
+        pubkey: Curve25519PublicKey,
+        hash_method: str = "SHA-256",
+    ):
+        try:
+            pubkey.verify_key.verify(signature, binary)
+        except InvalidSignature:
+            raise VerificationError("Ops, signature verification failed!")
+
+    def dump_public_key(self, pubkey: Curve25519PublicKey) -> bytes:
+        return pubkey.to_bytes()
+
+    def dump_private_key(self, privkey: Curve25519PrivateKey) -> bytes:
+        return privkey.to_bytes()
+
+    def load_public_key(self, data: bytes) -> Curve25519PublicKey:
+        return Curve25519PublicKey.from_bytes(data)
+
+    def load_private_key(self, data: bytes) -> Curve25519PrivateKey:
+        return Curve25519PrivateKey.from_bytes(data)
+
+
+engine_mapper: T.Dict[str, T.Type[Engine]] = {
+    RsaEngine.name: RsaEngine,
+    CryptographyRsaEngine.name: CryptographyRsaEngine,
+    X25519Engine.name: X25519Engine,
+}
+
+
+def get_engine(engine: T.Optional[T.Union[str, Engine]] = None) -> Engine:
+    """
+    Get an engine by name, default is :class:`RsaEngine`.
+    """
+    if engine is None:
+        return RsaEngine()
+    if isinstance(engine, Engine):
+        return engine
+    try:
+        return engine_mapper[engine]()
+    except KeyError:
+        raise ValueError(
+            f"unknown engine {engine!r}, available: {', '.join(engine_mapper)}"
+        )
@@ -9,3 +9,8 @@ class PasswordError(Exception):
 class SignatureError(Exception):
     """asymmetric encrypt wrong signature error.
     """
+
+
+class FileFormatError(Exception):
+    """not a valid windtalker encrypted file, or the file is corrupted.
+    """
@@ -5,8 +5,22 @@ File handling utility functions.
 """
 
 import typing as T
+import io
+import os
+import mmap
+import stat
+import queue
+import contextlib
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from pathlib_mate import Path, T_PATH_ARG
 
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .metrics import FileMeter
+
 DEFAULT_SUFFIX = "-encrypted"  # windtalker secret file or folder suffix
 
 
@@ -47,6 +61,264 @@ def get_decrypted_path(
     return p.change(new_fname=p.fname[: -len(suffix)])
 
 
+def iter_chunks(f, chunksize: int) -> T.Iterator[bytes]:
+    """
+    Read a binary file object chunk by chunk until EOF.
+    """
+    while 1:
+        content = f.read(chunksize)
+        if content:
+            yield content
+        else:
+            break
+
+
+def iter_views(buffer, chunksize: int, offset: int = 0) -> T.Iterator[memoryview]:
+    """
+    Slice a bytes-like object (like a :class:`mmap.mmap`) into chunks
+    without copying.
+
+    :param offset: start from this position
+    """
+    with memoryview(buffer) as view:
+        for start in range(offset, len(view), chunksize):
+            yield view[start : start + chunksize]
+
+
+MMAP_THRESHOLD = 16 * 1024**2
+"""
+Files smaller than this are read with ``read()``, the mmap setup cost is not
+worth it.
+"""
+
+
+@contextlib.contextmanager
+def open_mmap(
+    f,
+    threshold: T.Optional[int] = None,
+) -> T.Iterator[T.Optional[mmap.mmap]]:
+    """
+    Memory map a regular file opened in binary read mode, the chunks can be
+    sliced from it (see :func:`iter_views`) without allocating new
+    ``bytes`` objects, and the OS page cache is used as the buffer, so the
+    peak memory doesn't grow with the file size.
+
+    Yield None if the file is smaller than ``threshold`` (default is
+    :data:`MMAP_THRESHOLD`), empty, or it cannot be memory mapped (a pipe
+    for example).
+    """
+    if threshold is None:
+        threshold = MMAP_THRESHOLD
+    try:
+        st = os.fstat(f.fileno())
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        st = None
+    if (
+        st is None
+        or not stat.S_ISREG(st.st_mode)
+        or st.st_size == 0
+        or st.st_size < threshold
+    ):
+        yield None
+        return
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mm
+    finally:
+        try:
+            mm.close()
+        except BufferError:  # pragma: no cover
+            # a chunk is still referenced (by a traceback for example),
+            # the mmap is closed when it's garbage collected
+            pass
+
+
+PART_SUFFIX = ".part"
+
+
+def get_part_path(path: T_PATH_ARG) -> Path:
+    """
+    The temp file an output file is written to before it is complete, like
+    ``${home}/test-encrypted.txt.part``.
+    """
+    p = Path(path).absolute()
+    return p.change(new_basename=p.basename + PART_SUFFIX)
+
+
+@contextlib.contextmanager
+def atomic_write(path: T_PATH_ARG) -> T.Iterator[T.BinaryIO]:
+    """
+    Open ``<path>.part`` for writing in binary mode, and rename it to
+    ``path`` when the block succeeds, so ``path`` is never partially written.
+    The part file is removed if the block fails.
+    """
+    p = Path(path).absolute()
+    p_part = get_part_path(p)
+    try:
+        with p_part.open("wb") as f:
+            yield f
+        os.replace(p_part.abspath, p.abspath)
+    except BaseException:
+        p_part.remove_if_exists()
+        raise
+
+
+def preallocate(f, size: T.Optional[int]):
+    """
+    Reserve disk space for an output file from the current position, so the
+    file system can allocate contiguous blocks and a full disk fails early.
+    Call ``f.truncate()`` after writing, in case less data is written.
+
+    It does nothing if ``size`` is None or the platform doesn't support it.
+    """
+    if not size or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        f.flush()
+        os.posix_fallocate(f.fileno(), f.tell(), size)
+    except (AttributeError, OSError, io.UnsupportedOperation):  # pragma: no cover
+        pass
+
+
+def iter_batches(iterable: T.Iterable, batch_size: int) -> T.Iterator[list]:
+    """
+    Group items into lists of ``batch_size`` items, the last list may be
+    shorter.
+    """
+    iterator = iter(iterable)
+    while 1:
+        batch = list(itertools.islice(iterator, batch_size))
+        if batch:
+            yield batch
+        else:
+            break
+
+
+_END_OF_QUEUE = object()
+
+
+def read_ahead(iterable: T.Iterable, maxsize: int) -> T.Iterator:
+    """
+    Consume ``iterable`` on a background reader thread and yield its items in
+    order. At most ``maxsize`` items are buffered, so a slow consumer
+    back-pressures the reader instead of letting memory grow.
+    """
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:  # forward to consumer thread
+            put((_END_OF_QUEUE, e))
+            return
+        put((_END_OF_QUEUE, None))
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while 1:
+            item, error = q.get()
+            if item is _END_OF_QUEUE:
+                if error is not None:
+                    raise error
+                break
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def imap_ordered(
+    func: T.Callable,
+    iterable: T.Iterable,
+    workers: int,
+    max_in_flight: T.Optional[int] = None,
+) -> T.Iterator:
+    """
+    Apply ``func`` to every item of ``iterable`` on a pool of ``workers``
+    threads, and yield the results in the original order.
+
+    Items are pulled by a reader thread (see :func:`read_ahead`). The reader
+    takes a slot before it pulls an item, and the slot is given back when the
+    result of the item is yielded, so at most ``max_in_flight`` items are
+    read but not yet yielded: queued, being converted, or waiting for an
+    earlier item. When the items are file chunks, memory usage stays around
+    ``max_in_flight * chunksize`` for the input chunks, plus the results of
+    the same chunks.
+
+    :param func: the function to apply, it should release the GIL (like most
+      of the ``cryptography`` primitives) to benefit from threads
+    :param iterable: the input items
+    :param workers: number of worker threads
+    :param max_in_flight: max number of items read but not yet yielded,
+      default is ``workers``
+    """
+    if max_in_flight is None:
+        max_in_flight = workers
+    slots = threading.Semaphore(max_in_flight)
+    stop = threading.Event()
+
+    def take_slots() -> T.Iterator:
+        iterator = iter(iterable)
+        while 1:
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            yield item
+
+    items = read_ahead(take_slots(), maxsize=max_in_flight)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                del item  # don't hold the chunk while waiting for results
+                if len(pending) >= max_in_flight:
+                    result = pending.popleft().result()
+                    slots.release()
+                    yield result
+            while pending:
+                result = pending.popleft().result()
+                slots.release()
+                yield result
+        finally:
+            stop.set()
+            items.close()
+            for future in pending:
+                future.cancel()
+
+
+def normalize_chunksize(chunksize: int) -> int:
+    """
+    Fix chunksize to a reasonable range, 1MB ~ 10MB.
+
+    It is not used by the ciphers anymore, each cipher has its own
+    :class:`~windtalker.chunking.ChunkPolicy`.
+    """
+    if chunksize > 1024**2 * 10:
+        return 1024**2 * 10
+    elif chunksize < 1024**2:
+        return 1024**2
+    else:
+        return chunksize
+
+
 def transform(
     src: T_PATH_ARG,
     dst: T_PATH_ARG,
@@ -54,6 +326,8 @@ def transform(
     overwrite: bool = False,
     stream: bool = True,
     chunksize: int = 1024**2,
+    workers: int = 1,
+    meter: T.Optional["FileMeter"] = None,
     **kwargs,
 ):
     """
@@ -65,7 +339,14 @@ def transform(
     :param overwrite: default False,
     :param stream: default True, if True, use stream IO mode, chunksize has to
       be specified.
-    :param chunksize: default 1MB
+    :param chunksize: default 1MB, it is used as is, for decryption it must
+      be the exact token size
+    :param workers: default 1, if greater than 1, chunks are read by a reader
+      thread, converted by ``workers`` threads in parallel, and written in
+      order. Only works in stream mode.
+    :param meter: if given, measure each chunk, see :mod:`windtalker.metrics`
+
+    The output is written to a part file first, see :func:`atomic_write`.
     """
     p_src = Path(src).absolute()
     p_dst = Path(dst).absolute()
@@ -73,24 +354,29 @@ def transform(
         if p_dst.exists():
             raise EnvironmentError(f"'{p_dst}' already exists!")
 
+    if kwargs:
+        convert = lambda content: converter(content, **kwargs)
+    else:
+        convert = converter
+    if meter is not None:
+        convert = meter.wrap(convert)
+
     with p_src.open("rb") as f_input:
-        with p_dst.open("wb") as f_output:
+        with atomic_write(p_dst) as f_output:
             if stream:
-                # fix chunksize to a reasonable range
-                if chunksize > 1024**2 * 10:
-                    chunksize = 1024**2 * 10
-                elif chunksize < 1024**2:
-                    chunksize = 1024**2
-
                 # write file
-                while 1:
-                    content = f_input.read(chunksize)
-                    if content:
-                        f_output.write(converter(content, **kwargs))
-                    else:
-                        break
+                chunks = iter_chunks(f_input, chunksize)
+                if meter is not None:
+                    chunks = meter.count(chunks)
+                if workers > 1:
+                    results = imap_ordered(convert, chunks, workers=workers)
+                    for content in results:
+                        f_output.write(content)
+                else:
+                    for content in chunks:
+                        f_output.write(convert(content))
             else:  # pragma: no cover
-                f_output.write(converter(f_input.read(), **kwargs))
+                f_output.write(convert(f_input.read()))
 
 
 def process_dst_overwrite_args(
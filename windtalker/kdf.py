@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+Password based key derivation functions.
+
+A strong KDF is slow on purpose, so the derived keys are cached in a bounded,
+thread-safe, in-process cache. The cache key is the SHA256 digest of the
+password (never the password itself), the salt, and the KDF parameters.
+
+A salt is required. If you don't give one to
+:class:`~windtalker.symmetric.SymmetricCipher`, a random salt is created
+once per installation in ``${HOME}/.windtalker-salt`` (see
+:func:`read_or_create_salt`), copy it with your password to decrypt your
+data on another machine.
+
+Usage::
+
+    >>> from windtalker.kdf import Scrypt, new_salt
+    >>> from windtalker.api import SymmetricCipher
+    >>> salt = new_salt()  # store it with your encrypted data
+    >>> cipher = SymmetricCipher(
+    ...     password="MyPassword",
+    ...     kdf=Scrypt(n=2**15),
+    ...     salt=salt,
+    ... )
+"""
+
+import typing as T
+import os
+import base64
+import hashlib
+import threading
+import dataclasses
+from collections import OrderedDict
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt as _Scrypt
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+KEY_LENGTH = 32  # fernet key is 32 bytes
+
+SALT_SIZE = 16
+
+# the per installation salt, next to ``${HOME}/.windtalker``
+path_salt = os.path.join(os.path.expanduser("~"), ".windtalker-salt")
+
+
+def new_salt() -> bytes:
+    """
+    Create a random salt.
+    """
+    return os.urandom(SALT_SIZE)
+
+
+def read_or_create_salt(path: T.Optional[str] = None) -> bytes:
+    """
+    Read the per installation salt, it is created with a random salt on
+    first use. The file has the base64 encoded salt, and it is only
+    readable by the owner.
+
+    :param path: default is ``${HOME}/.windtalker-salt``
+    """
+    if path is None:
+        path = path_salt
+    if not os.path.exists(path):
+        # write a temp file and link it, so the salt file appears complete,
+        # and only one of the concurrent processes creates it
+        path_tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(path_tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(base64.b64encode(new_salt()).decode("ascii"))
+        try:
+            os.link(path_tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(path_tmp)
+    with open(path, "r", encoding="utf-8") as f:
+        return decode_salt(f.read(), source=f"the salt in {path!r}")
+
+
+def decode_salt(s: str, source: str = "the salt") -> bytes:
+    """
+    Decode a base64 encoded salt, the format of the salt file.
+
+    :param s: the base64 encoded salt
+    :param source: where the salt comes from, for the error message
+    """
+    try:
+        salt = base64.b64decode(s.strip(), validate=True)
+    except ValueError:
+        raise ValueError(f"{source} is not valid base64!")
+    if len(salt) < SALT_SIZE:
+        raise ValueError(f"{source} is too short!")
+    return salt
+
+
+@dataclasses.dataclass(frozen=True)
+class Scrypt:
+    """
+    Scrypt KDF parameters. The memory cost is ``128 * n * r * p`` bytes.
+    """
+
+    n: int = 2**15
+    r: int = 8
+    p: int = 1
+
+    def derive(self, password: bytes, salt: bytes) -> bytes:
+        return _Scrypt(
+            salt=salt,
+            length=KEY_LENGTH,
+            n=self.n,
+            r=self.r,
+            p=self.p,
+        ).derive(password)
+
+
+@dataclasses.dataclass(frozen=True)
+class PBKDF2:
+    """
+    PBKDF2-HMAC KDF parameters.
+
+    :param algorithm: one of "sha256", "sha384", "sha512"
+    """
+
+    iterations: int = 600000
+    algorithm: str = "sha256"
+
+    def derive(self, password: bytes, salt: bytes) -> bytes:
+        return PBKDF2HMAC(
+            algorithm=getattr(hashes, self.algorithm.upper())(),
+            length=KEY_LENGTH,
+            salt=salt,
+            iterations=self.iterations,
+        ).derive(password)
+
+
+T_KDF = T.Union[Scrypt, PBKDF2]
+
+
+class DerivedKeyCache:
+    """
+    A thread-safe LRU cache of derived keys.
+
+    :param maxsize: max number of keys to keep
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._data: T.OrderedDict[tuple, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_derive(self, kdf: T_KDF, password: str, salt: bytes) -> bytes:
+        b_password = password.encode("utf-8")
+        key = (hashlib.sha256(b_password).digest(), salt, kdf)
+        with self._lock:
+            try:
+                value = self._data[key]
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            except KeyError:
+                self.misses += 1
+        # derive outside the lock, so other threads are not blocked
+        value = kdf.derive(b_password, salt)
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+derived_key_cache = DerivedKeyCache()
+
+
+def derive_fernet_key(
+    password: str,
+    kdf: T_KDF,
+    salt: bytes,
+) -> bytes:
+    """
+    Derive a fernet key from a password, the result is cached.
+
+    :param salt: required, see :func:`new_salt` and
+      :func:`read_or_create_salt`
+    """
+    if not salt:
+        raise ValueError("a salt is required, see windtalker.kdf.new_salt!")
+    key = derived_key_cache.get_or_derive(kdf, password, salt)
+    return base64.urlsafe_b64encode(key)
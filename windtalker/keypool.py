@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generate asymmetric key pairs in advance.
+
+Generating a 2048 or 4096 bits RSA key pair takes seconds on one core.
+:class:`KeyPool` keeps a number of key pairs ready, generated in the
+background by worker processes, so :meth:`KeyPool.take_key_pair` returns
+instantly. The ready key pairs can be persisted to an encrypted file, so they
+survive a restart. :func:`generate_key_pairs` generates many key pairs at once
+on all CPU cores.
+
+Usage::
+
+    >>> from windtalker.keypool import KeyPool
+    >>> with KeyPool(nbits=2048, size=8) as pool:
+    ...     pubkey, privkey = pool.take_key_pair()
+
+Key pairs are passed between processes in the engine's serialized form (see
+:meth:`~windtalker.engines.Engine.dump_private_key`), so the engine must be
+one of the registered engines in :data:`~windtalker.engines.engine_mapper`.
+"""
+
+import typing as T
+import os
+import json
+import base64
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from pathlib_mate import Path
+
+from .engines import Engine, get_engine
+from .stream import EncryptingWriter, DecryptingReader
+from .exc import FileFormatError
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .cipher import BaseCipher
+
+T_DUMPED_KEY_PAIR = T.Tuple[bytes, bytes]
+
+
+def _new_key_pair(engine_name: str, nbits: T.Optional[int]) -> T_DUMPED_KEY_PAIR:
+    """
+    Create a key pair and serialize it, it runs in worker processes.
+    """
+    engine = get_engine(engine_name)
+    pubkey, privkey = engine.new_keys(nbits)
+    return engine.dump_public_key(pubkey), engine.dump_private_key(privkey)
+
+
+def _load_key_pair(engine: Engine, dumped: T_DUMPED_KEY_PAIR) -> tuple:
+    return engine.load_public_key(dumped[0]), engine.load_private_key(dumped[1])
+
+
+def generate_key_pairs(
+    n: int,
+    nbits: T.Optional[int] = None,
+    engine: T.Optional[T.Union[str, Engine]] = None,
+    workers: T.Optional[int] = None,
+) -> T.List[tuple]:
+    """
+    Generate many key pairs in parallel on a process pool.
+
+    :param n: number of key pairs
+    :param nbits: key size, see :meth:`~windtalker.engines.Engine.new_keys`
+    :param engine: see :mod:`windtalker.engines`
+    :param workers: number of processes, default is the number of CPU cores
+
+    :return: a list of (public key, private key)
+    """
+    engine = get_engine(engine)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or n <= 1:
+        dumped_list = [_new_key_pair(engine.name, nbits) for _ in range(n)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, n)) as executor:
+            dumped_list = list(
+                executor.map(_new_key_pair, [engine.name] * n, [nbits] * n)
+            )
+    return [_load_key_pair(engine, dumped) for dumped in dumped_list]
+
+
+class KeyPool:
+    """
+    A pool of ready to use key pairs, refilled in the background.
+
+    :param nbits: key size, see :meth:`~windtalker.engines.Engine.new_keys`
+    :param engine: see :mod:`windtalker.engines`
+    :param size: number of key pairs to keep ready
+    :param workers: number of worker processes, default is the number of
+      CPU cores
+    :param path: if given, the ready key pairs are saved to this file,
+      encrypted by ``cipher``, and loaded when the pool is created
+    :param cipher: the cipher to encrypt the key pool file, usually a
+      :class:`~windtalker.symmetric.SymmetricCipher`
+
+    A key pair is removed from the file before it is returned by
+    :meth:`take_key_pair`, so the same key pair is never handed out twice.
+    """
+
+    def __init__(
+        self,
+        nbits: T.Optional[int] = None,
+        engine: T.Optional[T.Union[str, Engine]] = None,
+        size: int = 4,
+        workers: T.Optional[int] = None,
+        path: T.Optional[T.Union[str, Path]] = None,
+        cipher: T.Optional["BaseCipher"] = None,
+    ):
+        if size < 1:
+            raise ValueError("size must be at least 1!")
+        if path is not None and cipher is None:
+            raise ValueError("cipher is required to persist the key pool!")
+        self.nbits = nbits
+        self.engine = get_engine(engine)
+        self.size = size
+        self.path = None if path is None else Path(path)
+        self.cipher = cipher
+        self._ready: T.Deque[T_DUMPED_KEY_PAIR] = deque()
+        self._pending: T.Set[Future] = set()
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        # the pool file is written outside ``_lock`` by one writer at a time,
+        # ``_dirty`` tells if the ready key pairs changed since the last write
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._closed = False
+        if self.path is not None and self.path.exists():
+            self._load()
+        self._executor = ProcessPoolExecutor(
+            max_workers=min(workers or os.cpu_count() or 1, size)
+        )
+        self.fill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        """
+        Number of ready key pairs.
+        """
+        return len(self._ready)
+
+    def _load(self):
+        with DecryptingReader(self.cipher, self.path.open("rb")) as reader:
+            data = json.loads(reader.read().decode("utf-8"))
+        if data["engine"] != self.engine.name:
+            raise FileFormatError(
+                f"'{self.path}' is a {data['engine']!r} key pool, "
+                f"not {self.engine.name!r}!"
+            )
+        for pub, priv in data["keys"]:
+            self._ready.append((base64.b64decode(pub), base64.b64decode(priv)))
+
+    def _dump(self, ready: T.List[T_DUMPED_KEY_PAIR]):
+        """
+        Save the ready key pairs, it is called with ``_write_lock`` held.
+        """
+        data = {
+            "version": 1,
+            "engine": self.engine.name,
+            "keys": [
+                [base64.b64encode(pub).decode(), base64.b64encode(priv).decode()]
+                for pub, priv in ready
+            ],
+        }
+        # write a new file then replace, so a crash never leaves a broken pool
+        p_tmp = Path(self.path.abspath + ".tmp")
+        with EncryptingWriter(self.cipher, p_tmp.open("wb")) as writer:
+            writer.write(json.dumps(data).encode("utf-8"))
+        os.replace(p_tmp.abspath, self.path.abspath)
+
+    def _flush(self):
+        """
+        Write the pool file if it is dirty. The snapshot is taken under
+        ``_write_lock``, so when it returns, the file doesn't have any key
+        pair taken before the call, even if another thread wrote it.
+        """
+        if self.path is None:
+            return
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                ready = list(self._ready)
+            try:
+                self._dump(ready)
+            except BaseException:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+            self._done.notify_all()
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._ready.append(future.result())
+            self._dirty = True
+        self._flush()
+
+    def fill(self):
+        """
+        Submit jobs to the worker processes until ``size`` key pairs are
+        ready or being generated.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            n = self.size - len(self._ready) - len(self._pending)
+            futures = [
+                self._executor.submit(_new_key_pair, self.engine.name, self.nbits)
+                for _ in range(n)
+            ]
+            self._pending.update(futures)
+        # add the callback outside the lock, it runs immediately if done
+        for future in futures:
+            future.add_done_callback(self._on_done)
+
+    def wait(self, timeout: T.Optional[float] = None):
+        """
+        Wait until the key pairs being generated are ready, and saved if the
+        pool is persisted.
+        """
+        with self._done:
+            self._done.wait_for(lambda: not self._pending, timeout=timeout)
+        # the callbacks may still be writing the pool file
+        self._flush()
+
+    def take_key_pair(self) -> tuple:
+        """
+        Take a ready key pair out of the pool and refill the pool in the
+        background. If no key pair is ready, generate one in the current
+        process.
+
+        :return: a tuple of (public key, private key)
+        """
+        with self._lock:
+            if self._ready:
+                dumped = self._ready.popleft()
+                self._dirty = True
+            else:
+                dumped = None
+        if dumped is None:
+            dumped = _new_key_pair(self.engine.name, self.nbits)
+        else:
+            self._flush()
+        self.fill()
+        return _load_key_pair(self.engine, dumped)
+
+    def close(self, wait: bool = True):
+        """
+        Cancel the jobs not started and shut down the worker processes.
+
+        :param wait: if True, wait for the running jobs, their key pairs are
+          kept in the pool file
+        """
+        with self._lock:
+            self._closed = True
+            pending = list(self._pending)
+        for future in pending:
+            future.cancel()
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+Lazy module import, to keep ``import windtalker`` fast.
+
+Short lived processes, like the command line tool or a serverless handler
+that only decrypts one token, should not pay for the modules they never use:
+``rsa`` and the asymmetric engines, ``asyncio``, the process pool, the
+directory machinery and ``pathlib_mate``. A module level name created by
+:func:`lazy_import` imports the real module on the first attribute access::
+
+    from .lazy import lazy_import
+
+    aio = lazy_import("windtalker.aio")
+
+    def f():
+        return aio.get_runner()  # windtalker.aio is imported here
+
+Use ``T.TYPE_CHECKING`` imports (with ``from __future__ import annotations``)
+for the type hints, they are not evaluated at run time.
+"""
+
+import typing as T
+import sys
+import types
+import importlib
+
+
+class LazyModule(types.ModuleType):
+    """
+    A module proxy, the real module is imported on the first attribute
+    access. The attributes are not cached, so the proxy always sees the
+    current value, like a monkey patched one in the tests.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str) -> T.Any:
+        return getattr(self._load(), attr)
+
+    def __dir__(self) -> T.List[str]:
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        loaded = self.__dict__["_lazy_module"] is not None
+        return (
+            f"<lazy module {self.__name__!r} ({'loaded' if loaded else 'not loaded'})>"
+        )
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Return the module if it is already imported, otherwise a
+    :class:`LazyModule` that imports it on the first attribute access.
+
+    :param name: the absolute module name, like ``"windtalker.aio"``
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""
+The change manifest for incremental directory encryption.
+
+The manifest is a JSON file in the encrypted output directory, it records
+the size, mtime and optionally the content hash of each source file when it
+was encrypted. The next run only encrypts new or changed files.
+
+The content hash is a HMAC-SHA256 under a key derived from the cipher (see
+:meth:`~windtalker.cipher.BaseCipher._get_hash_key`), so the manifest
+doesn't allow to confirm a guessed plaintext without the key.
+
+Example content::
+
+    {
+        "version": 2,
+        "files": {
+            "images/windtalker.jpg": {
+                "size": 15678,
+                "mtime_ns": 1700000000000000000,
+                "hash": "6b8b...e1f3"
+            }
+        }
+    }
+"""
+
+import typing as T
+import os
+import hmac
+import json
+import hashlib
+import dataclasses
+
+from pathlib_mate import Path
+
+from .vendor.hashes import Hashes, HashAlgoEnum
+from .dirs import FileTask
+
+MANIFEST_FILENAME = ".windtalker-manifest.json"
+
+_hashes = Hashes(algo=HashAlgoEnum.sha256)
+
+
+def hash_file(path: str, key: T.Optional[bytes] = None) -> str:
+    """
+    The content hash used in the manifest.
+
+    :param key: the HMAC key, if None, return the plain SHA-256, it is only
+      for hashes that are never written in clear, like the dedup index
+    """
+    if key is None:
+        return _hashes.of_file(path, chunk_size=1024 * 1024)
+    m = hmac.new(key, digestmod=hashlib.sha256)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            m.update(chunk)
+    return m.hexdigest()
+
+
+@dataclasses.dataclass
+class Entry:
+    size: int
+    mtime_ns: int
+    hash: T.Optional[str] = None
+
+
+@dataclasses.dataclass
+class Manifest:
+    """
+    :param path: the manifest file path
+    :param entries: relative path (with ``/``) to :class:`Entry` mapping
+    """
+
+    path: Path
+    entries: T.Dict[str, Entry] = dataclasses.field(default_factory=dict)
+
+    @classmethod
+    def load(cls, dir_output: Path) -> "Manifest":
+        """
+        Load the manifest from the output directory, return an empty manifest
+        if it doesn't exist.
+        """
+        path = dir_output.joinpath(MANIFEST_FILENAME)
+        if not path.exists():
+            return cls(path=path)
+        data = json.loads(path.read_text(encoding="utf-8"))
+        entries = {relpath: Entry(**entry) for relpath, entry in data["files"].items()}
+        # version 1 has unkeyed hashes, drop them, they are rehashed
+        if data["version"] == 1:
+            for entry in entries.values():
+                entry.hash = None
+        return cls(path=path, entries=entries)
+
+    def dump(self):
+        """
+        Write the manifest atomically.
+        """
+        data = {
+            "version": 2,
+            "files": {
+                relpath: dataclasses.asdict(entry)
+                for relpath, entry in sorted(self.entries.items())
+            },
+        }
+        tmp_path = self.path.abspath + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.path.abspath)
+
+    def plan(
+        self,
+        src: Path,
+        tasks: T.List[FileTask],
+        use_hash: bool = False,
+        hash_key: T.Optional[bytes] = None,
+    ) -> T.Tuple[T.List[FileTask], T.List[FileTask], T.Dict[str, Entry]]:
+        """
+        Compare the tasks with the manifest.
+
+        :param src: the source directory
+        :param tasks: all the file tasks in the source directory
+        :param use_hash: if True, a file with the same size but a different
+          mtime is compared by content hash, so touching a file doesn't
+          trigger re-encryption
+        :param hash_key: the HMAC key of the content hash, required if
+          ``use_hash`` is True
+
+        :return: a tuple of (changed tasks, unchanged tasks, new entries),
+          new entries are the manifest entries to record for the changed
+          tasks once they succeed, and for the unchanged tasks whose
+          mtime is refreshed
+        """
+        if use_hash and hash_key is None:
+            raise ValueError("use_hash requires a hash_key!")
+        changed, unchanged = list(), list()
+        new_entries = dict()
+        for task in tasks:
+            relpath = relpath_of(src, task.src)
+            st = os.stat(task.src)
+            entry = Entry(size=st.st_size, mtime_ns=st.st_mtime_ns)
+            old_entry = self.entries.get(relpath)
+            if old_entry is not None and os.path.exists(task.dst):
+                if (old_entry.size, old_entry.mtime_ns) == (entry.size, entry.mtime_ns):
+                    unchanged.append(task)
+                    continue
+                if use_hash and old_entry.size == entry.size and old_entry.hash:
+                    entry.hash = hash_file(task.src, hash_key)
+                    if entry.hash == old_entry.hash:
+                        unchanged.append(task)
+                        new_entries[relpath] = entry
+                        continue
+            if use_hash and entry.hash is None:
+                entry.hash = hash_file(task.src, hash_key)
+            changed.append(task)
+            new_entries[relpath] = entry
+        return changed, unchanged, new_entries
+
+    def find_removed(self, src: Path, tasks: T.List[FileTask]) -> T.List[str]:
+        """
+        Find the relative paths in the manifest that no longer exist in the
+        source directory.
+        """
+        existing = {relpath_of(src, task.src) for task in tasks}
+        return sorted(set(self.entries) - existing)
+
+    def remove_output(self, dst: Path, relpath: str):
+        """
+        Remove the output file of a relative path in the manifest.
+
+        :raise ValueError: if the relative path resolves outside ``dst``, the
+          manifest is not authenticated, it must not delete anything else
+        """
+        root = os.path.realpath(dst.abspath)
+        path = os.path.realpath(os.path.join(root, relpath))
+        if os.path.commonpath([root, path]) != root or path == root:
+            raise ValueError(f"{relpath!r} is outside of the output dir!")
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def relpath_of(root: Path, path: str) -> str:
+    return Path(path).relative_to(root).as_posix()
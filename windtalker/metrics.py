@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+
+"""
+Structured metrics and progress hooks.
+
+Set an :class:`Instrument` on a cipher to receive an event for every chunk
+and every file that is encrypted or decrypted::
+
+    >>> from windtalker.api import SymmetricCipher
+    >>> from windtalker.metrics import MetricsCollector
+    >>> cipher = SymmetricCipher(password="MyPassword")
+    >>> cipher.instrument = MetricsCollector()
+    >>> cipher.encrypt_file("data.bin", enable_verbose=False)
+    >>> print(cipher.instrument.to_prometheus())
+
+Ready made instruments:
+
+- :class:`ProgressReporter`: prints the progress and the speed of each file.
+- :class:`MetricsCollector`: aggregated counters, exported in the Prometheus
+  text format or as a dict.
+- :class:`JsonLinesExporter`: writes one json line per event.
+- :class:`MultiInstrument`: sends the events to several instruments.
+
+The default instrument :data:`NULL_INSTRUMENT` does nothing, and the chunk
+loop is not wrapped at all when it is used, so it costs nothing.
+
+The chunk events may come from worker threads when ``workers > 1``, an
+instrument must be thread safe. In a process pool (see
+:meth:`~windtalker.cipher.BaseCipher.encrypt_dir_parallel`), the workers don't
+have the instrument, only the file events are sent by the main process.
+"""
+
+import typing as T
+import sys
+import json
+import time
+import threading
+import contextlib
+import dataclasses
+from collections import defaultdict
+
+OP_ENCRYPT = "encrypt"
+OP_DECRYPT = "decrypt"
+
+
+@dataclasses.dataclass
+class ChunkEvent:
+    """
+    One chunk (encrypt) or frame (decrypt) is converted.
+
+    :param queue_depth: number of chunks read but not converted yet,
+      including this one, it is greater than 1 only when ``workers > 1``
+    :param cpu_time: CPU time of the converting thread
+    """
+
+    operation: str
+    path: str
+    index: int
+    bytes_in: int
+    bytes_out: int
+    wall_time: float
+    cpu_time: float
+    queue_depth: int
+
+
+@dataclasses.dataclass
+class FileEvent:
+    """
+    One file is finished.
+
+    :param cpu_time: the sum of the CPU time of all chunks
+    :param error: the error message if failed, None if succeeded
+    """
+
+    operation: str
+    path: str
+    output_path: str
+    bytes_in: int
+    bytes_out: int
+    chunks: int
+    wall_time: float
+    cpu_time: float
+    error: T.Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class Instrument:
+    """
+    The instrument interface, all the hooks do nothing by default.
+    """
+
+    def on_file_start(self, operation: str, path: str, size: int):
+        """
+        :param size: the input file size
+        """
+
+    def on_chunk(self, event: ChunkEvent):
+        pass
+
+    def on_file_end(self, event: FileEvent):
+        pass
+
+
+NULL_INSTRUMENT = Instrument()
+
+
+class FileMeter:
+    """
+    Measure one file and send the events to the instrument, see
+    :func:`meter_file`.
+    """
+
+    def __init__(
+        self,
+        instrument: Instrument,
+        operation: str,
+        path: str,
+        output_path: str,
+    ):
+        self.instrument = instrument
+        self.operation = operation
+        self.path = path
+        self.output_path = output_path
+        self.read = 0
+        self.done = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_time = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, chunks: T.Iterable) -> T.Iterator:
+        """
+        Count the chunks read from the input, for the queue depth.
+        """
+        for chunk in chunks:
+            self.read += 1
+            yield chunk
+
+    def wrap(self, func: T.Callable[..., bytes]) -> T.Callable[..., bytes]:
+        """
+        Wrap a chunk converter, measure each call and send a
+        :class:`ChunkEvent`. The other arguments are passed to ``func``.
+        """
+        perf_counter, thread_time = time.perf_counter, time.thread_time
+
+        def wrapped(data: bytes, *args) -> bytes:
+            st, cpu_st = perf_counter(), thread_time()
+            output = func(data, *args)
+            wall_time, cpu_time = perf_counter() - st, thread_time() - cpu_st
+            with self._lock:
+                index = self.done
+                queue_depth = self.read - self.done
+                self.done += 1
+                self.bytes_in += len(data)
+                self.bytes_out += len(output)
+                self.cpu_time += cpu_time
+            self.instrument.on_chunk(
+                ChunkEvent(
+                    operation=self.operation,
+                    path=self.path,
+                    index=index,
+                    bytes_in=len(data),
+                    bytes_out=len(output),
+                    wall_time=wall_time,
+                    cpu_time=cpu_time,
+                    queue_depth=queue_depth,
+                )
+            )
+            return output
+
+        return wrapped
+
+
+@contextlib.contextmanager
+def meter_file(
+    instrument: Instrument,
+    operation: str,
+    path: str,
+    output_path: str,
+    size: int,
+) -> T.Iterator[T.Optional[FileMeter]]:
+    """
+    Send the file start and file end events around the block. It yields
+    None for :data:`NULL_INSTRUMENT`, so the caller can skip the chunk
+    wrapping.
+    """
+    if instrument is NULL_INSTRUMENT:
+        yield None
+        return
+    instrument.on_file_start(operation, path, size)
+    meter = FileMeter(instrument, operation, path, output_path)
+    st = time.perf_counter()
+    error = None
+    try:
+        yield meter
+    except Exception as e:
+        error = f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        instrument.on_file_end(
+            FileEvent(
+                operation=operation,
+                path=path,
+                output_path=output_path,
+                bytes_in=meter.bytes_in,
+                bytes_out=meter.bytes_out,
+                chunks=meter.done,
+                wall_time=time.perf_counter() - st,
+                cpu_time=meter.cpu_time,
+                error=error,
+            )
+        )
+
+
+class MultiInstrument(Instrument):
+    """
+    Send the events to all the instruments.
+    """
+
+    def __init__(self, *instruments: Instrument):
+        self.instruments = instruments
+
+    def on_file_start(self, operation: str, path: str, size: int):
+        for instrument in self.instruments:
+            instrument.on_file_start(operation, path, size)
+
+    def on_chunk(self, event: ChunkEvent):
+        for instrument in self.instruments:
+            instrument.on_chunk(event)
+
+    def on_file_end(self, event: FileEvent):
+        for instrument in self.instruments:
+            instrument.on_file_end(event)
+
+
+class ProgressReporter(Instrument):
+    """
+    Print the progress of each file, at most once per ``interval`` seconds
+    per file, and a line when it is finished.
+
+    :param stream: where to print, default is ``sys.stderr``
+    """
+
+    def __init__(self, stream: T.Optional[T.TextIO] = None, interval: float = 1.0):
+        self.stream = stream
+        self.interval = interval
+        self._files: T.Dict[str, list] = dict()  # path -> [size, done, last time]
+        self._lock = threading.Lock()
+
+    def _print(self, message: str):
+        print(message, file=self.stream or sys.stderr)
+
+    def on_file_start(self, operation: str, path: str, size: int):
+        with self._lock:
+            self._files[path] = [size, 0, time.perf_counter()]
+
+    def on_chunk(self, event: ChunkEvent):
+        with self._lock:
+            state = self._files.get(event.path)
+            if state is None:
+                return
+            state[1] += event.bytes_in
+            now = time.perf_counter()
+            if now - state[2] < self.interval:
+                return
+            state[2] = now
+            size, done = state[0], state[1]
+        percent = 100.0 * done / size if size else 100.0
+        self._print(f"{event.operation} '{event.path}': {percent:.1f}%")
+
+    def on_file_end(self, event: FileEvent):
+        with self._lock:
+            self._files.pop(event.path, None)
+        if event.ok:
+            speed = event.bytes_in / event.wall_time / 1024**2 if event.wall_time else 0
+            self._print(
+                f"{event.operation} '{event.path}': done, "
+                f"{event.wall_time:.3f}s, {speed:.2f}MB/s"
+            )
+        else:
+            self._print(f"{event.operation} '{event.path}': failed, {event.error}")
+
+
+class MetricsCollector(Instrument):
+    """
+    Aggregate the events into counters by operation.
+    """
+
+    _counters = [
+        ("files_total", "Number of files processed."),
+        ("files_failed_total", "Number of files failed."),
+        ("chunks_total", "Number of chunks processed."),
+        ("bytes_in_total", "Number of input bytes."),
+        ("bytes_out_total", "Number of output bytes."),
+        ("wall_seconds_total", "Wall clock time of the files."),
+        ("cpu_seconds_total", "CPU time of the chunks."),
+    ]
+
+    def __init__(self, prefix: str = "windtalker"):
+        self.prefix = prefix
+        self.counters: T.Dict[str, T.Dict[str, float]] = defaultdict(
+            lambda: dict.fromkeys([name for name, _ in self._counters], 0)
+        )
+        self.max_queue_depth = 0
+        self._lock = threading.Lock()
+
+    def on_chunk(self, event: ChunkEvent):
+        with self._lock:
+            counters = self.counters[event.operation]
+            counters["chunks_total"] += 1
+            counters["cpu_seconds_total"] += event.cpu_time
+            if event.queue_depth > self.max_queue_depth:
+                self.max_queue_depth = event.queue_depth
+
+    def on_file_end(self, event: FileEvent):
+        with self._lock:
+            counters = self.counters[event.operation]
+            counters["files_total"] += 1
+            if not event.ok:
+                counters["files_failed_total"] += 1
+            counters["bytes_in_total"] += event.bytes_in
+            counters["bytes_out_total"] += event.bytes_out
+            counters["wall_seconds_total"] += event.wall_time
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {op: dict(c) for op, c in self.counters.items()},
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Export in the Prometheus text exposition format.
+        """
+        data = self.to_dict()
+        lines = list()
+        for name, help_text in self._counters:
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for operation, counters in sorted(data["counters"].items()):
+                lines.append(f'{metric}{{operation="{operation}"}} {counters[name]}')
+        metric = f"{self.prefix}_max_queue_depth"
+        lines.append(f"# HELP {metric} Max number of chunks in flight.")
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {data['max_queue_depth']}")
+        return "\n".join(lines) + "\n"
+
+
+class JsonLinesExporter(Instrument):
+    """
+    Write one json line per event to a text file object.
+
+    :param chunks: if False, only write the file events
+    """
+
+    def __init__(self, f: T.TextIO, chunks: bool = False):
+        self.f = f
+        self.chunks = chunks
+        self._lock = threading.Lock()
+
+    def _write(self, event: str, data: dict):
+        line = json.dumps({"event": event, **data})
+        with self._lock:
+            self.f.write(line + "\n")
+
+    def on_chunk(self, event: ChunkEvent):
+        if self.chunks:
+            self._write("chunk", dataclasses.asdict(event))
+
+    def on_file_end(self, event: FileEvent):
+        self._write("file", dataclasses.asdict(event))
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+"""
+File object wrappers to encrypt / decrypt data on the fly.
+
+Example::
+
+    >>> import tarfile
+    >>> from windtalker.api import SymmetricCipher
+    >>> from windtalker.stream import EncryptingWriter, DecryptingReader
+    >>> cipher = SymmetricCipher(password="MyPassword")
+    >>> with open("backup.tar-encrypted", "wb") as f:
+    ...     with EncryptingWriter(cipher, f) as writer:
+    ...         with tarfile.open(fileobj=writer, mode="w|") as tar:
+    ...             tar.add("my-folder")
+    >>> with open("backup.tar-encrypted", "rb") as f:
+    ...     with DecryptingReader(cipher, f) as reader:
+    ...         with tarfile.open(fileobj=reader, mode="r|") as tar:
+    ...             tar.extractall("restored")
+
+The encrypted data is in the container format, see
+:mod:`windtalker.container`.
+"""
+
+import typing as T
+import io
+
+from . import container
+from . import compress
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .cipher import BaseCipher
+
+
+class EncryptingWriter(io.RawIOBase):
+    """
+    A writable binary file object. Data written to it is split into chunks,
+    encrypted and written to the underlying ``raw`` file object.
+
+    The last chunk is encrypted when the writer is closed, so always close
+    it (or use it as a context manager). If the ``with`` block exits with an
+    exception, the end frame is not written, so the partial output fails to
+    decrypt instead of looking like a complete (but truncated) stream.
+
+    :param cipher: the cipher object
+    :param raw: writable binary file object, like an opened file, a socket
+      file, ``sys.stdout.buffer``, a ``zipfile`` member
+    :param chunk_size: plain data chunk size, default is the cipher's
+    :param index: if True, write the chunk index footer
+    :param compression: compress each chunk before encryption, one of
+      "zlib", "lzma", "bz2", see :mod:`windtalker.compress`
+    :param close_raw: if True, close ``raw`` when this writer is closed
+    """
+
+    def __init__(
+        self,
+        cipher: "BaseCipher",
+        raw: T.BinaryIO,
+        chunk_size: T.Optional[int] = None,
+        index: bool = False,
+        compression: T.Optional[str] = None,
+        close_raw: bool = True,
+    ):
+        if chunk_size is None:
+            chunk_size = cipher._get_chunk_size()
+        self.cipher = cipher
+        self.raw = raw
+        self.chunk_size = chunk_size
+        self.close_raw = close_raw
+        if isinstance(raw, io.RawIOBase):
+            # raw write may write less bytes than given
+            raw = io.BufferedWriter(raw)
+        self._sink = raw
+        self._buffer = bytearray()
+        self._aborted = False
+        key_block, self._encrypt_end_frame = cipher._begin_encrypt(
+            container.new_header(
+                cipher_id=cipher._cipher_id,
+                chunk_size=chunk_size,
+                index=index,
+                compressed=compression is not None,
+            )
+        )
+        self._encrypt_frame = self._encrypt_end_frame
+        if compression is not None:
+            self._encrypt_frame = compress.wrap_encrypt_frame(
+                self._encrypt_frame, compress.get_codec(compression)
+            )
+        self._writer = container.ContainerWriter(
+            raw,
+            cipher_id=cipher._cipher_id,
+            chunk_size=chunk_size,
+            index=index,
+            compressed=compression is not None,
+            key_block=key_block,
+        )
+
+    def writable(self) -> bool:
+        return True
+
+    def _write_chunk(self, chunk: bytes):
+        aad = self._writer.header.frame_aad(self._writer.chunk_count)
+        self._writer.write_frame(self._encrypt_frame(chunk, aad), len(chunk))
+
+    def write(self, b) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+        self._buffer += b
+        chunk_size = self.chunk_size
+        if len(self._buffer) >= chunk_size:
+            view = memoryview(self._buffer)
+            start = 0
+            while len(self._buffer) - start >= chunk_size:
+                self._write_chunk(bytes(view[start : start + chunk_size]))
+                start += chunk_size
+            view.release()
+            del self._buffer[:start]
+        return len(b)
+
+    def flush(self):
+        """
+        Flush the underlying file object. The pending data smaller than a
+        chunk is not encrypted until :meth:`close`, so all the chunks except
+        the last one have the same size.
+        """
+        if not self.closed:
+            self._sink.flush()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._aborted = True
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._aborted:
+                return
+            if self._buffer:
+                self._write_chunk(bytes(self._buffer))
+                self._buffer.clear()
+            self._writer.finish(self._encrypt_end_frame)
+            self._sink.flush()
+        finally:
+            super().close()
+            if self._sink is not self.raw:
+                self._sink.detach()
+            if self.close_raw:
+                self.raw.close()
+
+
+class _PrefixedReader:
+    """
+    Read some bytes we already consumed first, then read from the file object.
+    """
+
+    def __init__(self, prefix: bytes, f):
+        self.prefix = prefix
+        self.f = f
+
+    def read(self, n: int) -> bytes:
+        if self.prefix:
+            data, self.prefix = self.prefix[:n], self.prefix[n:]
+            if len(data) < n:
+                data += self.f.read(n - len(data))
+            return data
+        return self.f.read(n)
+
+
+def _read_exactly(f, n: int) -> bytes:
+    data = f.read(n)
+    while data and len(data) < n:
+        more = f.read(n - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+class DecryptingReader(io.RawIOBase):
+    """
+    A readable binary file object. It reads encrypted data from the underlying
+    ``raw`` file object, and returns decrypted data. It only holds one
+    decrypted chunk in memory.
+
+    Both the container format and the legacy format are supported.
+
+    :param cipher: the cipher object
+    :param raw: readable binary file object, like an opened file, a socket
+      file, ``sys.stdin.buffer``, a ``zipfile`` member
+    :param close_raw: if True, close ``raw`` when this reader is closed
+    """
+
+    def __init__(
+        self,
+        cipher: "BaseCipher",
+        raw: T.BinaryIO,
+        close_raw: bool = True,
+    ):
+        self.cipher = cipher
+        self.raw = raw
+        self.close_raw = close_raw
+        if isinstance(raw, io.RawIOBase):
+            # make sure read(n) returns n bytes unless EOF
+            raw = io.BufferedReader(raw)
+        self._source = raw
+        self._chunks: T.Optional[T.Iterator[bytes]] = None
+        self._buffer = b""
+        self._pos = 0
+        self.header: T.Optional[container.Header] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def _iter_chunks(self) -> T.Iterator[bytes]:
+        head = _read_exactly(self._source, len(container.MAGIC))
+        f = _PrefixedReader(head, self._source)
+        if container.is_container(head):
+            self.header = container.Header.read(f)
+            container.check_cipher_id(self.header, self.cipher._cipher_id)
+            yield from container.decrypt_frames(
+                container.iter_frames(f, self.header),
+                self.header,
+                self.cipher._begin_decrypt(self.header),
+            )
+        else:  # legacy format
+            chunk_size = self.cipher._decrypt_chunk_size
+            while 1:
+                token = _read_exactly(f, chunk_size)
+                if not token:
+                    break
+                yield self.cipher.decrypt(token)
+
+    def _fill(self) -> bool:
+        """
+        Decrypt the next chunk into the buffer, return False if EOF.
+        """
+        if self._chunks is None:
+            self._chunks = self._iter_chunks()
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer = chunk
+                self._pos = 0
+                return True
+        return False
+
+    def readinto(self, b) -> int:
+        if self.closed:
+            raise ValueError("read from closed file")
+        if self._pos >= len(self._buffer):
+            if not self._fill():
+                return 0
+        n = min(len(b), len(self._buffer) - self._pos)
+        b[:n] = self._buffer[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._chunks is not None:
+                self._chunks.close()
+        finally:
+            super().close()
+            if self.close_raw:
+                self.raw.close()
@@ -1,18 +1,64 @@
 # -*- coding: utf-8 -*-
 
 import typing as T
+import os
+import time
+import hmac
 import base64
+import hashlib
+import threading
 
 from cryptography.fernet import Fernet
-from .vendor.hashes import hashes
+from cryptography.hazmat.primitives.hmac import HMAC
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
+from . import kdf as kdf_
 from .exc import PasswordError
-from .paths import path_windtalker
 from .cipher import BaseCipher
+from .container import Header, CIPHER_ID_FERNET
+from .chunking import ChunkPolicy, KB, MB
+from .lazy import lazy_import
 
+vendor_hashes = lazy_import("windtalker.vendor.hashes")
 
-def read_windtalker_password():  # pragma: no cover
-    return path_windtalker.read_text(encoding="utf-8").strip()
+# same as :data:`windtalker.paths.path_windtalker`, as a plain string, so
+# reading the password doesn't import ``pathlib_mate``
+path_windtalker = os.path.join(os.path.expanduser("~"), ".windtalker")
+
+_password_cache_lock = threading.Lock()
+_password_cache: T.Dict[str, T.Any] = {"stat": None, "password": None}
+
+
+def frame_size(plaintext_length: int) -> int:
+    """
+    The size of a binary Fernet token (a container frame) of plain data of
+    this size.
+    """
+    # version + timestamp + iv + padded ciphertext + hmac
+    return 57 + (plaintext_length // 16 + 1) * 16
+
+
+def _stat_windtalker_password() -> T.Tuple[int, int]:
+    st = os.stat(path_windtalker)
+    return st.st_mtime_ns, st.st_size
+
+
+def read_windtalker_password() -> str:
+    """
+    Read the password from ``${HOME}/.windtalker``. The content is cached
+    until the file's mtime or size changes.
+    """
+    stat = _stat_windtalker_password()
+    with _password_cache_lock:
+        if _password_cache["stat"] == stat:
+            return _password_cache["password"]
+    with open(path_windtalker, "r", encoding="utf-8") as f:
+        password = f.read().strip()
+    with _password_cache_lock:
+        _password_cache["stat"] = stat
+        _password_cache["password"] = password
+    return password
 
 
 class SymmetricCipher(BaseCipher):
@@ -23,34 +69,111 @@ class SymmetricCipher(BaseCipher):
     :param password: The secret password you use to encrypt all your message.
       If you feel uncomfortable to put that in your code, you can leave it
       empty. The system will ask you manually enter that later.
+    :param kdf: the key derivation function parameters, like
+      :class:`windtalker.kdf.Scrypt` or :class:`windtalker.kdf.PBKDF2`.
+      If not given, use the legacy MD5 based key, it is fast but weak,
+      and it is kept for backward compatibility.
+    :param salt: the salt for the ``kdf``, default is the random per
+      installation salt, see :func:`windtalker.kdf.read_or_create_salt`
 
     **中文文档**
 
     对称加密器。
     """
 
+    _chunk_policy = ChunkPolicy(default=1 * MB, min_size=64 * KB, max_size=100 * MB)
     _encrypt_chunk_size = 1024 * 1024  # 1 MB
     _decrypt_chunk_size = 1398200  # 1.398 MB
     """Symmtric algorithm needs to break big files in small chunk, and encrypt
     them one by one, and concatenate them at the end. Each chunk has a fixed 
     size. That's what these two attributes for.
     """
+    _cipher_id = CIPHER_ID_FERNET
 
-    def __init__(self, password: T.Optional[str] = None):
+    def __init__(
+        self,
+        password: T.Optional[str] = None,
+        kdf: T.Optional[kdf_.T_KDF] = None,
+        salt: T.Optional[bytes] = None,
+    ):
+        if kdf is not None and salt is None:
+            salt = kdf_.read_or_create_salt()
+        self.kdf = kdf
+        self.salt = salt
         if password:
-            fernet_key = self.any_text_to_fernet_key(password)
-            self.fernet = Fernet(fernet_key)  # type: Fernet
+            self.set_password(password)
         else:  # pragma: no cover
-            if path_windtalker.exists():
+            if os.path.exists(path_windtalker):
                 self.set_password(read_windtalker_password())
             else:
                 self.input_password()
 
+    _default_cache_lock = threading.Lock()
+    _default_cache: T.Dict[tuple, T.Tuple[T.Any, "SymmetricCipher"]] = dict()
+
+    @classmethod
+    def default(
+        cls,
+        kdf: T.Optional[kdf_.T_KDF] = None,
+        salt: T.Optional[bytes] = None,
+    ) -> "SymmetricCipher":
+        """
+        Return a shared cipher using the password in ``${HOME}/.windtalker``.
+        It is created once and reused until the file's mtime changes.
+        """
+        stat = _stat_windtalker_password()
+        key = (cls, kdf, salt)
+        with cls._default_cache_lock:
+            try:
+                cached_stat, cipher = cls._default_cache[key]
+                if cached_stat == stat:
+                    return cipher
+            except KeyError:
+                pass
+        cipher = cls(password=read_windtalker_password(), kdf=kdf, salt=salt)
+        with cls._default_cache_lock:
+            cls._default_cache[key] = (stat, cipher)
+        return cipher
+
+    def _set_fernet_key(self, fernet_key: bytes):
+        self.fernet_key = fernet_key
+        self.fernet = Fernet(fernet_key)  # type: Fernet
+        key = base64.urlsafe_b64decode(fernet_key)
+        self._signing_key = key[:16]
+        self._encryption_key = key[16:]
+
+    def _get_hash_key(self) -> bytes:
+        key = base64.urlsafe_b64decode(self.fernet_key)
+        return hmac.new(key, b"windtalker content hash", hashlib.sha256).digest()
+
+    @classmethod
+    def from_fernet_key(cls, fernet_key: bytes) -> "SymmetricCipher":
+        """
+        Create a cipher from a fernet key directly, without password.
+        """
+        cipher = cls.__new__(cls)
+        cipher.kdf = None
+        cipher.salt = None
+        cipher._set_fernet_key(fernet_key)
+        return cipher
+
+    def to_key_material(self) -> dict:
+        return {"fernet_key": self.fernet_key, **self.metadata}
+
+    @classmethod
+    def from_key_material(cls, key_material: dict) -> "SymmetricCipher":
+        cipher = cls.from_fernet_key(key_material["fernet_key"])
+        cipher._encrypt_chunk_size = key_material["_encrypt_chunk_size"]
+        cipher._decrypt_chunk_size = key_material["_decrypt_chunk_size"]
+        return cipher
+
     def any_text_to_fernet_key(self, text: str) -> bytes:
         """
         Convert any text to a fernet key for encryption.
         """
-        md5 = hashes.of_str(text)
+        if self.kdf is not None:
+            return kdf_.derive_fernet_key(text, kdf=self.kdf, salt=self.salt)
+        md5 = vendor_hashes.hashes.of_str(text)
         fernet_key = base64.b64encode(md5.encode("utf-8"))
         return fernet_key
 
@@ -65,17 +188,12 @@ class SymmetricCipher(BaseCipher):
         """
         Set a new password for encryption.
         """
-        self.__init__(password=password)
+        self._set_fernet_key(self.any_text_to_fernet_key(password))
 
     def set_encrypt_chunk_size(self, size: int):
-        if 1024 * 1024 < size < 100 * 1024 * 1024:
-            self._encrypt_chunk_size = size
-            self._decrypt_chunk_size = len(self.encrypt(b"x" * size))
-        else:
-            raise ValueError(
-                f"Cannot set encrypt chunk size = {size}, "
-                f"encrypt chunk size has to be between 1MB and 100MB"
-            )
+        super().set_encrypt_chunk_size(size)
+        # the legacy format token is the base64 encoded frame
+        self._decrypt_chunk_size = (self._frame_size(size) + 2) // 3 * 4
 
     @property
     def metadata(self) -> dict:
@@ -98,3 +216,76 @@ class SymmetricCipher(BaseCipher):
             return self.fernet.decrypt(binary)
         except:
             raise PasswordError("Ops, wrong magic word!")
+
+    # Fernet token is ``base64(version | timestamp | iv | ciphertext | hmac)``.
+    # In container format, we store the binary token without base64, so
+    # it is 25% smaller and we don't pay the base64 encode / decode cost.
+    # The HMAC also covers the associated data of the frame (appended after
+    # the ciphertext, not stored), so since container version 3 a frame is
+    # no longer a valid Fernet token, before that
+    # ``base64.urlsafe_b64encode(frame)`` is.
+    #
+    # Both methods accept any bytes-like object (like a memoryview of a
+    # memory mapped file), the AES output is written directly into one
+    # preallocated buffer with ``update_into``, no intermediate copies.
+    _FERNET_VERSION = b"\x80"
+
+    def _frame_size(self, plaintext_length: int) -> int:
+        return frame_size(plaintext_length)
+
+    def _begin_verify(self, header: Header) -> T.Callable[[bytes, bytes], T.Any]:
+        return self._verify_frame
+
+    def _encrypt_frame(self, binary: bytes, aad: bytes = b"") -> bytearray:
+        iv = os.urandom(16)
+        length = len(binary)
+        pad = 16 - length % 16
+        body_size = 25 + length + pad
+        # update_into needs block_size - 1 more bytes than the output
+        token = bytearray(body_size + 32 + 15)
+        token[0:1] = self._FERNET_VERSION
+        token[1:9] = int(time.time()).to_bytes(length=8, byteorder="big")
+        token[9:25] = iv
+        encryptor = Cipher(
+            algorithms.AES(self._encryption_key),
+            modes.CBC(iv),
+        ).encryptor()
+        with memoryview(token) as view:
+            written = encryptor.update_into(binary, view[25:])
+            encryptor.update_into(bytes((pad,)) * pad, view[25 + written :])
+            encryptor.finalize()
+            h = HMAC(self._signing_key, SHA256())
+            h.update(view[:body_size])
+            h.update(aad)
+            view[body_size : body_size + 32] = h.finalize()
+        del token[body_size + 32 :]
+        return token
+
+    def _verify_frame(self, binary: bytes, aad: bytes = b""):
+        # the HMAC covers version, timestamp, iv, ciphertext and the aad
+        if len(binary) < 57 or binary[:1] != self._FERNET_VERSION:
+            raise PasswordError("Ops, wrong magic word!")
+        h = HMAC(self._signing_key, SHA256())
+        h.update(binary[:-32])
+        h.update(aad)
+        try:
+            h.verify(bytes(binary[-32:]))
+        except Exception:
+            raise PasswordError("Ops, wrong magic word!")
+
+    def _decrypt_frame(self, binary: bytes, aad: bytes = b"") -> bytearray:
+        self._verify_frame(binary, aad)
+        decryptor = Cipher(
+            algorithms.AES(self._encryption_key),
+            modes.CBC(bytes(binary[9:25])),
+        ).decryptor()
+        ciphertext = binary[25:-32]
+        data = bytearray(len(ciphertext) + 15)
+        written = decryptor.update_into(ciphertext, data)
+        decryptor.finalize()
+        pad = data[written - 1] if written else 0
+        padding = data[written - pad : written]
+        if not 1 <= pad <= min(16, written) or padding.count(pad) != pad:
+            raise PasswordError("Ops, wrong magic word!")
+        del data[written - pad :]
+        return data
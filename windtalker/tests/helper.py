@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import typing as T
+
+from pathlib_mate import Path
+
 from ..paths import dir_project_root, dir_htmlcov, dir_tests_lib
 from ..vendor.pytest_cov_helper import run_cov_test as _run_cov_test
 
@@ -21,12 +25,14 @@ def run_cov_test(
 
 
 p_original = dir_tests_lib / "my-secret-file.txt"
-p_encrypted = dir_tests_lib / "my-secret-file-encrypted.txt"
-p_decrypted = dir_tests_lib / "my-secret-file-decrypted.txt"
-
 dir_original = dir_tests_lib / "MySecretFolder"
-dir_encrypted = dir_tests_lib / "MySecretFolder-encrypted"
-dir_decrypted = dir_tests_lib / "MySecretFolder-decrypted"
+
+
+def get_output_paths(tmp_path) -> T.Tuple[Path, Path]:
+    """
+    Return the encrypted and decrypted output paths under ``tmp_path``.
+    """
+    return Path(tmp_path, "encrypted"), Path(tmp_path, "decrypted")
 
 
 class BaseTestCipher:
@@ -43,8 +49,23 @@ class BaseTestCipher:
         b = s.encode("utf-8")
         assert self.c.decrypt_binary(self.c.encrypt_binary(b)) == b
 
-    def test_encrypt_and_decrypt_file(self):
-        original_text = p_original.read_text()
+    def test_encrypt_and_decrypt_many(self):
+        texts = [f"message {i}" for i in range(25)]
+        for workers in [1, 3]:
+            tokens = self.c.encrypt_text_many(texts, workers=workers, batch_size=4)
+            assert [self.c.decrypt_text(token) for token in tokens] == texts
+            results = self.c.decrypt_text_many(
+                iter(tokens), workers=workers, batch_size=4, stream=True
+            )
+            assert list(results) == texts
+
+            binaries = [text.encode("utf-8") for text in texts]
+            tokens = self.c.encrypt_binary_many(binaries, workers=workers)
+            assert self.c.decrypt_binary_many(tokens, workers=workers) == binaries
+
+    def test_encrypt_and_decrypt_file(self, tmp_path):
+        p_encrypted, p_decrypted = get_output_paths(tmp_path)
+        original_text = p_original.read_bytes()
 
         self.c.encrypt_file(
             p_original,
@@ -52,7 +73,7 @@ class BaseTestCipher:
             overwrite=True,
             enable_verbose=False,
         )
-        encrypted_text = p_encrypted.read_text()
+        encrypted_text = p_encrypted.read_bytes()
 
         self.c.decrypt_file(
             p_encrypted,
@@ -60,12 +81,31 @@ class BaseTestCipher:
             overwrite=True,
             enable_verbose=False,
         )
-        decrypted_text = p_decrypted.read_text()
+        decrypted_text = p_decrypted.read_bytes()
 
         assert original_text == decrypted_text
         assert original_text != encrypted_text
 
-    def test_encrypt_and_decrypt_dir(self):
+    def test_encrypt_and_decrypt_file_with_workers(self, tmp_path):
+        p_encrypted, p_decrypted = get_output_paths(tmp_path)
+        self.c.encrypt_file(
+            p_original,
+            p_encrypted,
+            overwrite=True,
+            enable_verbose=False,
+            workers=4,
+        )
+        self.c.decrypt_file(
+            p_encrypted,
+            p_decrypted,
+            overwrite=True,
+            enable_verbose=False,
+            workers=4,
+        )
+        assert p_original.read_bytes() == p_decrypted.read_bytes()
+
+    def test_encrypt_and_decrypt_dir(self, tmp_path):
+        dir_encrypted, dir_decrypted = get_output_paths(tmp_path)
         self.c.encrypt_dir(
             dir_original,
             dir_encrypted,
@@ -83,3 +123,33 @@ class BaseTestCipher:
             dir_decrypted.select_file(recursive=True),
         ):
             assert p1.read_bytes() == p2.read_bytes()
+
+    def test_encrypt_and_decrypt_dir_parallel(self, tmp_path):
+        dir_encrypted, dir_decrypted = get_output_paths(tmp_path)
+        for use_process in [True, False]:
+            summary = self.c.encrypt_dir_parallel(
+                dir_original,
+                dir_encrypted,
+                overwrite=True,
+                enable_verbose=False,
+                workers=2,
+                use_process=use_process,
+            )
+            assert summary.ok
+            assert len(summary.results) == len(
+                list(dir_original.select_file(recursive=True))
+            )
+            summary = self.c.decrypt_dir_parallel(
+                dir_encrypted,
+                dir_decrypted,
+                overwrite=True,
+                enable_verbose=False,
+                workers=2,
+                use_process=use_process,
+            )
+            assert summary.ok
+            for p1, p2 in zip(
+                dir_original.select_file(recursive=True),
+                dir_decrypted.select_file(recursive=True),
+            ):
+                assert p1.read_bytes() == p2.read_bytes()
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+"""
+Verify encrypted files and directories without decrypting them to disk.
+
+Each chunk is authenticated, for :class:`~windtalker.symmetric.SymmetricCipher`
+(and the session key of :class:`~windtalker.asymmetric.AsymmetricCipher`) only
+the Fernet HMAC is checked, the AES decryption is skipped. Nothing is
+written::
+
+    >>> from windtalker.api import SymmetricCipher
+    >>> cipher = SymmetricCipher(password="MyPassword")
+    >>> report = cipher.verify_dir("/mnt/backup-encrypted", workers=8)
+    >>> for file_report in report.failed:
+    ...     print(file_report.path, file_report.bad_chunk, file_report.error)
+
+A chunk fails if the file is damaged or the password is wrong, the two
+can't be told apart.
+"""
+
+import typing as T
+import os
+import time
+import dataclasses
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from pathlib_mate import Path
+
+from . import files
+from . import container
+from . import dirs
+from .exc import FileFormatError
+from .manifest import MANIFEST_FILENAME
+from .checkpoint import JOURNAL_SUFFIX, DIR_JOURNAL_FILENAME, Journal
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .cipher import BaseCipher
+
+
+@dataclasses.dataclass
+class FileReport:
+    """
+    The verification result of one file.
+
+    :param chunk_count: number of authentic chunks, they are before the bad
+      chunk if any
+    :param bad_chunk: index of the first bad or missing chunk, None if all
+      the chunks are good, or the file can't be verified at all (like a file
+      of another cipher, see ``error``)
+    :param error: the error message, None if the file is intact
+    """
+
+    path: str
+    size: int
+    chunk_count: int = 0
+    bad_chunk: T.Optional[int] = None
+    error: T.Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclasses.dataclass
+class DirReport:
+    """
+    The verification result of a directory.
+    """
+
+    path: str
+    reports: T.List[FileReport] = dataclasses.field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def failed(self) -> T.List[FileReport]:
+        return [report for report in self.reports if not report.ok]
+
+    @property
+    def ok(self) -> bool:
+        return all(report.ok for report in self.reports)
+
+    @property
+    def total_size(self) -> int:
+        return sum(report.size for report in self.reports)
+
+
+def _is_authentic(
+    verify_frame: T.Callable[[bytes, bytes], T.Any],
+    frame: bytes,
+    aad: bytes,
+) -> bool:
+    try:
+        verify_frame(frame, aad)
+        return True
+    except Exception:
+        return False
+
+
+def _verify_frames(
+    report: FileReport,
+    frames: T.Iterable[bytes],
+    verify_frame: T.Callable[[bytes, bytes], T.Any],
+    workers: int,
+    header: T.Optional[container.Header] = None,
+) -> T.Optional[bytes]:
+    """
+    Stop at the first bad frame.
+
+    :param header: the container header, to get the associated data of
+      each frame, None for the legacy format
+
+    :return: the encrypted end frame, if the file has one and all the
+      frames before it are good
+    """
+
+    def func(item: T.Tuple[int, bytes]) -> T.Union[bool, bytes]:
+        number, frame = item
+        if isinstance(frame, container.EndFrame):
+            return frame
+        aad = b"" if header is None else header.frame_aad(number)
+        return _is_authentic(verify_frame, frame, aad)
+
+    if workers > 1:
+        results = files.imap_ordered(func, enumerate(frames), workers=workers)
+    else:
+        results = map(func, enumerate(frames))
+    try:
+        for is_authentic in results:
+            if isinstance(is_authentic, container.EndFrame):
+                return is_authentic
+            if not is_authentic:
+                report.bad_chunk = report.chunk_count
+                report.error = f"chunk {report.chunk_count} is not authentic!"
+                return
+            report.chunk_count += 1
+    except FileFormatError as e:  # truncated
+        report.bad_chunk = report.chunk_count
+        report.error = f"FileFormatError: {e}"
+    finally:
+        # stop the reader thread first, then release the memoryview
+        if hasattr(results, "close"):
+            results.close()
+        if hasattr(frames, "close"):
+            frames.close()
+
+
+def _check_end_frame(
+    report: FileReport,
+    cipher: "BaseCipher",
+    header: container.Header,
+    end_frame: T.Optional[bytes],
+):
+    """
+    Decrypt the end frame and compare its chunk count (and the header's)
+    with the good chunks. The plaintext length is not known without
+    decrypting the chunks, it is not checked.
+    """
+    try:
+        if end_frame is not None:
+            end_frame = cipher._begin_decrypt(header)(
+                end_frame, header.frame_aad(report.chunk_count, final=True)
+            )
+        container.check_end_frame(header, end_frame, None, report.chunk_count)
+    except Exception as e:
+        report.bad_chunk = report.chunk_count
+        report.error = f"{e.__class__.__name__}: {e}"
+
+
+def verify_file(
+    cipher: "BaseCipher",
+    path: str,
+    workers: int = 1,
+) -> FileReport:
+    """
+    Authenticate every chunk of an encrypted file, both the container
+    format and the legacy format are supported.
+
+    :param workers: number of threads to verify chunks in parallel
+    """
+    path = os.path.abspath(str(path))
+    st = time.perf_counter()
+    report = FileReport(path=path, size=os.path.getsize(path))
+    try:
+        with open(path, "rb") as f:
+            if container.is_container_file(f):
+                header = container.Header.read(f)
+                container.check_cipher_id(header, cipher._cipher_id)
+                verify_frame = cipher._begin_verify(header)
+                with files.open_mmap(f) as mm:
+                    if mm is None:
+                        frames = container.iter_frames(f, header)
+                    else:
+                        frames = container.iter_frame_views(mm, header.size, header)
+                    end_frame = _verify_frames(
+                        report, frames, verify_frame, workers, header
+                    )
+                if report.ok:
+                    _check_end_frame(report, cipher, header, end_frame)
+            else:  # legacy format
+                frames = files.iter_chunks(f, cipher._decrypt_chunk_size)
+                verify_frame = lambda frame, aad: cipher.decrypt(frame)
+                _verify_frames(report, frames, verify_frame, workers)
+    except Exception as e:
+        report.error = f"{e.__class__.__name__}: {e}"
+    report.elapsed = time.perf_counter() - st
+    return report
+
+
+_SKIPPED_FILENAMES = {MANIFEST_FILENAME, DIR_JOURNAL_FILENAME}
+
+
+def _is_work_file(path: str) -> bool:
+    """
+    Test if a file is the part file or the checkpoint journal of an output
+    file. A file that just ends with the suffix, without a sibling output or
+    a valid journal, is a user file, it is verified.
+    """
+    for suffix in (files.PART_SUFFIX, JOURNAL_SUFFIX):
+        if path.endswith(suffix):
+            output_path = path[: -len(suffix)]
+            if os.path.exists(output_path):
+                return True
+            journal_path = output_path + JOURNAL_SUFFIX
+            return Journal.load(Path(journal_path)) is not None
+    return False
+
+
+def _verify_file_in_worker(path: str) -> FileReport:
+    return verify_file(dirs._worker_cipher, path)
+
+
+def verify_dir(
+    cipher: "BaseCipher",
+    path: str,
+    workers: T.Optional[int] = None,
+    use_process: bool = True,
+) -> DirReport:
+    """
+    Verify all the files in an encrypted directory, the files are verified
+    in parallel, largest first. The incremental manifest, the directory
+    journal, and the checkpoint journals and part files of the output files
+    are skipped.
+
+    :param workers: number of workers, default is the number of CPU cores
+    :param use_process: if True, use process pool, otherwise use thread pool
+    """
+    path = os.path.abspath(str(path))
+    st = time.perf_counter()
+    tasks = list()
+    for current_dir, _, file_list in os.walk(path):
+        for basename in file_list:
+            p = os.path.join(current_dir, basename)
+            if basename in _SKIPPED_FILENAMES or _is_work_file(p):
+                continue
+            tasks.append((os.path.getsize(p), p))
+    tasks.sort(reverse=True)
+    paths = [p for _, p in tasks]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(paths) <= 1:
+        reports = [verify_file(cipher, p) for p in paths]
+    else:
+        if use_process:
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=dirs._init_worker,
+                initargs=(cipher.__class__, cipher.to_key_material()),
+            )
+            submit = lambda p: executor.submit(_verify_file_in_worker, p)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            submit = lambda p: executor.submit(verify_file, cipher, p)
+        with executor:
+            futures = dirs.submit_bounded(submit, paths, max_in_flight=workers * 4)
+            reports = [future.result() for future in futures]
+        # keep the largest first order
+        order = {p: i for i, p in enumerate(paths)}
+        reports.sort(key=lambda report: order[report.path])
+    return DirReport(
+        path=path,
+        reports=reports,
+        elapsed=time.perf_counter() - st,
+    )